@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from datetime    import date
+import pandas    as pd
+from hierarquia  import NIVEIS
+
+# Cálculos do dashboard, sem Streamlit: recebem um filtro e devolvem DataFrames prontos para os
+# gráficos, então podem ser medidos, postos em cache por filtro e usados em relatórios em lote.
+# Os mesmos resultados saem de dois backends: BackendPandas calcula sobre as arrecadações já
+# carregadas e BackendAPI pede as agregações prontas à API (/aggregate/ e /timeseries/)
+
+COLUNAS = ['id', 'valor', 'data', 'secao', 'divisao', 'grupo', 'classe', 'subclasse', 'setor', 'comercio', 'atualizado_em']
+
+# Códigos e descrições se repetem em milhões de linhas: como category cada valor distinto é
+# guardado uma vez e as linhas têm só um código inteiro, o que também acelera groupby e isin
+TIPOS = {
+    'id': 'int64',
+    'valor': 'float64',
+    'secao': 'category',
+    'divisao': 'category',
+    'grupo': 'category',
+    'classe': 'category',
+    'subclasse': 'category',
+    'setor': 'category',
+    'comercio': 'category',
+}
+
+# Frequências de /arrecadacao/timeseries/; cada período é identificado pelo seu primeiro dia
+# (semanas começam na segunda-feira, como no TruncWeek do banco)
+FREQUENCIAS = ['D', 'W', 'M', 'Q', 'Y']
+OUTROS = 'Outros'
+
+# Converte as colunas de texto vindas do JSON para os tipos compactos de TIPOS
+def compacta(dados):
+    dados['valor'] = pd.to_numeric(dados['valor'], errors='coerce')
+    dados = dados.dropna(subset=['valor'])
+    dados = dados.assign(
+        data=pd.to_datetime(dados['data'], format='%Y-%m-%d'),
+        atualizado_em=pd.to_datetime(dados['atualizado_em'], format='ISO8601', utc=True),
+        comercio=dados['comercio'].fillna('Desconhecido'),
+    )
+    return dados.astype(TIPOS).reset_index(drop=True)
+
+# Memória ocupada pelo DataFrame, em bytes, contando o conteúdo das strings
+def uso_memoria(dados):
+    return int(dados.memory_usage(deep=True).sum())
+
+# Seleção feita no dashboard. Imutável e comparável, serve de chave para o cache dos resultados
+@dataclass(frozen=True)
+class Filtro:
+    inicio: date
+    fim: date
+    comercios: tuple = ()
+    nivel: str = None   # Nível CNAE mais específico escolhido no drill-down
+    codigo: str = None
+
+    def params(self):
+        # Mesmo filtro nos parâmetros de /api/v1/arrecadacao/
+        params = {'data__gte': self.inicio.isoformat(), 'data__lte': self.fim.isoformat()}
+        if self.comercios:
+            params['comercio__in'] = ','.join(self.comercios)
+        if self.nivel is not None:
+            params['subclasse__codigo' if self.nivel == 'subclasse' else self.nivel] = self.codigo
+        return params
+
+# Linhas de `dados` dentro do filtro. Com o índice da hierarquia montado sobre o mesmo DataFrame,
+# o nível CNAE é resolvido pelas posições já agrupadas em vez de comparar a coluna inteira
+def filtra(dados, filtro, indice=None):
+    if filtro.nivel is not None:
+        dados = dados.iloc[indice.linhas(filtro.nivel, filtro.codigo)] if indice is not None else dados[dados[filtro.nivel] == filtro.codigo]
+    mascara = dados['data'].between(pd.Timestamp(filtro.inicio), pd.Timestamp(filtro.fim))
+    if filtro.comercios:
+        mascara &= dados['comercio'].isin(filtro.comercios)
+    return dados if mascara.all() else dados[mascara]
+
+def receita_comercio(dados):
+    receita = dados.groupby('comercio', observed=True)['valor'].sum().sort_values(ascending=False).reset_index()
+    receita['comercio'] = receita['comercio'].astype(object)
+    return receita
+
+# Uma linha por período (e por série), nas mesmas colunas de /arrecadacao/timeseries/. Com top_n,
+# as séries fora das top_n de maior valor no período todo são somadas na série 'Outros'
+def serie(dados, freq='M', serie=None, top_n=None):
+    chaves = [dados['data'].dt.to_period(freq).dt.start_time.rename('periodo')]
+    if serie:
+        chaves.append(dados[serie].astype(object))
+    resultado = dados.groupby(chaves, observed=True)['valor'].agg(valor='sum', quantidade='count').reset_index()
+    if serie and top_n:
+        totais = resultado.groupby(serie)['valor'].sum()
+        principais = totais.sort_values(ascending=False, kind='stable').index[:top_n]
+        if len(principais) < len(totais):
+            resultado[serie] = resultado[serie].where(resultado[serie].isin(principais), OUTROS)
+            resultado = resultado.groupby(['periodo', serie], sort=False)[['valor', 'quantidade']].sum().reset_index()
+            resultado = resultado.sort_values(['periodo', serie], key=lambda coluna: coluna == OUTROS if coluna.name == serie else coluna, kind='stable')
+    return resultado.reset_index(drop=True)
+
+def receita_mensal(receita):
+    # Série mensal com ano e nome do mês, a partir de serie(freq='M')
+    receita = receita.rename(columns={'periodo': 'data'})
+    receita['Ano'] = receita['data'].dt.year
+    receita['Mês'] = receita['data'].dt.month_name()
+    return receita
+
+def metricas(valor, quantidade, mensal):
+    return {
+        'total': float(valor),
+        'media': float(valor) / quantidade if quantidade else float('nan'),
+        'quantidade': int(quantidade),
+        'maior_mensal': float(mensal['valor'].max()) if len(mensal) else float('nan'),
+    }
+
+class BackendPandas:
+    # Calcula sobre o DataFrame de arrecadações (colunas de COLUNAS, tipado por compacta)
+    def __init__(self, dados, indice=None):
+        self.dados = dados
+        self.indice = indice
+
+    def linhas(self, filtro):
+        return filtra(self.dados, filtro, self.indice)
+
+    def receita_comercio(self, filtro):
+        return receita_comercio(self.linhas(filtro))
+
+    def serie(self, filtro, freq='M', serie_por=None, top_n=None):
+        return serie(self.linhas(filtro), freq, serie_por, top_n)
+
+    def receita_mensal(self, filtro):
+        return receita_mensal(self.serie(filtro, 'M'))
+
+    def metricas(self, filtro):
+        linhas = self.linhas(filtro)
+        return metricas(linhas['valor'].sum(), len(linhas), serie(linhas, 'M'))
+
+class BackendAPI:
+    # Agregações feitas pela API: o volume transferido depende do número de grupos e períodos,
+    # não do número de arrecadações. `busca(caminho, params)` devolve o JSON (ex.: cliente.busca)
+    def __init__(self, busca):
+        self.busca = busca
+
+    def receita_comercio(self, filtro):
+        receita = pd.DataFrame.from_records(self.busca('arrecadacao/aggregate/', {**filtro.params(), 'group_by': 'comercio'}), columns=['comercio', 'valor', 'quantidade'])
+        receita['valor'] = receita['valor'].astype('float64')
+        return receita[['comercio', 'valor']].sort_values('valor', ascending=False, kind='stable').reset_index(drop=True)
+
+    def serie(self, filtro, freq='M', serie_por=None, top_n=None):
+        params = {**filtro.params(), 'freq': freq}
+        if serie_por:
+            params['series'] = serie_por
+        if top_n:
+            params['top_n'] = top_n
+        colunas = ['periodo', serie_por, 'valor', 'quantidade'] if serie_por else ['periodo', 'valor', 'quantidade']
+        resultado = pd.DataFrame.from_records(self.busca('arrecadacao/timeseries/', params), columns=colunas)
+        resultado['periodo'] = pd.to_datetime(resultado['periodo'], format='%Y-%m-%d')
+        resultado['valor'] = resultado['valor'].astype('float64')
+        resultado['quantidade'] = resultado['quantidade'].astype('int64')
+        return resultado
+
+    def receita_mensal(self, filtro):
+        return receita_mensal(self.serie(filtro, 'M'))
+
+    def metricas(self, filtro):
+        totais = self.busca('arrecadacao/aggregate/', filtro.params())
+        valor, quantidade = (float(totais[0]['valor'] or 0), totais[0]['quantidade']) if totais else (0.0, 0)
+        return metricas(valor, quantidade, self.serie(filtro, 'M'))
+
+# Hierarquia do drill-down: o nível mais específico selecionado (ou None) e seu código
+def nivel_ativo(selecionados):
+    ativo = (None, None)
+    for nivel in NIVEIS:
+        if selecionados.get(nivel, 'Todas') != 'Todas':
+            ativo = (nivel, selecionados[nivel])
+    return ativo
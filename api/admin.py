@@ -9,3 +9,4 @@ admin.site.register(models.Subclasse)
 admin.site.register(models.Setor)
 admin.site.register(models.Comercio)
 admin.site.register(models.Arrecadacao)
+admin.site.register(models.ArrecadacaoMensal)
@@ -0,0 +1,225 @@
+from concurrent.futures         import ThreadPoolExecutor
+from datetime                   import timedelta
+from dateutil.relativedelta     import relativedelta
+from django.conf                import settings
+from django.db                  import connections
+from django.db.models           import Count, Max, Min, Sum
+from django.utils.dateparse     import parse_date
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from rest_framework.exceptions  import ValidationError
+from .                          import filters
+from .                          import models
+
+# Dimensões aceitas em ?group_by= e a expressão correspondente no banco
+DIMENSOES = {
+    **models.HIERARQUIA,
+    'subclasse': 'subclasse__codigo',
+    'setor': 'setor__descricao',
+    'comercio': 'comercio__descricao',
+    'data': 'data',
+    'week': TruncWeek('data'),
+    'month': TruncMonth('data'),
+    'quarter': TruncQuarter('data'),
+    'year': TruncYear('data'),
+}
+
+# Parâmetros das actions de agregação, que não são filtros
+PARAMETROS = {'group_by', 'format', 'freq', 'series', 'top_n', 'numeric'}
+
+def parse_group_by(valor):
+    dimensoes = [dimensao.strip() for dimensao in (valor or '').split(',') if dimensao.strip()]
+    invalidas = [dimensao for dimensao in dimensoes if dimensao not in DIMENSOES]
+    if invalidas:
+        raise ValidationError({'group_by': f"Dimensões inválidas: {', '.join(invalidas)}. Opções: {', '.join(DIMENSOES)}."})
+    return list(dict.fromkeys(dimensoes))
+
+# Equivalentes em ArrecadacaoMensal, que já guarda somas e contagens por mês
+DIMENSOES_MENSAIS = {**DIMENSOES, 'month': 'mes', 'quarter': TruncQuarter('mes'), 'year': TruncYear('mes')}
+del DIMENSOES_MENSAIS['data'], DIMENSOES_MENSAIS['week']
+
+def queryset_mensal(params, dimensoes):
+    # Usa ArrecadacaoMensal apenas quando o resultado é idêntico ao da tabela base:
+    # sem agrupamento por dia, só filtros suportados, períodos fechados em meses
+    # inteiros e nenhum mês do período pendente de atualização
+    if not settings.ROLLUP_MENSAL or not set(dimensoes) <= set(DIMENSOES_MENSAIS):
+        return None
+    if not set(params) - PARAMETROS <= set(filters.ArrecadacaoMensalFilter.base_filters):
+        return None
+
+    filterset = filters.ArrecadacaoMensalFilter(params, queryset=models.ArrecadacaoMensal.objects.all())
+    if not filterset.is_valid():
+        return None
+
+    inicios = [filterset.form.cleaned_data[campo] for campo in ('start', 'data__gte') if filterset.form.cleaned_data.get(campo)]
+    fins = [filterset.form.cleaned_data[campo] for campo in ('end', 'data__lte') if filterset.form.cleaned_data.get(campo)]
+    if any(inicio.day != 1 for inicio in inicios) or any((fim + timedelta(days=1)).day != 1 for fim in fins):
+        return None
+
+    pendentes = models.MesPendente.objects.all()
+    if inicios:
+        pendentes = pendentes.filter(mes__gte=max(inicios))
+    if fins:
+        pendentes = pendentes.filter(mes__lte=min(fins))
+    if pendentes.exists():
+        return None
+
+    return filterset.qs
+
+def consulta(queryset, dimensoes):
+    # Monta a consulta agregada e devolve também a conversão de cada linha do banco
+    if queryset.model is models.ArrecadacaoMensal:
+        expressoes_por_dimensao, contagem = DIMENSOES_MENSAIS, Sum('quantidade')
+    else:
+        expressoes_por_dimensao, contagem = DIMENSOES, Count('id')
+
+    # Caminhos de relação não podem ser anotados com o nome do próprio campo
+    # (ex.: 'comercio'), então são agrupados pelo caminho e renomeados depois
+    caminhos = {dimensao: expressoes_por_dimensao[dimensao] for dimensao in dimensoes if isinstance(expressoes_por_dimensao[dimensao], str)}
+    expressoes = {dimensao: expressoes_por_dimensao[dimensao] for dimensao in dimensoes if dimensao not in caminhos}
+    ordem = [caminhos.get(dimensao, dimensao) for dimensao in dimensoes]
+
+    # Somas em centavos inteiros até a resposta (AgregacaoSerializer); alguns bancos devolvem
+    # a soma de bigint como numeric, por isso o int()
+    soma = Sum(models.centavos('valor'))
+    centavos = lambda valor: None if valor is None else int(valor)
+
+    # Sem dimensões, a consulta é o total geral, feito com aggregate()/aaggregate()
+    if not dimensoes:
+        return {'soma': soma, 'contagem': contagem}, lambda total: {'valor': centavos(total['soma']), 'quantidade': total['contagem'] or 0}
+
+    linhas = (
+        queryset.order_by()
+                .values(*caminhos.values(), **expressoes)
+                .annotate(soma=soma, contagem=contagem)
+                .order_by(*ordem)
+    )
+    return linhas, lambda linha: {
+        **{dimensao: linha[caminhos.get(dimensao, dimensao)] for dimensao in dimensoes},
+        'valor': centavos(linha['soma']),
+        'quantidade': linha['contagem'],
+    }
+
+def agrega_sequencial(queryset, dimensoes):
+    linhas, converte = consulta(queryset, dimensoes)
+    if not dimensoes:
+        return [converte(queryset.aggregate(**linhas))]
+    return [converte(linha) for linha in linhas]
+
+def periodo(params):
+    # Limites de data pedidos nos filtros (start/end ou data__gte/data__lte), se houver;
+    # datas inválidas já foram recusadas pelo filterset e aqui são só ignoradas
+    def datas(campos):
+        for campo in campos:
+            try:
+                valor = parse_date(params.get(campo) or '')
+            except ValueError:
+                valor = None
+            if valor is not None:
+                yield valor
+    return max(datas(('start', 'data__gte')), default=None), min(datas(('end', 'data__lte')), default=None)
+
+def particoes(queryset, quantidade, inicio=None, fim=None):
+    # Divide o período em até `quantidade` faixas contíguas de meses inteiros; períodos curtos não
+    # são divididos. Os limites vêm dos filtros ou do menor e maior valor da tabela toda
+    campo = 'mes' if queryset.model is models.ArrecadacaoMensal else 'data'
+    limites = queryset.model._base_manager.using(queryset.db).aggregate(inicio=Min(campo), fim=Max(campo))
+    inicio = max(filter(None, [inicio, limites['inicio']]), default=None)
+    fim = min(filter(None, [fim, limites['fim']]), default=None)
+    if inicio is None or fim is None or inicio > fim:
+        return campo, []
+
+    meses = (fim.year - inicio.year) * 12 + fim.month - inicio.month + 1
+    if meses < settings.AGREGACAO_MESES_MINIMOS:
+        return campo, []
+    quantidade = min(quantidade, meses)
+    primeiro = inicio.replace(day=1)
+    faixas = []
+    for indice in range(quantidade):
+        de = primeiro + relativedelta(months=meses * indice // quantidade)
+        ate = primeiro + relativedelta(months=meses * (indice + 1) // quantidade, days=-1)
+        faixas.append((max(de, inicio), min(ate, fim)))
+    return campo, faixas
+
+def agrega_particao(queryset, dimensoes, campo, de, ate):
+    # Roda numa thread do pool, com a conexão própria da thread, fechada ao final
+    try:
+        return agrega_sequencial(queryset.filter(**{f'{campo}__gte': de, f'{campo}__lte': ate}), dimensoes)
+    finally:
+        connections.close_all()
+
+def combina(parciais, dimensoes):
+    # Soma valor e quantidade das linhas com as mesmas dimensões vindas de partições diferentes
+    # (ex.: a mesma semana ou ano dividido entre duas faixas de meses)
+    linhas = {}
+    for linha in (linha for parcial in parciais for linha in parcial):
+        chave = tuple(linha[dimensao] for dimensao in dimensoes)
+        if chave not in linhas:
+            linhas[chave] = dict(linha)
+            continue
+        combinada = linhas[chave]
+        combinada['valor'] = linha['valor'] if combinada['valor'] is None else combinada['valor'] + (linha['valor'] or 0)
+        combinada['quantidade'] += linha['quantidade']
+    # Mesma ordem do ORDER BY das dimensões, com nulos primeiro
+    return sorted(linhas.values(), key=lambda linha: [(linha[dimensao] is not None, linha[dimensao]) for dimensao in dimensoes])
+
+def em_memoria(conexao):
+    # SQLite em memória (o banco dos testes) também agrega em sequência: as conexões dividem um
+    # único cache e abrir uma nova enquanto outra thread roda uma função SQL do Django (ex.: a de
+    # TruncMonth) trava as duas
+    return conexao.vendor == 'sqlite' and conexao.is_in_memory_db()
+
+def agrega(queryset, dimensoes, inicio=None, fim=None, workers=None):
+    # Com AGREGACAO_WORKERS > 1 o período é dividido em faixas de meses agregadas em paralelo,
+    # cada uma numa conexão própria, e os resultados parciais são somados. Dentro de uma
+    # transação as outras conexões não veriam as alterações pendentes, então roda em sequência
+    workers = settings.AGREGACAO_WORKERS if workers is None else workers
+    conexao = connections[queryset.db]
+    if workers <= 1 or conexao.in_atomic_block or em_memoria(conexao):
+        return agrega_sequencial(queryset, dimensoes)
+    campo, faixas = particoes(queryset, workers * settings.AGREGACAO_PARTICOES_POR_WORKER, inicio, fim)
+    if len(faixas) < 2:
+        return agrega_sequencial(queryset, dimensoes)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parciais = list(executor.map(lambda faixa: agrega_particao(queryset, dimensoes, campo, *faixa), faixas))
+    return combina(parciais, dimensoes)
+
+async def aagrega(queryset, dimensoes):
+    # Mesmo resultado de agrega() pelo ORM assíncrono
+    linhas, converte = consulta(queryset, dimensoes)
+    if not dimensoes:
+        return [converte(await queryset.aaggregate(**linhas))]
+    return [converte(linha) async for linha in linhas]
+
+# ?freq= das séries temporais e a dimensão de período correspondente
+FREQUENCIAS = {'D': 'data', 'W': 'week', 'M': 'month', 'Q': 'quarter', 'Y': 'year'}
+# Dimensões que podem separar as séries (?series=)
+SERIES = [dimensao for dimensao in DIMENSOES if dimensao not in FREQUENCIAS.values()]
+OUTROS = 'Outros'
+
+def serie_temporal(queryset, freq, serie=None, top_n=None, inicio=None, fim=None):
+    # Uma linha por período (e por série), já agregada no banco. Com top_n, as séries
+    # fora das top_n de maior valor no período todo são somadas numa única série 'Outros'
+    periodo = FREQUENCIAS[freq]
+    linhas = agrega(queryset, [periodo, serie] if serie else [periodo], inicio, fim)
+    linhas = [{'periodo': linha.pop(periodo), **linha} for linha in linhas]
+    if not serie or not top_n:
+        return linhas
+
+    totais = {}
+    for linha in linhas:
+        totais[linha[serie]] = totais.get(linha[serie], 0) + linha['valor']
+    principais = set(sorted(totais, key=totais.get, reverse=True)[:top_n])
+    if len(principais) == len(totais):
+        return linhas
+
+    resultado, outros = [], {}
+    for linha in linhas:
+        if linha[serie] in principais:
+            resultado.append(linha)
+            continue
+        agrupada = outros.setdefault(linha['periodo'], {'periodo': linha['periodo'], serie: OUTROS, 'valor': 0, 'quantidade': 0})
+        agrupada['valor'] += linha['valor']
+        agrupada['quantidade'] += linha['quantidade']
+    # sorted é estável: dentro de cada período as séries mantêm a ordem do banco e 'Outros' fica por último
+    return sorted(resultado + list(outros.values()), key=lambda linha: (linha['periodo'], linha[serie] == OUTROS))
@@ -1,5 +1,17 @@
-from django.apps import AppConfig
+from django.apps                import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals   import post_delete, post_save
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import cache, instrumentacao, models, sqlite
+        connection_created.connect(sqlite.aplica_pragmas)
+        connection_created.connect(instrumentacao.instala)
+        for model in (models.Secao, models.Divisao, models.Grupo, models.Classe, models.Subclasse, models.Setor, models.Comercio):
+            post_save.connect(cache.modelo_alterado, sender=model)
+            post_delete.connect(cache.modelo_alterado, sender=model)
+        for model in models.CAMINHOS_CNAE:
+            post_save.connect(models.propaga_hierarquia, sender=model)
@@ -0,0 +1,75 @@
+from asgiref.sync              import sync_to_async
+from django.conf               import settings
+from django.http               import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from .                         import models
+from .                         import serializers
+from .                         import filters
+from .                         import aggregations
+from .                         import export
+from .                         import renderers
+
+# Leitura de arrecadações por views assíncronas do Django, para servir sob ASGI (setup.asgi) sem
+# prender uma thread por requisição enquanto o banco responde. O DRF não tem views assíncronas,
+# então as respostas são montadas com os mesmos serializers e renderers das views síncronas.
+# Validar os filtros pode consultar o banco (ex.: ?subclasse=<id>), por isso roda em sync_to_async
+
+def resposta_json(dados, status=200):
+    return HttpResponse(renderers.JSONRenderer().render(dados), status=status, content_type='application/json')
+
+def filtra(params, queryset):
+    filterset = filters.ArrecadacaoFilter(params, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs
+
+async def lista(request):
+    # Mesmo JSON da listagem síncrona sem paginação, enviado em blocos conforme é lido do banco
+    try:
+        queryset = await sync_to_async(filtra)(request.GET, models.Arrecadacao.objects.all())
+    except ValidationError as erro:
+        return resposta_json(erro.detail, status=400)
+
+    async def gera(chunk_size=2_000):
+        renderer = renderers.JSONRenderer()
+        pendentes, primeiro = [], True
+        yield b'['
+        async for registro in serializers.ArrecadacaoLeituraSerializer(queryset, numerico=serializers.numerico(request.GET)).alinhas(chunk_size):
+            pendentes.append(registro)
+            if len(pendentes) == chunk_size:
+                yield (b'' if primeiro else b',') + renderer.render(pendentes)[1:-1]
+                pendentes, primeiro = [], False
+        if pendentes:
+            yield (b'' if primeiro else b',') + renderer.render(pendentes)[1:-1]
+        yield b']'
+
+    return StreamingHttpResponse(gera(), content_type='application/json')
+
+async def agrega(request):
+    try:
+        dimensoes = aggregations.parse_group_by(request.GET.get('group_by'))
+        queryset = await sync_to_async(aggregations.queryset_mensal)(request.GET, dimensoes)
+        if queryset is None:
+            queryset = await sync_to_async(filtra)(request.GET, models.Arrecadacao.objects.all())
+    except ValidationError as erro:
+        return resposta_json(erro.detail, status=400)
+    resultado = await aggregations.aagrega(queryset, dimensoes)
+    return resposta_json(serializers.AgregacaoSerializer(resultado, many=True, context={'numerico': serializers.numerico(request.GET)}).data)
+
+async def exporta(request):
+    # Formato por ?format=parquet|arrow|csv ou pelo cabeçalho Accept, como na view síncrona
+    formato = request.GET.get('format')
+    if formato is None:
+        aceitos = request.headers.get('Accept', '')
+        formato = next((nome for nome, (media_type, _) in export.FORMATOS.items() if media_type in aceitos), 'parquet')
+    if formato not in export.FORMATOS:
+        return resposta_json({'detail': f"Formato inválido: {formato}. Opções: {', '.join(export.FORMATOS)}."}, status=406)
+    try:
+        queryset = await sync_to_async(filtra)(request.GET, models.Arrecadacao.objects.order_by('id'))
+    except ValidationError as erro:
+        return resposta_json(erro.detail, status=400)
+
+    media_type, extensao = export.FORMATOS[formato]
+    resposta = StreamingHttpResponse(export.agera(queryset, formato, settings.EXPORT_CHUNK_SIZE), content_type=media_type)
+    resposta['Content-Disposition'] = f'attachment; filename="arrecadacao.{extensao}"'
+    return resposta
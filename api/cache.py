@@ -0,0 +1,94 @@
+import math
+import time
+from hashlib                    import md5
+from django.conf                import settings
+from django.core.cache          import cache
+from django.db.models           import F, Value
+from django.db.models.functions import Greatest
+from django.http                import HttpResponse, HttpResponseNotModified
+from django.utils.http          import http_date, parse_http_date_safe, quote_etag
+from .                          import models
+
+# Cada modelo tem uma versão (timestamp da última escrita) guardada no banco, em VersaoModelo,
+# e atualizada na mesma transação da escrita: alterações feitas por outro processo (um segundo
+# worker, load_arrecadacao, copy_database) mudam os validadores de imediato. As respostas em
+# cache são indexadas pelo ETag, então um cache por processo nunca devolve um corpo desatualizado
+
+def rotulo(model):
+    return model._meta.label_lower
+
+def versoes(*dependencias):
+    # Uma consulta só de leitura para todos os modelos. As linhas são criadas pela migração
+    # 0010_versoes_iniciais e pelas escritas; sem linha (ex.: tabela esvaziada) a versão é 0
+    guardadas = dict(models.VersaoModelo.objects.filter(modelo__in=[rotulo(model) for model in dependencias]).values_list('modelo', 'versao'))
+    return [guardadas.get(rotulo(model), 0.0) for model in dependencias]
+
+def incrementa_versao(*dependencias, using=None):
+    # Um único UPDATE por modelo: escritas concorrentes nunca deixam a versão voltar nem repetir
+    agora = time.time()
+    tabela = models.VersaoModelo.objects.using(using)
+    for model in dependencias:
+        alteradas = tabela.filter(modelo=rotulo(model))
+        if not alteradas.update(versao=Greatest(F('versao') + 1e-6, Value(agora))):
+            _, criada = tabela.get_or_create(modelo=rotulo(model), defaults={'versao': agora})
+            if not criada:
+                alteradas.update(versao=Greatest(F('versao') + 1e-6, Value(agora)))
+
+def modelo_alterado(sender, **kwargs):
+    # Conectado a post_save/post_delete das tabelas de referência em ApiConfig.ready();
+    # Arrecadacao incrementa a própria versão para não perder o delete em lote do Django
+    incrementa_versao(sender)
+
+class RespostaCacheadaMixin:
+    # Modelos cujo conteúdo aparece nas respostas do viewset; por padrão, o do queryset
+    dependencias = None
+
+    def get_dependencias(self):
+        return self.dependencias or [self.queryset.model]
+
+    def chave_requisicao(self, request):
+        # Query string normalizada: parâmetros e valores ordenados, vazios descartados. O host entra
+        # na chave porque a paginação devolve o link 'next' absoluto (build_absolute_uri)
+        parametros = sorted((chave, sorted(valor for valor in valores if valor)) for chave, valores in request.GET.lists())
+        parametros = [(chave, valores) for chave, valores in parametros if valores]
+        return repr((request.get_host(), request.path, parametros, request.META.get('HTTP_ACCEPT', '')))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.RESPOSTA_CACHE:
+            return super().dispatch(request, *args, **kwargs)
+
+        validadores = versoes(*self.get_dependencias())
+        etag = quote_etag(md5(repr((validadores, self.chave_requisicao(request))).encode()).hexdigest())
+        ultima_alteracao = max(validadores)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+        if (if_none_match and etag in (tag.strip() for tag in if_none_match.split(','))) or \
+           (not if_none_match and if_modified_since is not None and ultima_alteracao <= if_modified_since):
+            resposta = HttpResponseNotModified()
+        else:
+            chave = f'resposta:{etag}'
+            guardada = cache.get(chave)
+            if guardada is not None:
+                conteudo, content_type, cabecalhos = guardada
+                resposta = HttpResponse(conteudo, content_type=content_type)
+                for nome, valor in cabecalhos.items():
+                    resposta[nome] = valor
+            else:
+                resposta = super().dispatch(request, *args, **kwargs)
+                if resposta.status_code != 200:
+                    return resposta
+                if not resposta.streaming:
+                    resposta.render()
+                    # Uma escrita concluída durante a consulta deixaria o corpo novo sob o ETag antigo
+                    if len(resposta.content) <= settings.RESPOSTA_CACHE_MAX_BYTES and versoes(*self.get_dependencias()) == validadores:
+                        cabecalhos = {nome: valor for nome, valor in resposta.items() if nome in ('Content-Disposition', 'Vary', 'Allow')}
+                        cache.set(chave, (resposta.content, resposta['Content-Type'], cabecalhos), settings.RESPOSTA_CACHE_TTL)
+
+        resposta['ETag'] = etag
+        # Last-Modified tem resolução de segundos: vai arredondado para cima e só depois que o segundo
+        # da última escrita terminou, senão outra escrita nesse mesmo segundo, ainda não <= à data
+        # enviada, passaria por não modificada no If-Modified-Since (que compara a versão exata)
+        if math.ceil(ultima_alteracao) <= time.time():
+            resposta['Last-Modified'] = http_date(math.ceil(ultima_alteracao))
+        return resposta
@@ -0,0 +1,98 @@
+import io
+import pyarrow         as pa
+import pyarrow.csv     as pa_csv
+import pyarrow.parquet as pq
+from .                 import instrumentacao
+from .                 import serializers
+
+# Mesmas colunas da listagem, lidas pelos caminhos de ArrecadacaoLeituraSerializer
+TIPOS = {
+    'id': pa.int64(),
+    'valor': pa.decimal128(20, 2),
+    'data': pa.date32(),
+    'secao': pa.string(),
+    'divisao': pa.string(),
+    'grupo': pa.string(),
+    'classe': pa.string(),
+    'subclasse': pa.string(),
+    'setor': pa.string(),
+    'comercio': pa.string(),
+    'atualizado_em': pa.timestamp('us', tz='UTC'),
+}
+COLUNAS = {coluna: (caminho, TIPOS[coluna]) for coluna, caminho in serializers.ArrecadacaoLeituraSerializer.caminhos.items()}
+
+ESQUEMA = pa.schema([(coluna, tipo) for coluna, (_, tipo) in COLUNAS.items()])
+
+FORMATOS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'csv': ('text/csv', 'csv'),
+}
+
+def escritor(formato, destino, esquema):
+    if formato == 'parquet':
+        return pq.ParquetWriter(destino, esquema)
+    if formato == 'arrow':
+        return pa.ipc.new_stream(destino, esquema)
+    return pa_csv.CSVWriter(destino, esquema)
+
+def lote(linhas):
+    with instrumentacao.serializacao():
+        return pa.RecordBatch.from_arrays([pa.array(coluna, tipo) for coluna, tipo in zip(zip(*linhas), ESQUEMA.types)], schema=ESQUEMA)
+
+def consulta(queryset):
+    return queryset.values_list(*(caminho for caminho, _ in COLUNAS.values()))
+
+def lotes(queryset, chunk_size):
+    pendentes = []
+    for linha in consulta(queryset).iterator(chunk_size=chunk_size):
+        pendentes.append(linha)
+        if len(pendentes) == chunk_size:
+            yield lote(pendentes)
+            pendentes = []
+    if pendentes:
+        yield lote(pendentes)
+
+async def alotes(queryset, chunk_size):
+    pendentes = []
+    async for linha in consulta(queryset).aiterator(chunk_size=chunk_size):
+        pendentes.append(linha)
+        if len(pendentes) == chunk_size:
+            yield lote(pendentes)
+            pendentes = []
+    if pendentes:
+        yield lote(pendentes)
+
+def gera(queryset, formato, chunk_size=50_000):
+    # Cada lote é serializado e entregue assim que lido; a memória fica limitada a um lote
+    destino = io.BytesIO()
+    with escritor(formato, destino, ESQUEMA) as saida:
+        for dados in lotes(queryset, chunk_size):
+            with instrumentacao.serializacao():
+                saida.write_batch(dados)
+            yield destino.getvalue()
+            destino.seek(0)
+            destino.truncate()
+    yield destino.getvalue()
+
+async def agera(queryset, formato, chunk_size=50_000):
+    # Versão assíncrona de gera(), para StreamingHttpResponse sob ASGI
+    destino = io.BytesIO()
+    with escritor(formato, destino, ESQUEMA) as saida:
+        async for dados in alotes(queryset, chunk_size):
+            with instrumentacao.serializacao():
+                saida.write_batch(dados)
+            yield destino.getvalue()
+            destino.seek(0)
+            destino.truncate()
+    yield destino.getvalue()
+
+def serializa(linhas, formato):
+    # Usado pelos renderers para respostas comuns (ex.: mensagens de erro)
+    linhas = linhas if isinstance(linhas, list) else [linhas]
+    linhas = [{chave: '; '.join(map(str, valor)) if isinstance(valor, list) else str(valor) for chave, valor in linha.items()} for linha in linhas]
+    tabela = pa.Table.from_pylist(linhas)
+    destino = io.BytesIO()
+    with escritor(formato, destino, tabela.schema) as saida:
+        saida.write_table(tabela)
+    return destino.getvalue()
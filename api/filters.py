@@ -1,27 +1,40 @@
 import django_filters
 from . import models
 
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
 class SecaoFilter(django_filters.FilterSet):
+    codigo__in = CharInFilter(field_name='codigo', lookup_expr='in')
+
     class Meta:
         model = models.Secao
         fields = '__all__'
         
 class DivisaoFilter(django_filters.FilterSet):
+    codigo__in = CharInFilter(field_name='codigo', lookup_expr='in')
+
     class Meta:
         model = models.Divisao
         fields = '__all__'
         
 class GrupoFilter(django_filters.FilterSet):
+    codigo__in = CharInFilter(field_name='codigo', lookup_expr='in')
+
     class Meta:
         model = models.Grupo
         fields = '__all__'
         
 class ClasseFilter(django_filters.FilterSet):
+    codigo__in = CharInFilter(field_name='codigo', lookup_expr='in')
+
     class Meta:
         model = models.Classe
         fields = '__all__'
         
 class SubclasseFilter(django_filters.FilterSet):
+    codigo__in = CharInFilter(field_name='codigo', lookup_expr='in')
+
     class Meta:
         model = models.Subclasse
         fields = '__all__'
@@ -36,7 +49,53 @@ class ComercioFilter(django_filters.FilterSet):
         model = models.Comercio
         fields = '__all__'
         
-class ArrecadacaoFilter(django_filters.FilterSet):
+class CNAEFilter(django_filters.FilterSet):
+    # Filtros comuns a Arrecadacao e ArrecadacaoMensal
+    secao = django_filters.CharFilter(field_name=models.HIERARQUIA['secao'])
+    secao__in = CharInFilter(field_name=models.HIERARQUIA['secao'], lookup_expr='in')
+    divisao = django_filters.CharFilter(field_name=models.HIERARQUIA['divisao'])
+    divisao__in = CharInFilter(field_name=models.HIERARQUIA['divisao'], lookup_expr='in')
+    grupo = django_filters.CharFilter(field_name=models.HIERARQUIA['grupo'])
+    grupo__in = CharInFilter(field_name=models.HIERARQUIA['grupo'], lookup_expr='in')
+    classe = django_filters.CharFilter(field_name=models.HIERARQUIA['classe'])
+    classe__in = CharInFilter(field_name=models.HIERARQUIA['classe'], lookup_expr='in')
+
+    # Os códigos CNAE são aninhados (47 > 471 > 47113 > 4711301), então um
+    # prefixo do código da subclasse seleciona qualquer nível da hierarquia
+    cnae = django_filters.CharFilter(field_name='subclasse__codigo', lookup_expr='startswith')
+
+    setor__in = CharInFilter(field_name='setor__descricao', lookup_expr='in')
+    comercio__in = CharInFilter(field_name='comercio__descricao', lookup_expr='in')
+
+class ArrecadacaoFilter(CNAEFilter):
+    start = django_filters.DateFilter(field_name='data', lookup_expr='gte')
+    end = django_filters.DateFilter(field_name='data', lookup_expr='lte')
+    # Registros criados ou alterados a partir do instante informado (ISO 8601), para sincronização incremental
+    since = django_filters.IsoDateTimeFilter(field_name='atualizado_em', lookup_expr='gte')
+
     class Meta:
         model = models.Arrecadacao
-        fields = '__all__'
+        fields = {
+            'valor': ['exact', 'gte', 'lte'],
+            'data': ['exact', 'gte', 'lte'],
+            'subclasse': ['exact'],
+            'subclasse__codigo': ['exact', 'in', 'startswith'],
+            'setor': ['exact'],
+            'comercio': ['exact'],
+        }
+
+class ArrecadacaoMensalFilter(CNAEFilter):
+    # Recebe os mesmos parâmetros de data de ArrecadacaoFilter, aplicados ao mês
+    start = django_filters.DateFilter(field_name='mes', lookup_expr='gte')
+    end = django_filters.DateFilter(field_name='mes', lookup_expr='lte')
+    data__gte = django_filters.DateFilter(field_name='mes', lookup_expr='gte')
+    data__lte = django_filters.DateFilter(field_name='mes', lookup_expr='lte')
+
+    class Meta:
+        model = models.ArrecadacaoMensal
+        fields = {
+            'subclasse': ['exact'],
+            'subclasse__codigo': ['exact', 'in', 'startswith'],
+            'setor': ['exact'],
+            'comercio': ['exact'],
+        }
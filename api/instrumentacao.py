@@ -0,0 +1,297 @@
+import json
+import logging
+import random
+import threading
+from bisect          import bisect_left
+from contextlib      import contextmanager
+from contextvars     import ContextVar
+from math            import inf
+from time            import perf_counter
+from asgiref.sync    import iscoroutinefunction, markcoroutinefunction
+from django.conf     import settings
+from django.http     import HttpResponse
+
+# Métricas por endpoint (view_name da rota, ex.: arrecadacao-list) guardadas em histogramas
+# no próprio processo: cada worker expõe as suas em /api/v1/metrics/ (texto do Prometheus) e
+# /api/v1/metrics.json. Só as requisições sorteadas por METRICAS_AMOSTRAGEM são medidas; nas
+# demais o middleware apenas repassa a requisição
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores dos buckets de cada métrica, como nos histogramas do Prometheus
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICAS = {
+    'requisicao_segundos': ('Duração da requisição.', SEGUNDOS),
+    'sql_consultas': ('Consultas SQL por requisição.', (0, 1, 2, 5, 10, 25, 50, 100, 250)),
+    'sql_segundos': ('Tempo em consultas SQL por requisição, incluindo a leitura das linhas.', SEGUNDOS),
+    'serializacao_segundos': ('Tempo serializando as linhas e renderizando a resposta (JSON, Parquet, Arrow ou CSV).', SEGUNDOS),
+    'resposta_bytes': ('Tamanho da resposta, somando as partes das respostas em streaming.', (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)),
+}
+
+# Consultas guardadas por requisição para o log de requisições lentas
+SQL_MAXIMO = 100
+
+class Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0
+        self.maximo = 0
+
+    def observa(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.maximo = max(self.maximo, valor)
+
+    @property
+    def total(self):
+        return sum(self.contagens)
+
+    def quantil(self, q):
+        # Estimado pelo limite do bucket onde a contagem acumulada alcança q; acima do último limite, o máximo
+        alvo, acumulado = q * self.total, 0
+        for limite, contagem in zip((*self.limites, inf), self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+class Registro:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limpa()
+
+    def limpa(self):
+        with self.lock:
+            self.histogramas = {}  # {(metrica, endpoint): Histograma}
+
+    def observa(self, endpoint, valores):
+        with self.lock:
+            for metrica, valor in valores.items():
+                chave = (metrica, endpoint)
+                if chave not in self.histogramas:
+                    self.histogramas[chave] = Histograma(METRICAS[metrica][1])
+                self.histogramas[chave].observa(valor)
+
+    def prometheus(self):
+        linhas = []
+        with self.lock:
+            for metrica, (descricao, _) in METRICAS.items():
+                linhas += [f'# HELP api_{metrica} {descricao}', f'# TYPE api_{metrica} histogram']
+                for (nome, endpoint), histograma in sorted(self.histogramas.items()):
+                    if nome != metrica:
+                        continue
+                    acumulado = 0
+                    for limite, contagem in zip((*histograma.limites, inf), histograma.contagens):
+                        acumulado += contagem
+                        le = '+Inf' if limite == inf else f'{limite:g}'
+                        linhas.append(f'api_{metrica}_bucket{{endpoint="{endpoint}",le="{le}"}} {acumulado}')
+                    linhas.append(f'api_{metrica}_sum{{endpoint="{endpoint}"}} {histograma.soma:g}')
+                    linhas.append(f'api_{metrica}_count{{endpoint="{endpoint}"}} {acumulado}')
+        return '\n'.join(linhas) + '\n'
+
+    def resumo(self):
+        resumo = {}
+        with self.lock:
+            for (metrica, endpoint), histograma in sorted(self.histogramas.items(), key=lambda item: (item[0][1], item[0][0])):
+                resumo.setdefault(endpoint, {})[metrica] = {
+                    'contagem': histograma.total,
+                    'soma': histograma.soma,
+                    'media': histograma.soma / histograma.total,
+                    'p50': histograma.quantil(0.5),
+                    'p95': histograma.quantil(0.95),
+                    'p99': histograma.quantil(0.99),
+                    'maximo': histograma.maximo,
+                }
+        return resumo
+
+registro = Registro()
+
+class Medicao:
+    # Acumula o que acontece durante uma requisição amostrada: consultas (registra_consulta) e
+    # tempo de serialização (serializacao), encontrando a medição pelo ContextVar
+    atual = ContextVar('medicao', default=None)
+
+    def __init__(self):
+        self.inicio = perf_counter()
+        self.sql_consultas = 0
+        self.sql_segundos = 0
+        self.serializacao_segundos = 0
+        self.resposta_bytes = 0
+        self.sql = []
+
+    def executa(self, execute, sql, params, many, context):
+        inicio = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = perf_counter() - inicio
+            self.sql_consultas += 1
+            self.sql_segundos += duracao
+            if len(self.sql) < SQL_MAXIMO:
+                self.sql.append((duracao, sql))
+            cronometra_leitura(context['cursor'])
+
+    @contextmanager
+    def ativa(self):
+        token = self.atual.set(self)
+        try:
+            yield self
+        finally:
+            self.atual.reset(token)
+
+    def conclui(self, request, resposta):
+        duracao = perf_counter() - self.inicio
+        endpoint = request.resolver_match.view_name if request.resolver_match else 'nao_resolvido'
+        if endpoint in ('metricas', 'metricas-json'):
+            return
+
+        valores = {
+            'requisicao_segundos': duracao,
+            'sql_consultas': self.sql_consultas,
+            'sql_segundos': self.sql_segundos,
+            'serializacao_segundos': self.serializacao_segundos,
+            'resposta_bytes': self.resposta_bytes if resposta.streaming else len(resposta.content),
+        }
+        registro.observa(endpoint, valores)
+
+        if duracao >= settings.METRICAS_LENTA_SEGUNDOS:
+            consultas = '\n'.join(f'  {tempo * 1000:9.1f} ms  {sql}' for tempo, sql in sorted(self.sql, key=lambda item: -item[0])[:10])
+            logger.warning(
+                'Requisição lenta: %s %s (%s) em %.3fs, %d consultas SQL em %.3fs, renderização em %.3fs\n%s',
+                request.method, request.get_full_path(), endpoint, duracao, self.sql_consultas,
+                self.sql_segundos, self.serializacao_segundos, consultas,
+            )
+
+def leitura_cronometrada(fetch):
+    # Buscar as linhas conta como tempo de SQL: o execute() de uma consulta grande retorna assim
+    # que a primeira linha fica pronta e o resto é lido nas chamadas a fetch*
+    def cronometrada(*args, **kwargs):
+        medicao = Medicao.atual.get()
+        if medicao is None:
+            return fetch(*args, **kwargs)
+        inicio = perf_counter()
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            medicao.sql_segundos += perf_counter() - inicio
+    return cronometrada
+
+def cronometra_leitura(cursor):
+    # cursor é o CursorWrapper do Django, que repassa fetch* ao cursor do driver por __getattr__
+    for nome in ('fetchone', 'fetchmany', 'fetchall'):
+        if nome not in vars(cursor):
+            setattr(cursor, nome, leitura_cronometrada(getattr(cursor, nome)))
+
+@contextmanager
+def serializacao():
+    # Soma à medição ativa o tempo do bloco, descontadas as consultas e leituras feitas dentro dele
+    # (ex.: serializers que percorrem o queryset enquanto montam as linhas)
+    medicao = Medicao.atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio, sql = perf_counter(), medicao.sql_segundos
+    try:
+        yield
+    finally:
+        medicao.serializacao_segundos += perf_counter() - inicio - (medicao.sql_segundos - sql)
+
+def registra_consulta(execute, sql, params, many, context):
+    medicao = Medicao.atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    return medicao.executa(execute, sql, params, many, context)
+
+def instala(sender, connection, **kwargs):
+    # Conectado a connection_created em ApiConfig.ready(). As conexões são por thread e, sob
+    # ASGI, as consultas rodam na thread de sync_to_async, que recebe uma cópia do contexto da
+    # requisição; por isso o wrapper é fixo na conexão e procura a medição no ContextVar
+    if registra_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, registra_consulta)
+
+def amostrada():
+    return settings.METRICAS and random.random() < settings.METRICAS_AMOSTRAGEM
+
+class InstrumentacaoMiddleware:
+    # Aceita views síncronas e assíncronas sem trocar de thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if not amostrada():
+            return self.get_response(request)
+        with Medicao().ativa() as medicao:
+            resposta = self.get_response(request)
+        return self.conclui(medicao, request, resposta)
+
+    async def __acall__(self, request):
+        if not amostrada():
+            return await self.get_response(request)
+        with Medicao().ativa() as medicao:
+            resposta = await self.get_response(request)
+        return self.conclui(medicao, request, resposta)
+
+    def conclui(self, medicao, request, resposta):
+        # Em streaming as consultas e a renderização acontecem enquanto o corpo é enviado: a
+        # medição fica ativa durante cada parte e só é registrada quando o corpo termina
+        if not resposta.streaming:
+            medicao.conclui(request, resposta)
+        elif resposta.is_async:
+            resposta.streaming_content = self.acompanha_async(medicao, request, resposta, resposta.streaming_content)
+        else:
+            resposta.streaming_content = self.acompanha(medicao, request, resposta, resposta.streaming_content)
+        return resposta
+
+    def acompanha(self, medicao, request, resposta, partes):
+        partes = iter(partes)
+        try:
+            while True:
+                with medicao.ativa():
+                    parte = next(partes, None)
+                if parte is None:
+                    break
+                medicao.resposta_bytes += len(parte)
+                yield parte
+        finally:
+            medicao.conclui(request, resposta)
+
+    async def acompanha_async(self, medicao, request, resposta, partes):
+        partes = aiter(partes)
+        try:
+            while True:
+                with medicao.ativa():
+                    parte = await anext(partes, None)
+                if parte is None:
+                    break
+                medicao.resposta_bytes += len(parte)
+                yield parte
+        finally:
+            medicao.conclui(request, resposta)
+
+class RendererInstrumentadoMixin:
+    # Gancho do DRF: soma à requisição medida o tempo gasto em render()
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serializacao():
+            return super().render(data, accepted_media_type, renderer_context)
+
+class SerializerInstrumentadoMixin:
+    # Soma à requisição medida o tempo de montar serializer.data (com many=True, via list_serializer_class)
+    @property
+    def data(self):
+        with serializacao():
+            return super().data
+
+def metricas(request):
+    return HttpResponse(registro.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def metricas_json(request):
+    return HttpResponse(json.dumps(registro.resumo()), content_type='application/json')
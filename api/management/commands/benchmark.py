@@ -0,0 +1,228 @@
+import json
+import platform
+import tempfile
+import tracemalloc
+from dataclasses                 import replace
+from datetime                    import date, datetime
+from hashlib                     import sha256
+from pathlib                     import Path
+from time                        import perf_counter
+import django
+import pandas                    as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import connection
+from django.test                 import Client, override_settings
+from django.test.utils           import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from rest_framework.renderers    import JSONRenderer
+from api                         import filters
+from api                         import models
+from api                         import serializers
+from api                         import sintetico
+
+# Diferença absoluta abaixo da qual uma medição não conta como regressão: em tempos de poucos
+# milissegundos a variação entre execuções passa facilmente do limite percentual
+FOLGA_SEGUNDOS = 0.01
+FOLGA_BYTES = 1024 * 1024
+
+# Um ano dos dados sintéticos (que começam em 2015), como o filtro padrão do dashboard
+PERIODO = {'data__gte': '2017-01-01', 'data__lte': '2017-12-31'}
+
+# Tamanho da página nas listagens, o mesmo do dashboard (cliente.busca_paginas)
+PAGINA = 10_000
+
+class Command(BaseCommand):
+    help = (
+        'Mede os caminhos críticos da API e do dashboard com dados sintéticos num banco descartável e grava '
+        'os resultados em JSON. Com --baseline, compara com uma execução anterior e falha se alguma medição '
+        'piorar mais que --threshold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help='Quantidades de linhas avaliadas (ex.: 10000 100000 1000000 10000000).')
+        parser.add_argument('--repeat', type=int, default=3, help='Execuções por medição (vale a melhor).')
+        parser.add_argument('--serializer-rows', type=int, default=20_000, help='Linhas serializadas na medição de vazão dos serializers.')
+        parser.add_argument('--output', default='benchmark.json', help='Arquivo JSON com os resultados.')
+        parser.add_argument('--baseline', help='JSON de uma execução anterior usado como referência.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Piora relativa tolerada (0.2 = 20%%).')
+        parser.add_argument('--scratch', default=str(Path(tempfile.gettempdir()) / 'cnae_benchmark.sqlite3'), help='Arquivo do banco SQLite descartável.')
+
+    def mede(self, funcao, repeticoes):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = perf_counter()
+            funcao()
+            tempos.append(perf_counter() - inicio)
+        return min(tempos)
+
+    def memoria(self, funcao):
+        # Pico de memória alocada pelo Python durante uma execução, medido à parte porque o tracemalloc deixa tudo mais lento
+        tracemalloc.start()
+        try:
+            funcao()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def requisita(self, client, url):
+        # Listagens paginadas seguem o link 'next' até a última página, como o dashboard, para que o
+        # tempo e a memória medidos cresçam com a quantidade de linhas. Devolve (bytes, páginas)
+        def funcao():
+            total, paginas, proxima = 0, 0, url
+            while proxima:
+                resposta = client.get(proxima)
+                if resposta.status_code != 200:
+                    raise CommandError(f'{proxima} respondeu {resposta.status_code}.')
+                total, paginas = total + len(resposta.content), paginas + 1
+                corpo = resposta.json()
+                proxima = corpo.get('next') if isinstance(corpo, dict) else None
+            return total, paginas
+        return funcao
+
+    def mede_api(self, client, repeticoes):
+        urls = {
+            'api_lista': f'/api/v1/arrecadacao/?page_size={PAGINA}',
+            'api_lista_filtrada': f"/api/v1/arrecadacao/?page_size={PAGINA}&data__gte={PERIODO['data__gte']}&data__lte={PERIODO['data__lte']}&comercio__in=Comércio",
+            'api_agregacao': '/api/v1/arrecadacao/aggregate/?group_by=comercio,month',
+            'api_serie': '/api/v1/arrecadacao/timeseries/?freq=M&series=comercio',
+        }
+        resultados = {}
+        for nome, url in urls.items():
+            funcao = self.requisita(client, url)
+            segundos = self.mede(funcao, repeticoes)
+            tamanho, paginas = funcao()
+            resultados[nome] = {'segundos': segundos, 'bytes': tamanho, 'paginas': paginas}
+        resultados['api_lista']['memoria_pico'] = self.memoria(self.requisita(client, urls['api_lista']))
+        return resultados
+
+    def mede_filtros(self, repeticoes):
+        consultas = {
+            'filtro_periodo_comercio': {**PERIODO, 'comercio__in': 'Comércio'},
+            'filtro_secao': {'secao': 'G'},
+            'filtro_subclasse_periodo': {**PERIODO, 'subclasse__codigo': models.Subclasse.objects.order_by('codigo').values_list('codigo', flat=True).first()},
+        }
+        resultados = {}
+        for nome, params in consultas.items():
+            filterset = filters.ArrecadacaoFilter(params, queryset=models.Arrecadacao.objects.all())
+            if not filterset.is_valid():
+                raise CommandError(f'Filtro inválido em {nome}: {filterset.errors}')
+            ids = filterset.qs.values_list('id', flat=True)
+            resultados[nome] = {'segundos': self.mede(lambda: list(ids.all()), repeticoes), 'linhas': ids.count()}
+        return resultados
+
+    def mede_serializers(self, limite, repeticoes):
+        # Os dois serializers sobre as mesmas linhas; o caminho rápido precisa responder igual ao padrão
+        renderer = JSONRenderer()
+        queryset = models.Arrecadacao.objects.select_related('subclasse__classe__grupo__divisao__secao', 'setor', 'comercio').order_by('id')[:limite]
+        linhas = queryset.count()
+        resultados, respostas = {}, set()
+        for nome, serializer in (('serializer', serializers.ArrecadacaoSerializer), ('serializer_leitura', serializers.ArrecadacaoLeituraSerializer)):
+            renderiza = lambda: renderer.render(serializer(queryset.all(), many=True).data)
+            segundos = self.mede(renderiza, repeticoes)
+            # Só o hash, para não manter dois JSONs grandes em memória
+            respostas.add(sha256(renderiza()).hexdigest())
+            resultados[nome] = {'segundos': segundos, 'linhas': linhas, 'linhas_por_segundo': linhas / segundos}
+        if len(respostas) > 1:
+            raise CommandError(f'ArrecadacaoSerializer e ArrecadacaoLeituraSerializer respondem diferente com {linhas} linhas.')
+        return resultados
+
+    def mede_dashboard(self, client, repeticoes):
+        # Cálculos do dashboard (analise, backend pandas) sobre o período padrão; os registros chegam como na API
+        import analise
+        import hierarquia
+
+        queryset = filters.ArrecadacaoFilter(PERIODO, queryset=models.Arrecadacao.objects.all()).qs
+        registros = list(serializers.ArrecadacaoLeituraSerializer(queryset).linhas())
+        descricoes = {nivel: {item['codigo']: item['descricao'] for item in itens} for nivel, itens in client.get('/api/v1/cnae/').json().items()}
+        filtro = analise.Filtro(date.fromisoformat(PERIODO['data__gte']), date.fromisoformat(PERIODO['data__lte']))
+
+        carrega = lambda: analise.compacta(pd.DataFrame.from_records(registros, columns=analise.COLUNAS))
+        dados = carrega()
+
+        def drill_down():
+            indice = hierarquia.IndiceHierarquia(dados, descricoes)
+            backend, pai = analise.BackendPandas(dados, indice), None
+            for nivel in hierarquia.NIVEIS:
+                pai = indice.opcoes(nivel, pai)[0]
+                backend.metricas(replace(filtro, nivel=nivel, codigo=pai))
+
+        resultados = {
+            'dashboard_carga': {'segundos': self.mede(carrega, repeticoes), 'linhas': len(dados), 'bytes': analise.uso_memoria(dados), 'memoria_pico': self.memoria(carrega)},
+            'dashboard_groupby': {'segundos': self.mede(lambda: analise.receita_comercio(dados), repeticoes)},
+            'dashboard_resample': {'segundos': self.mede(lambda: analise.serie(dados, 'M', 'comercio'), repeticoes)},
+        }
+        if len(dados):
+            resultados['dashboard_drill_down'] = {'segundos': self.mede(drill_down, repeticoes)}
+        return resultados
+
+    def mede_tamanho(self, client, options):
+        return {
+            **self.mede_api(client, options['repeat']),
+            **self.mede_filtros(options['repeat']),
+            **self.mede_serializers(options['serializer_rows'], options['repeat']),
+            **self.mede_dashboard(client, options['repeat']),
+        }
+
+    def compara(self, atual, referencia, limite):
+        # Lista de (linhas, medição, métrica, referência, atual) que pioraram além do limite.
+        # Só tempo e memória contam; medições ausentes em um dos lados são ignoradas
+        regressoes = []
+        for linhas, medicoes in atual.items():
+            for nome, metricas in medicoes.items():
+                anteriores = referencia.get(linhas, {}).get(nome, {})
+                for metrica, folga in (('segundos', FOLGA_SEGUNDOS), ('memoria_pico', FOLGA_BYTES)):
+                    if metrica in metricas and metrica in anteriores:
+                        valor, anterior = metricas[metrica], anteriores[metrica]
+                        if valor > anterior * (1 + limite) and valor - anterior > folga:
+                            regressoes.append((linhas, nome, metrica, anterior, valor))
+        return regressoes
+
+    def handle(self, *args, **options):
+        referencia = None
+        if options['baseline']:
+            try:
+                referencia = json.loads(Path(options['baseline']).read_text())['resultados']
+            except (OSError, ValueError, KeyError) as erro:
+                raise CommandError(f"Não foi possível ler a referência {options['baseline']}: {erro}")
+
+        # Banco de teste descartável, como o `manage.py test`, em arquivo para caber 10M de linhas
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = options['scratch']
+        setup_test_environment(debug=False)
+        configuracao = setup_databases(verbosity=0, interactive=False)
+        resultados = {}
+        try:
+            with override_settings(RESPOSTA_CACHE=False):
+                sintetico.gera_hierarquia()
+                client = Client()
+                carregadas = 0
+                for linhas in sorted(options['rows']):
+                    inicio = perf_counter()
+                    sintetico.gera_arrecadacoes(linhas - carregadas, seed=linhas)
+                    carregadas = linhas
+                    self.stdout.write(self.style.MIGRATE_HEADING(f'{linhas:,} linhas (carga em {perf_counter() - inicio:.1f}s)'))
+
+                    resultados[str(linhas)] = self.mede_tamanho(client, options)
+                    for nome, metricas in resultados[str(linhas)].items():
+                        extras = ''.join(f'  {metrica} {valor:,.0f}' for metrica, valor in metricas.items() if metrica != 'segundos')
+                        self.stdout.write(f"  {nome:<26} {metricas['segundos'] * 1000:>10,.1f} ms{extras}")
+        finally:
+            teardown_databases(configuracao, verbosity=0)
+            teardown_test_environment()
+
+        Path(options['output']).write_text(json.dumps({
+            'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+            'repeticoes': options['repeat'],
+            'resultados': resultados,
+        }, indent=2))
+        self.stdout.write(f"Resultados gravados em {options['output']}.")
+
+        if referencia is not None:
+            regressoes = self.compara(resultados, referencia, options['threshold'])
+            for linhas, nome, metrica, anterior, valor in regressoes:
+                self.stdout.write(self.style.ERROR(f'{int(linhas):,} linhas, {nome}: {metrica} {anterior:,.4g} -> {valor:,.4g} ({valor / anterior - 1:+.0%})'))
+            if regressoes:
+                raise CommandError(f"{len(regressoes)} medições pioraram mais que {options['threshold']:.0%} em relação a {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS(f"Nenhuma medição piorou mais que {options['threshold']:.0%} em relação a {options['baseline']}."))
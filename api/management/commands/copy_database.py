@@ -0,0 +1,59 @@
+import sqlite3
+from pathlib                      import Path
+from time                         import perf_counter
+from django.apps                  import apps
+from django.core.management.base  import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers      import sort_dependencies
+from django.db                    import DEFAULT_DB_ALIAS, connections, transaction
+from api                          import cache
+from api                          import models
+
+class Command(BaseCommand):
+    help = 'Copia as tabelas do app api de um arquivo SQLite para o banco configurado (ex.: PostgreSQL já migrado).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo SQLite de origem, com as migrações aplicadas.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Banco de destino (padrão: default).')
+        parser.add_argument('--batch-size', type=int, default=50_000, help='Linhas lidas e inseridas por vez.')
+
+    def handle(self, *args, **options):
+        arquivo = Path(options['arquivo'])
+        if not arquivo.exists():
+            raise CommandError(f'Arquivo não encontrado: {arquivo}')
+
+        destino = connections[options['database']]
+        # Tabelas referenciadas antes das que apontam para elas
+        # As versões do cache são do banco de destino: não são copiadas, e sim incrementadas no fim
+        modelos = [model for model in sort_dependencies([(apps.get_app_config('api'), None)], allow_cycles=True) if model is not models.VersaoModelo]
+        ocupados = [model._meta.db_table for model in modelos if model._base_manager.using(destino.alias).exists()]
+        if ocupados:
+            raise CommandError(f'As tabelas de destino precisam estar vazias: {", ".join(ocupados)}.')
+
+        origem = sqlite3.connect(f'file:{arquivo}?mode=ro', uri=True)
+        inicio = perf_counter()
+        with transaction.atomic(using=destino.alias), destino.cursor() as cursor:
+            for model in modelos:
+                # Colunas lidas e gravadas diretamente: sem passar pelo ORM nem pelos gatilhos de
+                # bulk_create, as linhas (inclusive ids e o rollup mensal) chegam como estavam
+                colunas = [campo.column for campo in model._meta.concrete_fields]
+                select = 'SELECT {} FROM {} ORDER BY 1'.format(', '.join(f'"{coluna}"' for coluna in colunas), f'"{model._meta.db_table}"')
+                insert = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                    destino.ops.quote_name(model._meta.db_table),
+                    ', '.join(destino.ops.quote_name(coluna) for coluna in colunas),
+                    ', '.join(['%s'] * len(colunas)),
+                )
+                leitura = origem.execute(select)
+                copiadas = 0
+                while linhas := leitura.fetchmany(options['batch_size']):
+                    cursor.executemany(insert, linhas)
+                    copiadas += len(linhas)
+                self.stdout.write(f'{model._meta.db_table}: {copiadas:,} linhas')
+
+            # Os ids vieram da origem; as sequências do destino continuam a partir do maior
+            for sql in destino.ops.sequence_reset_sql(no_style(), modelos):
+                cursor.execute(sql)
+            cache.incrementa_versao(*modelos, using=destino.alias)
+        origem.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Cópia concluída em {perf_counter() - inicio:.1f}s.'))
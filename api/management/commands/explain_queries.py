@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models            import Count, Sum
+from django.db.models.functions  import TruncMonth
+from api                         import filters
+from api                         import models
+
+class Command(BaseCommand):
+    help = 'Exibe o plano de execução (EXPLAIN) das consultas usadas pelo dashboard.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', default='2020-01-01', help='Data inicial do intervalo (AAAA-MM-DD).')
+        parser.add_argument('--end', default='2020-12-31', help='Data final do intervalo (AAAA-MM-DD).')
+        parser.add_argument('--comercio', default='Comércio', help='Descrição do comércio filtrado.')
+        parser.add_argument('--secao', default='G', help='Código da seção CNAE filtrada.')
+
+    def filtra(self, **params):
+        filterset = filters.ArrecadacaoFilter(params, queryset=models.Arrecadacao.objects.all())
+        return filterset.qs
+
+    def handle(self, *args, **options):
+        periodo = {'data__gte': options['start'], 'data__lte': options['end']}
+
+        consultas = {
+            'Período × comércio': self.filtra(**periodo, comercio__in=options['comercio']),
+            'Período × hierarquia CNAE': self.filtra(**periodo, secao=options['secao']),
+            'Soma por comércio no período': (
+                self.filtra(**periodo).order_by().values('comercio').annotate(total=Sum('valor'), quantidade=Count('id'))
+            ),
+            'Histórico mensal por comércio': (
+                self.filtra(**periodo, comercio__in=options['comercio'])
+                    .order_by().values('comercio', mes=TruncMonth('data')).annotate(total=Sum('valor'))
+            ),
+        }
+
+        for titulo, queryset in consultas.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(titulo))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
@@ -0,0 +1,99 @@
+from pathlib                     import Path
+from time                        import perf_counter
+import pyarrow                   as pa
+import pyarrow.csv               as pa_csv
+import pyarrow.parquet           as pq
+from django.core.management.base import BaseCommand, CommandError
+from django.db                   import reset_queries, transaction
+from api                         import models
+
+COLUNAS = ['valor', 'data', 'subclasse', 'setor', 'comercio']
+
+TIPOS = {
+    'valor': pa.decimal128(20, 2),
+    'data': pa.date32(),
+    'subclasse': pa.string(),
+    'setor': pa.string(),
+    'comercio': pa.string(),
+}
+
+class Command(BaseCommand):
+    help = 'Carrega arrecadações de um arquivo CSV ou Parquet em lotes com bulk_create.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Arquivo com as colunas valor, data, subclasse (código), setor e comercio (descrições).')
+        parser.add_argument('--format', choices=['csv', 'parquet'], help='Formato do arquivo (padrão: deduzido pela extensão).')
+        parser.add_argument('--batch-size', type=int, default=50_000, help='Linhas lidas e inseridas por transação.')
+        parser.add_argument('--delimiter', default=',', help='Separador de colunas do CSV.')
+        parser.add_argument('--decimal-point', default='.', help='Separador decimal do CSV.')
+        parser.add_argument('--skip-unknown', action='store_true', help='Ignora linhas com subclasse, setor ou comércio inexistentes em vez de abortar.')
+
+    def lotes(self, arquivo, formato, options):
+        if formato == 'parquet':
+            parquet = pq.ParquetFile(arquivo)
+            for lote in parquet.iter_batches(batch_size=options['batch_size'], columns=COLUNAS):
+                yield lote.cast(pa.schema([(coluna, TIPOS[coluna]) for coluna in lote.schema.names]))
+            return
+
+        leitor = pa_csv.open_csv(
+            arquivo,
+            read_options=pa_csv.ReadOptions(block_size=1 << 24),
+            parse_options=pa_csv.ParseOptions(delimiter=options['delimiter']),
+            convert_options=pa_csv.ConvertOptions(column_types=TIPOS, include_columns=COLUNAS, decimal_point=options['decimal_point']),
+        )
+        # Os blocos do leitor de CSV têm tamanho em bytes; reagrupa no tamanho de lote pedido
+        pendentes, linhas = [], 0
+        for bloco in leitor:
+            pendentes.append(bloco)
+            linhas += bloco.num_rows
+            if linhas >= options['batch_size']:
+                tabela = pa.Table.from_batches(pendentes)
+                for lote in tabela.to_batches(max_chunksize=options['batch_size']):
+                    yield lote
+                pendentes, linhas = [], 0
+        if pendentes:
+            yield from pa.Table.from_batches(pendentes).to_batches(max_chunksize=options['batch_size'])
+
+    def handle(self, *args, **options):
+        arquivo = Path(options['arquivo'])
+        if not arquivo.exists():
+            raise CommandError(f'Arquivo não encontrado: {arquivo}')
+        formato = options['format'] or ('parquet' if arquivo.suffix.lower() in ('.parquet', '.pq') else 'csv')
+
+        # Dicionários montados uma única vez para resolver as chaves estrangeiras
+        subclasses = dict(models.Subclasse.objects.values_list('codigo', 'id'))
+        setores = dict(models.Setor.objects.values_list('descricao', 'id'))
+        comercios = dict(models.Comercio.objects.values_list('descricao', 'id'))
+
+        inicio = perf_counter()
+        inseridas, ignoradas = 0, 0
+
+        for lote in self.lotes(arquivo, formato, options):
+            colunas = lote.to_pydict()
+            arrecadacoes = []
+            for valor, data, subclasse, setor, comercio in zip(*(colunas[coluna] for coluna in COLUNAS)):
+                subclasse_id, setor_id, comercio_id = subclasses.get(subclasse), setores.get(setor), comercios.get(comercio)
+                if None in (subclasse_id, setor_id, comercio_id, valor, data):
+                    if not options['skip_unknown']:
+                        raise CommandError(
+                            f'Linha {inseridas + ignoradas + len(arrecadacoes) + 1} inválida: '
+                            f'valor={valor!r} data={data!r} subclasse={subclasse!r} setor={setor!r} comercio={comercio!r}. '
+                            f'{inseridas} linhas já inseridas foram mantidas.'
+                        )
+                    ignoradas += 1
+                    continue
+                arrecadacoes.append(models.Arrecadacao(valor=valor, data=data, subclasse_id=subclasse_id, setor_id=setor_id, comercio_id=comercio_id))
+
+            with transaction.atomic():
+                models.Arrecadacao.objects.bulk_create(arrecadacoes, batch_size=options['batch_size'])
+            inseridas += len(arrecadacoes)
+            # Com DEBUG ligado o Django guarda cada INSERT; descarta para a memória não crescer
+            reset_queries()
+
+            decorrido = perf_counter() - inicio
+            self.stdout.write(f'{inseridas:,} linhas inseridas ({inseridas / decorrido:,.0f} linhas/s)')
+
+        decorrido = perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{inseridas:,} linhas inseridas em {decorrido:.1f}s ({inseridas / decorrido if decorrido else 0:,.0f} linhas/s), {ignoradas:,} ignoradas.'
+        ))
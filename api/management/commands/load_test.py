@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures          import ThreadPoolExecutor
+from time                        import perf_counter
+import numpy                     as np
+import requests                  as rq
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = (
+        'Dispara requisições concorrentes contra uma ou mais URLs e mostra requisições/s e latências. '
+        'Ex.: compare "python manage.py runserver 8000" (WSGI) com "uvicorn setup.asgi:application --port 8001" '
+        '(ASGI) usando --url http://127.0.0.1:8000/api/v1/arrecadacao/aggregate/?group_by=comercio '
+        '--url http://127.0.0.1:8001/api/v1/async/arrecadacao/aggregate/?group_by=comercio'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help='URL testada; repita para comparar.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requisições simultâneas.')
+        parser.add_argument('--requests', type=int, default=500, help='Requisições por URL.')
+        parser.add_argument('--warmup', type=int, default=10, help='Requisições descartadas antes da medição.')
+
+    def mede(self, url, options):
+        # Uma sessão por thread do cliente, para a conexão keep-alive não ser disputada
+        local = threading.local()
+
+        def requisita(_):
+            if not hasattr(local, 'sessao'):
+                local.sessao = rq.Session()
+            inicio = perf_counter()
+            try:
+                resposta = local.sessao.get(url)
+                for _ in resposta.iter_content(1 << 16):
+                    pass
+                ok = resposta.status_code == 200
+            except rq.RequestException:
+                ok = False
+            return perf_counter() - inicio, ok
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(requisita, range(options['warmup'])))
+            inicio = perf_counter()
+            resultados = list(executor.map(requisita, range(options['requests'])))
+            decorrido = perf_counter() - inicio
+
+        latencias = np.array([latencia for latencia, ok in resultados if ok]) * 1000
+        erros = sum(not ok for _, ok in resultados)
+        if not len(latencias):
+            return f'{url}\n  todas as {erros} requisições falharam'
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+        return (
+            f'{url}\n'
+            f'  {len(latencias) / decorrido:,.1f} req/s  p50 {p50:,.1f} ms  p95 {p95:,.1f} ms  p99 {p99:,.1f} ms'
+            f'  máx {latencias.max():,.1f} ms  erros {erros}'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{options['requests']} requisições por URL, {options['concurrency']} simultâneas")
+        for url in options['url']:
+            self.stdout.write(self.mede(url, options))
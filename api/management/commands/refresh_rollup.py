@@ -0,0 +1,17 @@
+from time                        import perf_counter
+from django.core.management.base import BaseCommand
+from api                         import rollup
+
+class Command(BaseCommand):
+    help = 'Atualiza a tabela ArrecadacaoMensal recalculando os meses alterados desde a última execução.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcula todos os meses em vez de apenas os pendentes.')
+
+    def handle(self, *args, **options):
+        inicio = perf_counter()
+        meses = rollup.atualiza(completo=options['full'])
+
+        for mes, linhas in meses.items():
+            self.stdout.write(f'{mes:%Y-%m}: {linhas} linhas')
+        self.stdout.write(self.style.SUCCESS(f'{len(meses)} meses atualizados em {perf_counter() - inicio:.2f}s'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_arrecadacao_valor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='arrecadacao',
+            index=models.Index(fields=['data', 'comercio'], name='arrecadacao_data_comercio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='arrecadacao',
+            index=models.Index(fields=['data', 'subclasse'], name='arrecadacao_data_subclasse_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='arrecadacao',
+            index=models.Index(fields=['comercio', 'data'], name='arrecadacao_comercio_data_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+def preenche_hierarquia(apps, schema_editor):
+    Arrecadacao = apps.get_model('api', 'Arrecadacao')
+    Subclasse = apps.get_model('api', 'Subclasse')
+    caminhos = {
+        'secao_codigo': 'classe__grupo__divisao__secao__codigo',
+        'divisao_codigo': 'classe__grupo__divisao__codigo',
+        'grupo_codigo': 'classe__grupo__codigo',
+        'classe_codigo': 'classe__codigo',
+    }
+    Arrecadacao.objects.update(**{
+        coluna: models.Subquery(Subclasse.objects.filter(pk=models.OuterRef('subclasse_id')).values(caminho)[:1])
+        for coluna, caminho in caminhos.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_arrecadacao_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arrecadacao',
+            name='classe_codigo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=5),
+        ),
+        migrations.AddField(
+            model_name='arrecadacao',
+            name='divisao_codigo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=2),
+        ),
+        migrations.AddField(
+            model_name='arrecadacao',
+            name='grupo_codigo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='arrecadacao',
+            name='secao_codigo',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1),
+        ),
+        migrations.RunPython(preenche_hierarquia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def marca_meses_existentes(apps, schema_editor):
+    # Até a primeira execução de refresh_rollup as agregações usam a tabela base
+    Arrecadacao = apps.get_model('api', 'Arrecadacao')
+    MesPendente = apps.get_model('api', 'MesPendente')
+    meses = Arrecadacao.objects.order_by().annotate(mes=TruncMonth('data')).values_list('mes', flat=True).distinct()
+    MesPendente.objects.bulk_create([MesPendente(mes=mes) for mes in meses])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_arrecadacao_hierarquia_denormalizada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArrecadacaoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('secao_codigo', models.CharField(blank=True, db_index=True, max_length=1)),
+                ('divisao_codigo', models.CharField(blank=True, db_index=True, max_length=2)),
+                ('grupo_codigo', models.CharField(blank=True, db_index=True, max_length=3)),
+                ('classe_codigo', models.CharField(blank=True, db_index=True, max_length=5)),
+                ('comercio', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.comercio')),
+                ('setor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.setor')),
+                ('subclasse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.subclasse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['comercio', 'mes'], name='arrecadacao_mensal_com_mes_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='arrecadacaomensal',
+            constraint=models.UniqueConstraint(fields=('mes', 'subclasse', 'setor', 'comercio'), name='arrecadacao_mensal_unica'),
+        ),
+        migrations.RunPython(marca_meses_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_arrecadacao_mensal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='arrecadacao',
+            index=models.Index(fields=['data', 'id'], name='arrecadacao_data_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_arrecadacao_data_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arrecadacao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:02
+
+import api.models
+from django.db import migrations, models
+
+# valor passa de DecimalField para inteiro de centavos. Uma conversão de tipo direta copiaria
+# os reais como estão, então os centavos são calculados numa coluna nova que toma o lugar da antiga
+
+def converte(tabela):
+    return migrations.RunSQL(
+        f'UPDATE {tabela} SET valor_centavos = CAST(ROUND(valor * 100) AS BIGINT)',
+        f'UPDATE {tabela} SET valor = valor_centavos / 100.0',
+    )
+
+def operacoes(model_name, tabela):
+    return [
+        migrations.AlterField(
+            model_name=model_name,
+            name='valor',
+            field=models.DecimalField(decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name='valor_centavos',
+            field=api.models.CentavosField(null=True),
+        ),
+        converte(tabela),
+        migrations.RemoveField(
+            model_name=model_name,
+            name='valor',
+        ),
+        migrations.RenameField(
+            model_name=model_name,
+            old_name='valor_centavos',
+            new_name='valor',
+        ),
+        migrations.AlterField(
+            model_name=model_name,
+            name='valor',
+            field=api.models.CentavosField(),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_arrecadacao_atualizado_em'),
+    ]
+
+    operations = [
+        *operacoes('arrecadacao', 'api_arrecadacao'),
+        *operacoes('arrecadacaomensal', 'api_arrecadacaomensal'),
+    ]
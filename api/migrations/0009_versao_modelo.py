@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_valor_centavos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoModelo',
+            fields=[
+                ('modelo', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('versao', models.FloatField()),
+            ],
+        ),
+    ]
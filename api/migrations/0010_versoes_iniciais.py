@@ -0,0 +1,24 @@
+import time
+
+from django.db import migrations
+
+
+def grava_versoes_iniciais(apps, schema_editor):
+    # As leituras (api.cache.versoes) só consultam VersaoModelo; cada modelo parte do momento da migração
+    VersaoModelo = apps.get_model('api', 'VersaoModelo')
+    agora = time.time()
+    VersaoModelo.objects.bulk_create([
+        VersaoModelo(modelo=model._meta.label_lower, versao=agora)
+        for model in apps.get_app_config('api').get_models() if model is not VersaoModelo
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_versao_modelo'),
+    ]
+
+    operations = [
+        migrations.RunPython(grava_versoes_iniciais, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,14 @@
-from django.db import models
+from decimal                    import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN, Decimal, InvalidOperation
+from itertools                  import islice
+from asgiref.sync               import sync_to_async
+from django                     import forms
+from django.conf                import settings
+from django.core.exceptions     import ValidationError
+from django.db                  import models, transaction
+from django.db.models           import lookups
+from django.db.models.functions import TruncMonth
+from django.utils               import timezone
+from .                          import cache
 
 class Secao(models.Model):
     codigo = models.CharField(max_length=1, unique=True, blank=False)
@@ -51,12 +61,321 @@ class Comercio(models.Model):
     def __str__(self) -> str:
         return str(self.descricao)
     
+# Caminho até o código de cada nível da hierarquia CNAE a partir de Arrecadacao
+HIERARQUIA_RELACIONAL = {
+    'secao': 'subclasse__classe__grupo__divisao__secao__codigo',
+    'divisao': 'subclasse__classe__grupo__divisao__codigo',
+    'grupo': 'subclasse__classe__grupo__codigo',
+    'classe': 'subclasse__classe__codigo',
+}
+
+# Mesmos códigos copiados para colunas da própria Arrecadacao
+HIERARQUIA_DENORMALIZADA = {
+    'secao': 'secao_codigo',
+    'divisao': 'divisao_codigo',
+    'grupo': 'grupo_codigo',
+    'classe': 'classe_codigo',
+}
+
+HIERARQUIA = HIERARQUIA_DENORMALIZADA if settings.CNAE_DENORMALIZADO else HIERARQUIA_RELACIONAL
+
+def hierarquia_das_subclasses(ids):
+    # Uma única consulta devolve {subclasse_id: {'secao_codigo': ..., 'divisao_codigo': ..., ...}}
+    caminhos = {coluna: caminho.removeprefix('subclasse__') for coluna, caminho in zip(HIERARQUIA_DENORMALIZADA.values(), HIERARQUIA_RELACIONAL.values())}
+    linhas = Subclasse.objects.filter(pk__in=set(ids)).values('pk', *caminhos.values())
+    return {linha['pk']: {coluna: linha[caminho] for coluna, caminho in caminhos.items()} for linha in linhas}
+
+def preenche_hierarquia(arrecadacoes):
+    hierarquia = hierarquia_das_subclasses(arrecadacao.subclasse_id for arrecadacao in arrecadacoes)
+    for arrecadacao in arrecadacoes:
+        for coluna, codigo in hierarquia.get(arrecadacao.subclasse_id, {}).items():
+            setattr(arrecadacao, coluna, codigo)
+
+def registra_alteracao(datas):
+    # Toda escrita em Arrecadacao marca os meses para o rollup e invalida as respostas em cache
+    MesPendente.marca(datas)
+    cache.incrementa_versao(Arrecadacao)
+
+def para_centavos(valor, arredondamento=ROUND_HALF_EVEN):
+    # Reais (Decimal, int, float ou texto) para inteiro de centavos, arredondando como o DecimalField
+    valor = Decimal(str(valor)) if isinstance(valor, float) else Decimal(valor)
+    return int(valor.scaleb(2).to_integral_value(arredondamento))
+
+def de_centavos(centavos):
+    return Decimal(centavos).scaleb(-2)
+
+class CentavosField(models.BigIntegerField):
+    # Valor em reais guardado como inteiro de centavos: o banco soma inteiros, sem arredondamento, e
+    # a leitura não passa pelo conversor de Decimal do SQLite. No Python continua um Decimal de 2 casas
+    description = 'Valor monetário em centavos'
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return None if value is None else para_centavos(value)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else de_centavos(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return de_centavos(para_centavos(value))
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(f"'{value}' não é um valor válido.", code='invalid')
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.DecimalField, 'max_digits': 20, 'decimal_places': 2, **kwargs})
+
+class LimiteCentavos:
+    # Limite de faixa em reais com fração de centavo (ex.: valor__gte=100.105) arredondado para o
+    # lado que mantém a comparação exata sobre os centavos inteiros: c >= 10010.5 equivale a
+    # c >= 10011 (teto) e c > 10010.5 a c > 10010 (piso). O arredondamento para o centavo mais
+    # próximo de get_prep_value incluiria 100.10 em valor__gte=100.105. Substitui também os lookups
+    # de IntegerField, que arredondam floats para cima antes da conversão para centavos
+    arredondamento = ROUND_HALF_EVEN
+
+    def get_prep_lookup(self):
+        if self.rhs is None or hasattr(self.rhs, 'resolve_expression'):
+            return super().get_prep_lookup()
+        return para_centavos(self.rhs, self.arredondamento)
+
+@CentavosField.register_lookup
+class CentavosMaiorQue(LimiteCentavos, lookups.GreaterThan):
+    arredondamento = ROUND_FLOOR
+
+@CentavosField.register_lookup
+class CentavosMaiorOuIgual(LimiteCentavos, lookups.GreaterThanOrEqual):
+    arredondamento = ROUND_CEILING
+
+@CentavosField.register_lookup
+class CentavosMenorQue(LimiteCentavos, lookups.LessThan):
+    arredondamento = ROUND_CEILING
+
+@CentavosField.register_lookup
+class CentavosMenorOuIgual(LimiteCentavos, lookups.LessThanOrEqual):
+    arredondamento = ROUND_FLOOR
+
+@CentavosField.register_lookup
+class CentavosEntre(lookups.Range):
+    # Mesmo que gte no início e lte no fim
+    def get_prep_lookup(self):
+        if hasattr(self.rhs, 'resolve_expression') or any(hasattr(limite, 'resolve_expression') for limite in self.rhs):
+            return super().get_prep_lookup()
+        inicio, fim = self.rhs
+        return [para_centavos(inicio, ROUND_CEILING), para_centavos(fim, ROUND_FLOOR)]
+
+def centavos(caminho):
+    # Coluna de CentavosField lida como o inteiro guardado, sem criar um Decimal por linha
+    return models.ExpressionWrapper(models.F(caminho), output_field=models.BigIntegerField())
+
+class ArrecadacaoQuerySet(models.QuerySet):
+    async def aiterator(self, chunk_size=2000):
+        # O aiterator() do Django 5.0 executa consultas values()/values_list() ainda no contexto
+        # assíncrono (SynchronousOnlyOperation); aqui o gerador de iterator() é criado sem tocar no
+        # banco e cada bloco é lido em sync_to_async
+        linhas = self.iterator(chunk_size=chunk_size)
+        while bloco := await sync_to_async(lambda: list(islice(linhas, chunk_size)))():
+            for linha in bloco:
+                yield linha
+
+    def meses(self):
+        return set(self.order_by().annotate(mes=TruncMonth('data')).values_list('mes', flat=True).distinct())
+
+    # As escritas rodam numa transação com registra_alteracao: a nova versão (api.cache) e os
+    # meses pendentes ficam visíveis junto com os dados, nunca antes
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        preenche_hierarquia(objs)
+        with transaction.atomic(using=self.db):
+            registra_alteracao(arrecadacao.data for arrecadacao in objs)
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'subclasse' in fields:
+            preenche_hierarquia(objs)
+            fields = [*fields, *HIERARQUIA_DENORMALIZADA.values()]
+        # bulk_update não passa pelo auto_now
+        agora = timezone.now()
+        for arrecadacao in objs:
+            arrecadacao.atualizado_em = agora
+        fields = [*fields, 'atualizado_em']
+        with transaction.atomic(using=self.db):
+            if 'data' in fields:
+                registra_alteracao(self.filter(pk__in=[arrecadacao.pk for arrecadacao in objs]).meses())
+            registra_alteracao(arrecadacao.data for arrecadacao in objs)
+            return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        novos = {kwargs['data']} if 'data' in kwargs and not hasattr(kwargs['data'], 'resolve_expression') else set()
+        kwargs.setdefault('atualizado_em', timezone.now())
+        with transaction.atomic(using=self.db):
+            registra_alteracao(self.meses() | novos)
+            return super().update(**kwargs)
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            registra_alteracao(self.meses())
+            return super().delete()
+
+    def bulk_upsert(self, objs, atualizar=True, batch_size=None):
+        # Não há restrição única em (subclasse, setor, comercio, data), então os
+        # registros existentes são buscados numa consulta e casados em memória;
+        # havendo duplicatas no banco, a de menor id é a considerada.
+        # Com atualizar=False os registros já existentes são ignorados.
+        objs = list(objs)
+        if not objs:
+            return 0, 0
+
+        def chave(subclasse, setor, comercio, data):
+            return subclasse, setor, comercio, models.DateField().to_python(data)
+
+        existentes = {}
+        candidatos = self.filter(
+            data__in={arrecadacao.data for arrecadacao in objs},
+            subclasse_id__in={arrecadacao.subclasse_id for arrecadacao in objs},
+        ).order_by('-id').values_list('id', 'subclasse_id', 'setor_id', 'comercio_id', 'data')
+        for id, *campos in candidatos:
+            existentes[chave(*campos)] = id
+
+        # Repetições dentro do próprio lote: vale a última ao atualizar e a primeira ao ignorar
+        novos, alterados = {}, {}
+        for arrecadacao in objs:
+            identificador = chave(arrecadacao.subclasse_id, arrecadacao.setor_id, arrecadacao.comercio_id, arrecadacao.data)
+            if identificador not in existentes:
+                if atualizar or identificador not in novos:
+                    novos[identificador] = arrecadacao
+            elif atualizar:
+                arrecadacao.pk = existentes[identificador]
+                alterados[identificador] = arrecadacao
+
+        with transaction.atomic(using=self.db):
+            self.bulk_create(novos.values(), batch_size=batch_size)
+            self.bulk_update(alterados.values(), ['valor'], batch_size=batch_size)
+        return len(novos), len(alterados)
+
+    def atualiza_hierarquia(self):
+        # Recalcula as colunas denormalizadas no próprio banco (ex.: após mudanças na tabela CNAE)
+        # Os códigos agrupados em ArrecadacaoMensal mudam junto: os meses afetados voltam a ficar pendentes
+        with transaction.atomic(using=self.db):
+            registra_alteracao(self.meses())
+            return super().update(atualizado_em=timezone.now(), **{
+                coluna: models.Subquery(Subclasse.objects.filter(pk=models.OuterRef('subclasse_id')).values(caminho.removeprefix('subclasse__'))[:1])
+                for coluna, caminho in zip(HIERARQUIA_DENORMALIZADA.values(), HIERARQUIA_RELACIONAL.values())
+            })
+
 class Arrecadacao(models.Model):
-    valor = models.DecimalField(max_digits=20, decimal_places=2)
+    valor = CentavosField()
     subclasse = models.ForeignKey(Subclasse, on_delete=models.PROTECT)
     setor = models.ForeignKey(Setor, on_delete=models.PROTECT)
     comercio = models.ForeignKey(Comercio, on_delete=models.PROTECT)
     data = models.DateField()
+    secao_codigo = models.CharField(max_length=1, blank=True, editable=False, db_index=True)
+    divisao_codigo = models.CharField(max_length=2, blank=True, editable=False, db_index=True)
+    grupo_codigo = models.CharField(max_length=3, blank=True, editable=False, db_index=True)
+    classe_codigo = models.CharField(max_length=5, blank=True, editable=False, db_index=True)
+    # Momento da última escrita; o dashboard busca só o que mudou desde a última sincronização (?since=)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = ArrecadacaoQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['data', 'comercio'], name='arrecadacao_data_comercio_idx'),
+            models.Index(fields=['data', 'subclasse'], name='arrecadacao_data_subclasse_idx'),
+            models.Index(fields=['comercio', 'data'], name='arrecadacao_comercio_data_idx'),
+            models.Index(fields=['data', 'id'], name='arrecadacao_data_id_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'subclasse' in update_fields:
+            preenche_hierarquia([self])
+        if update_fields is not None:
+            # Com update_fields o auto_now só é gravado se atualizado_em estiver na lista
+            hierarquia = HIERARQUIA_DENORMALIZADA.values() if 'subclasse' in update_fields else []
+            kwargs['update_fields'] = [*update_fields, *hierarquia, 'atualizado_em']
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.pk is not None:
+                registra_alteracao(Arrecadacao.objects.filter(pk=self.pk).meses())
+            registra_alteracao([self.data])
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            registra_alteracao([self.data])
+            return super().delete(*args, **kwargs)
+    
+    def __str__(self) -> str:
+        return str(self.id)
+
+# Caminho de Arrecadacao até cada tabela da hierarquia CNAE
+CAMINHOS_CNAE = {
+    Secao: 'subclasse__classe__grupo__divisao__secao',
+    Divisao: 'subclasse__classe__grupo__divisao',
+    Grupo: 'subclasse__classe__grupo',
+    Classe: 'subclasse__classe',
+    Subclasse: 'subclasse',
+}
+
+def propaga_hierarquia(sender, instance, created=False, raw=False, using=None, **kwargs):
+    # Conectado ao post_save da hierarquia CNAE em ApiConfig.ready(): mover um nível para outro pai
+    # ou trocar um código muda as colunas copiadas nas arrecadações abaixo dele. Só as linhas com
+    # algum código diferente do atual são regravadas (atualiza_hierarquia marca os meses delas)
+    if created or raw:
+        return
+    caminho = CAMINHOS_CNAE[sender]
+    relativos = {
+        coluna: relacional.removeprefix(f'{caminho}__')
+        for coluna, relacional in zip(HIERARQUIA_DENORMALIZADA.values(), HIERARQUIA_RELACIONAL.values())
+        if relacional.startswith(f'{caminho}__')
+    }
+    atuais = sender.objects.using(using).filter(pk=instance.pk).values(*relativos.values()).get()
+    desatualizadas = Arrecadacao.objects.using(using).filter(**{caminho: instance.pk}).exclude(**{coluna: atuais[relativo] for coluna, relativo in relativos.items()})
+    if desatualizadas.exists():
+        desatualizadas.atualiza_hierarquia()
+
+class ArrecadacaoMensal(models.Model):
+    mes = models.DateField()
+    valor = CentavosField()
+    quantidade = models.PositiveIntegerField()
+    subclasse = models.ForeignKey(Subclasse, on_delete=models.PROTECT)
+    setor = models.ForeignKey(Setor, on_delete=models.PROTECT)
+    comercio = models.ForeignKey(Comercio, on_delete=models.PROTECT)
+    secao_codigo = models.CharField(max_length=1, blank=True, db_index=True)
+    divisao_codigo = models.CharField(max_length=2, blank=True, db_index=True)
+    grupo_codigo = models.CharField(max_length=3, blank=True, db_index=True)
+    classe_codigo = models.CharField(max_length=5, blank=True, db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'subclasse', 'setor', 'comercio'], name='arrecadacao_mensal_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['comercio', 'mes'], name='arrecadacao_mensal_com_mes_idx'),
+        ]
+    
+    def __str__(self) -> str:
+        return f'{self.mes:%Y-%m} {self.subclasse_id}'
+
+class MesPendente(models.Model):
+    # Meses com arrecadações alteradas desde a última atualização de ArrecadacaoMensal
+    mes = models.DateField(unique=True)
+    
+    @classmethod
+    def marca(cls, datas):
+        meses = {models.DateField().to_python(data).replace(day=1) for data in datas if data is not None}
+        cls.objects.bulk_create([cls(mes=mes) for mes in meses], ignore_conflicts=True)
+    
+    def __str__(self) -> str:
+        return f'{self.mes:%Y-%m}'
+
+class VersaoModelo(models.Model):
+    # Timestamp da última escrita em cada modelo (api.cache), gravado na mesma transação da escrita
+    # para que alterações feitas por qualquer processo invalidem os ETags e as respostas em cache
+    modelo = models.CharField(max_length=100, primary_key=True)
+    versao = models.FloatField()
     
     def __str__(self) -> str:
-        return str(self.id)
\ No newline at end of file
+        return self.modelo
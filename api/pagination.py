@@ -0,0 +1,78 @@
+from base64                    import urlsafe_b64decode, urlsafe_b64encode
+from django.conf               import settings
+from django.db.models          import Q
+from django.utils.dateparse    import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response   import Response
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    # Paginação opcional por (data, id): só pagina quando ?page_size= ou ?cursor=
+    # é informado, e cada página filtra a partir da última chave em vez de usar
+    # OFFSET, então o custo não cresce com a profundidade da página
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('data', 'id')
+
+    def get_page_size(self, request):
+        if self.page_size_query_param not in request.query_params and self.cursor_query_param not in request.query_params:
+            return None
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, settings.PAGINACAO_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.PAGINACAO_PAGE_SIZE
+        return max(1, min(page_size, settings.PAGINACAO_MAX_PAGE_SIZE))
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            data, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            data, id = parse_date(data), int(id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            data = None
+        if data is None:
+            raise NotFound('Cursor inválido.')
+        return data, id
+
+    def encode_cursor(self, data, id):
+        return urlsafe_b64encode(f'{data}|{id}'.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            data, id = cursor
+            # Mesma condição que (data, id) > cursor, escrita para o banco percorrer
+            # o índice (data, id) a partir do cursor sem ordenar o resultado
+            queryset = queryset.filter(Q(data__gte=data), Q(data__gt=data) | Q(id__gt=id))
+
+        # Uma linha a mais indica se existe próxima página
+        return queryset[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        # A próxima chave sai dos próprios campos serializados 'data' e 'id'
+        results = list(data[:self.page_size])
+        next = None
+        if len(data) > self.page_size:
+            ultima = results[-1]
+            url = self.request.build_absolute_uri()
+            next = replace_query_param(url, self.cursor_query_param, self.encode_cursor(ultima['data'], ultima['id']))
+        return Response({'next': next, 'results': results})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
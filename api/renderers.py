@@ -0,0 +1,27 @@
+from rest_framework           import renderers
+from .                        import export
+from .                        import instrumentacao
+
+class JSONRenderer(instrumentacao.RendererInstrumentadoMixin, renderers.JSONRenderer):
+    pass
+
+class ExportRenderer(instrumentacao.RendererInstrumentadoMixin, renderers.BaseRenderer):
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return export.serializa(data, self.format)
+
+class ParquetRenderer(ExportRenderer):
+    media_type = export.FORMATOS['parquet'][0]
+    format = 'parquet'
+
+class ArrowStreamRenderer(ExportRenderer):
+    media_type = export.FORMATOS['arrow'][0]
+    format = 'arrow'
+
+class CSVRenderer(ExportRenderer):
+    media_type = export.FORMATOS['csv'][0]
+    format = 'csv'
+    charset = 'utf-8'
@@ -0,0 +1,48 @@
+from dateutil.relativedelta import relativedelta
+from django.db              import transaction
+from django.db.models       import Count, Sum
+from .                      import models
+
+CODIGOS = list(models.HIERARQUIA_DENORMALIZADA.values())
+
+def meses_pendentes():
+    return set(models.MesPendente.objects.values_list('mes', flat=True))
+
+def todos_os_meses():
+    return models.Arrecadacao.objects.meses() | set(models.ArrecadacaoMensal.objects.values_list('mes', flat=True).distinct())
+
+def atualiza_mes(mes, batch_size=1000):
+    linhas = (
+        models.Arrecadacao.objects.filter(data__gte=mes, data__lt=mes + relativedelta(months=1))
+                                  .order_by()
+                                  .values('subclasse', 'setor', 'comercio', *CODIGOS)
+                                  .annotate(soma=Sum('valor'), contagem=Count('id'))
+    )
+    models.ArrecadacaoMensal.objects.filter(mes=mes).delete()
+    models.ArrecadacaoMensal.objects.bulk_create(
+        (
+            models.ArrecadacaoMensal(
+                mes=mes,
+                valor=linha['soma'],
+                quantidade=linha['contagem'],
+                subclasse_id=linha['subclasse'],
+                setor_id=linha['setor'],
+                comercio_id=linha['comercio'],
+                **{coluna: linha[coluna] for coluna in CODIGOS},
+            )
+            for linha in linhas
+        ),
+        batch_size=batch_size,
+    )
+    return len(linhas)
+
+def atualiza(completo=False):
+    # Recalcula apenas os meses marcados como pendentes (ou todos, se completo)
+    with transaction.atomic():
+        if completo:
+            meses = todos_os_meses()
+            models.MesPendente.objects.all().delete()
+        else:
+            meses = meses_pendentes()
+            models.MesPendente.objects.filter(mes__in=meses).delete()
+        return {mes: atualiza_mes(mes) for mes in sorted(meses)}
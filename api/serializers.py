@@ -1,6 +1,33 @@
+from time           import perf_counter
 from rest_framework import serializers
+from .              import instrumentacao
 from .              import models
 
+def numerico(params):
+    # ?numeric=1 pede os valores como números no JSON, sem o texto que o cliente teria de converter
+    return params.get('numeric', '').lower() in ('1', 'true')
+
+def representa_centavos(centavos, numerico=False):
+    # Mesmo texto do DecimalField de 2 casas do DRF, montado direto do inteiro. Como número,
+    # centavos / 100 é o float mais próximo, escrito no JSON com as mesmas 2 casas
+    if numerico:
+        return centavos / 100
+    sinal = '-' if centavos < 0 else ''
+    return f'{sinal}{abs(centavos) // 100}.{abs(centavos) % 100:02d}'
+
+class ValorField(serializers.DecimalField):
+    # Reais com 2 casas; com context['numerico'] sai como número em vez de texto
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=20, decimal_places=2, **kwargs)
+
+    def to_representation(self, value):
+        return representa_centavos(models.para_centavos(value), self.context.get('numerico', False))
+
+class CentavosField(ValorField):
+    # Mesma saída de ValorField para valores já em centavos (somas das agregações)
+    def to_representation(self, value):
+        return representa_centavos(value, self.context.get('numerico', False))
+
 class SecaoSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Secao
@@ -36,15 +63,121 @@ class ComercioSerializer(serializers.ModelSerializer):
         model = models.Comercio
         fields = '__all__'
         
-class ArrecadacaoSerializer(serializers.ModelSerializer):
-    secao = serializers.CharField(source='subclasse.classe.grupo.divisao.secao.codigo')
-    divisao = serializers.CharField(source='subclasse.classe.grupo.divisao.codigo')
-    grupo = serializers.CharField(source='subclasse.classe.grupo.codigo')
-    classe = serializers.CharField(source='subclasse.classe.codigo')
+class ListaInstrumentada(instrumentacao.SerializerInstrumentadoMixin, serializers.ListSerializer):
+    pass
+
+class ArrecadacaoSerializer(instrumentacao.SerializerInstrumentadoMixin, serializers.ModelSerializer):
+    valor = ValorField()
+    secao = serializers.CharField(source=models.HIERARQUIA['secao'].replace('__', '.'))
+    divisao = serializers.CharField(source=models.HIERARQUIA['divisao'].replace('__', '.'))
+    grupo = serializers.CharField(source=models.HIERARQUIA['grupo'].replace('__', '.'))
+    classe = serializers.CharField(source=models.HIERARQUIA['classe'].replace('__', '.'))
     subclasse = serializers.CharField(source='subclasse.codigo')
     setor = serializers.CharField(source='setor.descricao')
     comercio = serializers.CharField(source='comercio.descricao')
     
     class Meta:
         model = models.Arrecadacao
-        fields = ['id', 'valor', 'data', 'secao', 'divisao', 'grupo', 'classe', 'subclasse', 'setor', 'comercio']
+        fields = ['id', 'valor', 'data', 'secao', 'divisao', 'grupo', 'classe', 'subclasse', 'setor', 'comercio', 'atualizado_em']
+        list_serializer_class = ListaInstrumentada
+
+class ArrecadacaoLeituraSerializer:
+    # Caminho lido com values_list para cada campo de ArrecadacaoSerializer
+    caminhos = {
+        'id': 'id',
+        'valor': 'valor',
+        'data': 'data',
+        'secao': models.HIERARQUIA['secao'],
+        'divisao': models.HIERARQUIA['divisao'],
+        'grupo': models.HIERARQUIA['grupo'],
+        'classe': models.HIERARQUIA['classe'],
+        'subclasse': 'subclasse__codigo',
+        'setor': 'setor__descricao',
+        'comercio': 'comercio__descricao',
+        'atualizado_em': 'atualizado_em',
+    }
+
+    # O valor é lido como inteiro de centavos, sem criar um Decimal por linha
+    colunas = [models.centavos(caminho) if campo == 'valor' else caminho for campo, caminho in caminhos.items()]
+
+    # Leitura rápida para list/retrieve: monta dicionários a partir de tuplas do
+    # banco sem instanciar modelos nem percorrer os campos do ModelSerializer.
+    # Valor e datas saem no mesmo formato dos campos do DRF, então o JSON é idêntico
+    def __init__(self, queryset, many=False, numerico=False):
+        self.queryset = queryset
+        self.many = many
+        self.numerico = numerico
+        self.campo_data = serializers.DateField()
+        self.campo_atualizado_em = serializers.DateTimeField()
+
+    def registro(self, linha):
+        registro = dict(zip(self.caminhos, linha))
+        registro['valor'] = representa_centavos(registro['valor'], self.numerico)
+        registro['data'] = self.campo_data.to_representation(registro['data'])
+        registro['atualizado_em'] = self.campo_atualizado_em.to_representation(registro['atualizado_em'])
+        return registro
+
+    def linhas(self):
+        for linha in self.queryset.values_list(*self.colunas):
+            yield self.registro(linha)
+
+    async def alinhas(self, chunk_size=2_000):
+        # Mesmas linhas pelo ORM assíncrono, lidas em blocos de chunk_size. Só a montagem de cada
+        # registro conta como serialização; a espera pelo banco fica de fora
+        medicao = instrumentacao.Medicao.atual.get()
+        async for linha in self.queryset.values_list(*self.colunas).aiterator(chunk_size=chunk_size):
+            if medicao is None:
+                yield self.registro(linha)
+                continue
+            inicio = perf_counter()
+            registro = self.registro(linha)
+            medicao.serializacao_segundos += perf_counter() - inicio
+            yield registro
+
+    @property
+    def data(self):
+        with instrumentacao.serializacao():
+            linhas = list(self.linhas())
+        return linhas if self.many else linhas[0]
+
+class ArrecadacaoBulkSerializer(serializers.Serializer):
+    # Recebe códigos e descrições como na listagem; as chaves estrangeiras são
+    # resolvidas pelos dicionários em context['lookups'], montados uma vez por lote
+    valor = serializers.DecimalField(max_digits=20, decimal_places=2)
+    data = serializers.DateField()
+    subclasse = serializers.CharField()
+    setor = serializers.CharField()
+    comercio = serializers.CharField()
+
+    def validate(self, attrs):
+        lookups = self.context['lookups']
+        erros = {
+            campo: [f"'{attrs[campo]}' não encontrado."]
+            for campo in ('subclasse', 'setor', 'comercio')
+            if attrs[campo] not in lookups[campo]
+        }
+        if erros:
+            raise serializers.ValidationError(erros)
+        return attrs
+
+    def to_instance(self):
+        lookups = self.context['lookups']
+        return models.Arrecadacao(
+            valor=self.validated_data['valor'],
+            data=self.validated_data['data'],
+            subclasse_id=lookups['subclasse'][self.validated_data['subclasse']],
+            setor_id=lookups['setor'][self.validated_data['setor']],
+            comercio_id=lookups['comercio'][self.validated_data['comercio']],
+        )
+
+class AgregacaoSerializer(instrumentacao.SerializerInstrumentadoMixin, serializers.Serializer):
+    valor = CentavosField()
+    quantidade = serializers.IntegerField()
+
+    class Meta:
+        list_serializer_class = ListaInstrumentada
+
+    def to_representation(self, instance):
+        # As dimensões do agrupamento são repassadas como vieram do banco
+        dimensoes = {chave: valor for chave, valor in instance.items() if chave not in self.fields}
+        return {**dimensoes, **super().to_representation(instance)}
@@ -0,0 +1,63 @@
+from datetime  import date, timedelta
+import numpy   as np
+from django.db import connection, transaction
+from django.utils import timezone
+from .         import models
+
+SETORES = ['Primário', 'Secundário', 'Terciário']
+COMERCIOS = ['Comércio', 'Indústria', 'Serviço', 'Agropecuária e Pesca', 'Meio Ambiente']
+
+def gera_hierarquia(secoes=21, divisoes=4, grupos=3, classes=2, subclasses=2):
+    # Hierarquia CNAE sintética com códigos aninhados como os oficiais (G > 47 > 471 > 47110 > 4711001)
+    total_divisoes = 0
+    for indice_secao in range(secoes):
+        secao = models.Secao.objects.create(codigo=chr(ord('A') + indice_secao), descricao=f'Seção {indice_secao}')
+        for _ in range(divisoes):
+            total_divisoes += 1
+            divisao = models.Divisao.objects.create(codigo=f'{total_divisoes:02d}', descricao=f'Divisão {total_divisoes}', secao=secao)
+            for indice_grupo in range(grupos):
+                grupo = models.Grupo.objects.create(codigo=f'{divisao.codigo}{indice_grupo}', descricao=f'Grupo {divisao.codigo}{indice_grupo}', divisao=divisao)
+                for indice_classe in range(classes):
+                    classe = models.Classe.objects.create(codigo=f'{grupo.codigo}{indice_classe:02d}', descricao=f'Classe {grupo.codigo}{indice_classe:02d}', grupo=grupo)
+                    models.Subclasse.objects.bulk_create(
+                        models.Subclasse(codigo=f'{classe.codigo}{indice:02d}', descricao=f'Subclasse {classe.codigo}{indice:02d}', classe=classe)
+                        for indice in range(subclasses)
+                    )
+    for descricao in SETORES:
+        models.Setor.objects.get_or_create(descricao=descricao)
+    for descricao in COMERCIOS:
+        models.Comercio.objects.get_or_create(descricao=descricao)
+
+def gera_arrecadacoes(linhas, inicio=date(2015, 1, 1), dias=365 * 5, seed=0, lote=100_000):
+    # Insere direto com executemany: bulk_create passaria pelo compilador do ORM linha a linha
+    rng = np.random.default_rng(seed)
+    subclasses = list(models.Subclasse.objects.values_list(
+        'id', *(caminho.removeprefix('subclasse__') for caminho in models.HIERARQUIA_RELACIONAL.values())
+    ))
+    setores = list(models.Setor.objects.values_list('id', flat=True))
+    comercios = list(models.Comercio.objects.values_list('id', flat=True))
+
+    campos = ['valor', 'data', 'subclasse', 'setor', 'comercio', 'atualizado_em', *models.HIERARQUIA_DENORMALIZADA.values()]
+    colunas = [models.Arrecadacao._meta.get_field(campo).column for campo in campos]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(models.Arrecadacao._meta.db_table),
+        ', '.join(connection.ops.quote_name(coluna) for coluna in colunas),
+        ', '.join(['%s'] * len(colunas)),
+    )
+
+    agora = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        for deslocamento in range(0, linhas, lote):
+            quantidade = min(lote, linhas - deslocamento)
+            # Inseridos já como o inteiro de centavos guardado por CentavosField
+            centavos = np.rint(rng.lognormal(10, 2, quantidade) * 100).astype('int64').tolist()
+            datas = rng.integers(0, dias, quantidade)
+            indices_subclasse = rng.integers(0, len(subclasses), quantidade)
+            indices_setor = rng.integers(0, len(setores), quantidade)
+            indices_comercio = rng.integers(0, len(comercios), quantidade)
+            cursor.executemany(sql, [
+                (valor, inicio + timedelta(days=int(dia)), subclasses[subclasse][0], setores[setor], comercios[comercio], agora, *subclasses[subclasse][1:])
+                for valor, dia, subclasse, setor, comercio in zip(centavos, datas, indices_subclasse, indices_setor, indices_comercio)
+            ])
+
+    models.registra_alteracao(inicio + timedelta(days=dia) for dia in [*range(0, dias, 28), dias - 1])
@@ -0,0 +1,9 @@
+from django.conf import settings
+
+def aplica_pragmas(sender, connection, **kwargs):
+    # Conectado a connection_created em ApiConfig.ready(); ignora os demais bancos
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
@@ -1,3 +1,810 @@
-from django.test import TestCase
+import io
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from unittest                  import mock
+from asgiref.sync              import sync_to_async
+import pandas                  as pd
+import pyarrow                 as pa
+import pyarrow.parquet         as pq
+from datetime                  import date, timedelta
+from decimal                   import Decimal
+from django.core.cache         import cache as django_cache
+from django.core.management    import CommandError, call_command
+from django.db                 import connection, transaction
+from django.db.models          import Sum
+from django.test               import TestCase, TransactionTestCase, override_settings
+from django.utils.http         import http_date
+from rest_framework            import serializers as rest_serializers
+from rest_framework.renderers  import JSONRenderer
+from rest_framework.test       import APIClient
+import analise
+import sincronizacao
+from hierarquia                import IndiceHierarquia
+from .                         import aggregations
+from .                         import cache
+from .                         import export
+from .                         import instrumentacao
+from .                         import models
+from .                         import rollup
+from .                         import serializers
+from .                         import sintetico
+from .management.commands      import benchmark
 
-# Create your tests here.
+def cria_hierarquia(sufixo='1', secao=None):
+    secao = secao or models.Secao.objects.create(codigo='G', descricao='Comércio; reparação de veículos')
+    divisao = models.Divisao.objects.create(codigo=f'4{sufixo}', descricao=f'Divisão {sufixo}', secao=secao)
+    grupo = models.Grupo.objects.create(codigo=f'4{sufixo}1', descricao=f'Grupo {sufixo}', divisao=divisao)
+    classe = models.Classe.objects.create(codigo=f'4{sufixo}11', descricao=f'Classe {sufixo}', grupo=grupo)
+    return models.Subclasse.objects.create(codigo=f'4{sufixo}1130', descricao=f'Subclasse {sufixo}', classe=classe)
+
+# Recursos ligados por configuração ficam fixos nos testes, independentes das variáveis de ambiente;
+# as classes que exercitam o cache de respostas ou as métricas os ligam explicitamente
+CONFIGURACAO = {'ROLLUP_MENSAL': True, 'RESPOSTA_CACHE': False, 'METRICAS': False, 'SERIALIZADOR_RAPIDO': True}
+
+@override_settings(**CONFIGURACAO)
+class ArrecadacaoTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subclasse = cria_hierarquia('5')
+        cls.outra_subclasse = cria_hierarquia('7', secao=cls.subclasse.classe.grupo.divisao.secao)
+        cls.setor = models.Setor.objects.create(descricao='Terciário')
+        cls.comercio = models.Comercio.objects.create(descricao='Comércio')
+        cls.industria = models.Comercio.objects.create(descricao='Indústria')
+
+        for subclasse, comercio, data, valor in (
+            (cls.subclasse, cls.comercio, date(2020, 1, 1), '100.10'),
+            (cls.subclasse, cls.comercio, date(2020, 1, 15), '50.05'),
+            (cls.subclasse, cls.industria, date(2020, 2, 1), '200.00'),
+            (cls.outra_subclasse, cls.comercio, date(2021, 3, 1), '10.00'),
+        ):
+            models.Arrecadacao.objects.create(subclasse=subclasse, setor=cls.setor, comercio=comercio, data=data, valor=Decimal(valor))
+
+    def setUp(self):
+        # Respostas em cache não são desfeitas com a transação de cada teste
+        django_cache.clear()
+        self.client = APIClient()
+
+class AggregateTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/aggregate/'
+
+    def test_total_sem_agrupamento(self):
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), [{'valor': '360.15', 'quantidade': 4}])
+
+    def test_agrupa_por_comercio_e_mes(self):
+        resposta = self.client.get(self.url, {'group_by': 'comercio,month', 'start': '2020-01-01', 'end': '2020-12-31'})
+        self.assertEqual(resposta.json(), [
+            {'comercio': 'Comércio', 'month': '2020-01-01', 'valor': '150.15', 'quantidade': 2},
+            {'comercio': 'Indústria', 'month': '2020-02-01', 'valor': '200.00', 'quantidade': 1},
+        ])
+
+    def test_filtra_por_codigo_da_hierarquia(self):
+        resposta = self.client.get(self.url, {'group_by': 'divisao', 'secao': 'G'})
+        self.assertEqual(resposta.json(), [
+            {'divisao': '45', 'valor': '350.15', 'quantidade': 3},
+            {'divisao': '47', 'valor': '10.00', 'quantidade': 1},
+        ])
+
+    def test_rejeita_dimensao_invalida(self):
+        resposta = self.client.get(self.url, {'group_by': 'comercio,foo'})
+        self.assertEqual(resposta.status_code, 400)
+
+class TimeSeriesTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/timeseries/'
+
+    def test_semanal(self):
+        resposta = self.client.get(self.url, {'freq': 'W', 'data__lte': '2020-01-31'})
+        self.assertEqual(resposta.json(), [
+            {'periodo': '2019-12-30', 'valor': '100.10', 'quantidade': 1},
+            {'periodo': '2020-01-13', 'valor': '50.05', 'quantidade': 1},
+        ])
+
+    def test_top_n_agrupa_demais_series_em_outros(self):
+        resposta = self.client.get(self.url, {'freq': 'Y', 'series': 'comercio', 'top_n': 1})
+        self.assertEqual(resposta.json(), [
+            {'periodo': '2020-01-01', 'comercio': 'Indústria', 'valor': '200.00', 'quantidade': 1},
+            {'periodo': '2020-01-01', 'comercio': 'Outros', 'valor': '150.15', 'quantidade': 2},
+            {'periodo': '2021-01-01', 'comercio': 'Outros', 'valor': '10.00', 'quantidade': 1},
+        ])
+
+    def test_trimestral_pelo_rollup_igual_a_tabela_base(self):
+        rollup.atualiza()
+        params = {'freq': 'Q', 'series': 'divisao', 'start': '2020-01-01', 'end': '2021-12-31'}
+        resposta = self.client.get(self.url, params).json()
+        with self.settings(ROLLUP_MENSAL=False, RESPOSTA_CACHE=False):
+            self.assertEqual(self.client.get(self.url, params).json(), resposta)
+        self.assertEqual(resposta, [
+            {'periodo': '2020-01-01', 'divisao': '45', 'valor': '350.15', 'quantidade': 3},
+            {'periodo': '2021-01-01', 'divisao': '47', 'valor': '10.00', 'quantidade': 1},
+        ])
+
+    def test_rejeita_parametros_invalidos(self):
+        for params in ({'freq': 'H'}, {'series': 'month'}, {'top_n': '-1'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+class ExecutorSequencial:
+    # Substitui o ThreadPoolExecutor de api.aggregations, rodando as faixas na thread do teste
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def map(self, funcao, itens):
+        return map(funcao, itens)
+
+@override_settings(**CONFIGURACAO)
+class AgregacaoParalelaTests(TransactionTestCase):
+    # Fora de um bloco atômico, já que dentro de um agrega() nunca divide o período
+    def setUp(self):
+        subclasses = [cria_hierarquia('5'), cria_hierarquia('7', secao=models.Secao.objects.get())]
+        setor = models.Setor.objects.create(descricao='Terciário')
+        comercios = [models.Comercio.objects.create(descricao='Comércio'), models.Comercio.objects.create(descricao='Indústria')]
+        models.Arrecadacao.objects.bulk_create(
+            models.Arrecadacao(subclasse=subclasses[dia % 2], setor=setor, comercio=comercios[dia % 3 == 0],
+                               data=date(2020, 1, 1) + timedelta(days=dia * 7), valor=Decimal(dia) + Decimal('0.25'))
+            for dia in range(110)
+        )
+
+    def test_particoes_contiguas(self):
+        with self.settings(AGREGACAO_MESES_MINIMOS=2):
+            campo, faixas = aggregations.particoes(models.Arrecadacao.objects.all(), 4, inicio=date(2020, 3, 10))
+        self.assertEqual(campo, 'data')
+        self.assertEqual(faixas[0][0], date(2020, 3, 10))
+        self.assertEqual(faixas[-1][1], date(2022, 2, 2))
+        for (_, ate), (de, _) in zip(faixas, faixas[1:]):
+            self.assertEqual(ate + timedelta(days=1), de)
+
+    def test_paralelo_igual_ao_sequencial(self):
+        # O banco de teste fica em memória, onde agrega() não abre outras conexões; as faixas
+        # são agregadas em sequência, mas divididas e combinadas como no caminho paralelo
+        queryset = models.Arrecadacao.objects.all()
+        with self.settings(AGREGACAO_MESES_MINIMOS=2), mock.patch.object(aggregations, 'em_memoria', return_value=False), \
+             mock.patch.object(aggregations, 'ThreadPoolExecutor', ExecutorSequencial):
+            self.assertEqual(len(aggregations.particoes(queryset, 6)[1]), 6)
+            for dimensoes in ([], ['comercio', 'year'], ['week'], ['divisao', 'month']):
+                self.assertEqual(aggregations.agrega(queryset, dimensoes, workers=3), aggregations.agrega(queryset, dimensoes, workers=1))
+            # Uma consulta pelos limites do período e uma por faixa
+            with self.assertNumQueries(7):
+                aggregations.agrega(queryset, ['comercio'], workers=3)
+
+    def test_periodo_curto_ou_transacao_agregam_em_sequencia(self):
+        queryset = models.Arrecadacao.objects.all()
+        self.assertEqual(aggregations.particoes(queryset, 4, inicio=date(2021, 1, 1), fim=date(2021, 6, 30))[1], [])
+        with transaction.atomic(), self.assertNumQueries(1):
+            aggregations.agrega(queryset, ['comercio'], workers=4)
+        with self.settings(AGREGACAO_MESES_MINIMOS=2), self.assertNumQueries(1):
+            aggregations.agrega(queryset, ['comercio'], workers=4)
+
+class ArrecadacaoFilterTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/'
+
+    def ids(self, **params):
+        resposta = self.client.get(self.url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return sorted(linha['valor'] for linha in resposta.json())
+
+    def test_intervalo_de_datas(self):
+        self.assertEqual(self.ids(data__gte='2020-01-10', data__lte='2020-12-31'), ['200.00', '50.05'])
+
+    def test_comercio_in_por_descricao(self):
+        self.assertEqual(self.ids(comercio__in='Indústria'), ['200.00'])
+        self.assertEqual(len(self.ids(comercio__in='Comércio,Indústria')), 4)
+
+    def test_codigos_da_hierarquia(self):
+        self.assertEqual(self.ids(secao='G'), ['10.00', '100.10', '200.00', '50.05'])
+        self.assertEqual(self.ids(divisao='47'), ['10.00'])
+        self.assertEqual(self.ids(grupo__in='451,999'), ['100.10', '200.00', '50.05'])
+        self.assertEqual(self.ids(subclasse__codigo='471130'), ['10.00'])
+
+    def test_prefixo_cnae(self):
+        self.assertEqual(self.ids(cnae='471'), ['10.00'])
+        self.assertEqual(self.ids(subclasse__codigo__startswith='45'), ['100.10', '200.00', '50.05'])
+
+class HierarquiaDenormalizadaTests(ArrecadacaoTestCase):
+    def codigos(self, arrecadacao):
+        return [getattr(arrecadacao, coluna) for coluna in models.HIERARQUIA_DENORMALIZADA.values()]
+
+    def test_save_preenche_codigos(self):
+        arrecadacao = models.Arrecadacao.objects.filter(subclasse=self.subclasse).first()
+        self.assertEqual(self.codigos(arrecadacao), ['G', '45', '451', '4511'])
+
+        arrecadacao.subclasse = self.outra_subclasse
+        arrecadacao.save(update_fields=['subclasse'])
+        arrecadacao.refresh_from_db()
+        self.assertEqual(self.codigos(arrecadacao), ['G', '47', '471', '4711'])
+
+    def test_bulk_create_preenche_codigos(self):
+        models.Arrecadacao.objects.bulk_create([
+            models.Arrecadacao(subclasse=self.outra_subclasse, setor=self.setor, comercio=self.comercio, data=date(2022, 1, 1), valor=Decimal('1.00'))
+        ])
+        arrecadacao = models.Arrecadacao.objects.get(data=date(2022, 1, 1))
+        self.assertEqual(self.codigos(arrecadacao), ['G', '47', '471', '4711'])
+
+    def test_mudanca_na_hierarquia_propaga_codigos(self):
+        rollup.atualiza(completo=True)
+        nova = cria_hierarquia('8', secao=models.Secao.objects.create(codigo='H', descricao='Transporte'))
+        resposta = self.client.patch(f'/api/v1/subclasse/{self.subclasse.pk}/', {'classe': nova.classe_id}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+
+        arrecadacoes = models.Arrecadacao.objects.filter(subclasse=self.subclasse)
+        self.assertEqual({tuple(self.codigos(arrecadacao)) for arrecadacao in arrecadacoes}, {('H', '48', '481', '4811')})
+        self.assertEqual(models.Arrecadacao.objects.filter(classe_codigo='4811').count(), 3)
+        self.assertEqual(rollup.meses_pendentes(), {date(2020, 1, 1), date(2020, 2, 1)})
+        rollup.atualiza()
+        self.assertEqual(models.ArrecadacaoMensal.objects.filter(secao_codigo='H').count(), 2)
+
+        # Trocar o código de um nível acima também propaga; salvar sem mudanças não regrava nada
+        models.Secao.objects.filter(codigo='H').get().save()
+        self.assertEqual(rollup.meses_pendentes(), set())
+        secao = models.Secao.objects.get(codigo='H')
+        secao.codigo = 'I'
+        secao.save()
+        self.assertEqual(models.Arrecadacao.objects.filter(secao_codigo='I').count(), 3)
+        self.assertEqual(rollup.meses_pendentes(), {date(2020, 1, 1), date(2020, 2, 1)})
+
+    def test_atualiza_hierarquia(self):
+        models.Arrecadacao.objects.update(secao_codigo='', classe_codigo='')
+        models.Arrecadacao.objects.atualiza_hierarquia()
+        self.assertFalse(models.Arrecadacao.objects.filter(secao_codigo='').exists())
+        self.assertEqual(models.Arrecadacao.objects.filter(classe_codigo='4711').count(), 1)
+
+@override_settings(ROLLUP_MENSAL=True)
+class ArrecadacaoMensalTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/aggregate/'
+
+    def test_escritas_marcam_meses_pendentes(self):
+        rollup.atualiza(completo=True)
+        self.assertFalse(models.MesPendente.objects.exists())
+
+        models.Arrecadacao.objects.filter(data=date(2021, 3, 1)).update(valor=Decimal('11.00'))
+        self.assertEqual(rollup.meses_pendentes(), {date(2021, 3, 1)})
+
+        rollup.atualiza()
+        self.assertFalse(models.MesPendente.objects.exists())
+        self.assertEqual(models.ArrecadacaoMensal.objects.get(mes=date(2021, 3, 1)).valor, Decimal('11.00'))
+
+    def test_atualiza_hierarquia_marca_meses_pendentes(self):
+        rollup.atualiza(completo=True)
+        models.Arrecadacao.objects.filter(data__year=2021).atualiza_hierarquia()
+        self.assertEqual(rollup.meses_pendentes(), set(models.Arrecadacao.objects.filter(data__year=2021).meses()))
+
+    def test_agregacao_usa_tabela_mensal_quando_possivel(self):
+        rollup.atualiza()
+        parametros = {'group_by': 'comercio,month', 'start': '2020-01-01', 'end': '2020-12-31'}
+        with self.assertNumQueries(2):
+            mensal = self.client.get(self.url, parametros).json()
+        with self.settings(ROLLUP_MENSAL=False):
+            self.assertEqual(self.client.get(self.url, parametros).json(), mensal)
+
+    def test_agregacao_usa_tabela_base_com_mes_pendente(self):
+        rollup.atualiza()
+        models.Arrecadacao.objects.create(subclasse=self.subclasse, setor=self.setor, comercio=self.comercio, data=date(2020, 1, 20), valor=Decimal('1.00'))
+        resposta = self.client.get(self.url, {'group_by': 'month', 'end': '2020-01-31'})
+        self.assertEqual(resposta.json(), [{'month': '2020-01-01', 'valor': '151.15', 'quantidade': 3}])
+
+class LoadArrecadacaoTests(ArrecadacaoTestCase):
+    def carrega(self, conteudo, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        self.addCleanup(os.remove, arquivo.name)
+        call_command('load_arrecadacao', arquivo.name, *args, stdout=io.StringIO())
+
+    def test_carrega_csv_em_lotes(self):
+        self.carrega(
+            'valor;data;subclasse;setor;comercio\n'
+            '1,50;2022-05-01;451130;Terciário;Comércio\n'
+            '2,25;2022-05-02;471130;Terciário;Indústria\n'
+            '3,00;2022-06-01;471130;Terciário;Indústria\n',
+            '--delimiter', ';', '--decimal-point', ',', '--batch-size', '2',
+        )
+        carregadas = models.Arrecadacao.objects.filter(data__year=2022).order_by('data')
+        self.assertEqual([arrecadacao.valor for arrecadacao in carregadas], [Decimal('1.50'), Decimal('2.25'), Decimal('3.00')])
+        self.assertEqual([arrecadacao.divisao_codigo for arrecadacao in carregadas], ['45', '47', '47'])
+        self.assertLessEqual({date(2022, 5, 1), date(2022, 6, 1)}, rollup.meses_pendentes())
+
+    def test_codigo_desconhecido(self):
+        conteudo = 'valor,data,subclasse,setor,comercio\n1.00,2022-05-01,9999999,Terciário,Comércio\n'
+        with self.assertRaises(CommandError):
+            self.carrega(conteudo)
+        self.carrega(conteudo, '--skip-unknown')
+        self.assertFalse(models.Arrecadacao.objects.filter(data__year=2022).exists())
+
+class SQLitePragmasTests(TestCase):
+    def test_pragmas_aplicados_na_conexao(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64_000)
+
+class CopyDatabaseTests(TransactionTestCase):
+    # Sem a transação de TestCase, para o backup do banco de teste poder ser feito
+    def test_copia_sqlite_para_banco_vazio(self):
+        subclasse = cria_hierarquia('5')
+        setor = models.Setor.objects.create(descricao='Terciário')
+        comercio = models.Comercio.objects.create(descricao='Comércio')
+        for data, valor in ((date(2020, 1, 1), '100.10'), (date(2020, 1, 15), '50.05'), (date(2020, 2, 1), '200.00')):
+            models.Arrecadacao.objects.create(subclasse=subclasse, setor=setor, comercio=comercio, data=data, valor=Decimal(valor))
+        rollup.atualiza()
+        modelos = [models.Secao, models.Divisao, models.Grupo, models.Classe, models.Subclasse, models.Setor,
+                   models.Comercio, models.Arrecadacao, models.ArrecadacaoMensal, models.MesPendente]
+        esperado = {model: list(model.objects.order_by('pk').values()) for model in modelos}
+
+        # O próprio banco de teste vira o arquivo de origem, e as tabelas de destino são esvaziadas
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = os.path.join(diretorio, 'origem.sqlite3')
+            destino = sqlite3.connect(arquivo)
+            connection.connection.backup(destino)
+            destino.close()
+            with connection.cursor() as cursor:
+                for model in reversed(modelos):
+                    cursor.execute(f'DELETE FROM {model._meta.db_table}')
+
+            call_command('copy_database', arquivo, '--batch-size', '2', stdout=io.StringIO())
+            with self.assertRaises(CommandError):
+                call_command('copy_database', arquivo, stdout=io.StringIO())
+
+        for model in modelos:
+            self.assertEqual(list(model.objects.order_by('pk').values()), esperado[model])
+        # A sequência continua depois dos ids copiados
+        self.assertGreater(models.Setor.objects.create(descricao='Novo').pk, max(setor['id'] for setor in esperado[models.Setor]))
+
+@override_settings(**CONFIGURACAO)
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.comando = benchmark.Command()
+
+    def test_mede_caminhos_com_dados_sinteticos(self):
+        sintetico.gera_hierarquia(secoes=7, divisoes=1, grupos=1, classes=1, subclasses=2)
+        sintetico.gera_arrecadacoes(500)
+        resultados = self.comando.mede_tamanho(APIClient(), {'repeat': 1, 'serializer_rows': 100})
+        for nome in ('api_lista', 'api_agregacao', 'filtro_secao', 'serializer', 'dashboard_carga', 'dashboard_drill_down'):
+            self.assertGreater(resultados[nome]['segundos'], 0)
+        self.assertEqual(resultados['serializer']['linhas'], 100)
+        self.assertGreater(resultados['api_lista']['memoria_pico'], 0)
+
+    def test_listagem_percorre_todas_as_paginas(self):
+        sintetico.gera_hierarquia(secoes=1, divisoes=1, grupos=1, classes=1, subclasses=1)
+        sintetico.gera_arrecadacoes(250)
+        with mock.patch.object(benchmark, 'PAGINA', 100):
+            resultados = self.comando.mede_api(APIClient(), 1)
+        self.assertEqual(resultados['api_lista']['paginas'], 3)
+        self.assertEqual(resultados['api_agregacao']['paginas'], 1)
+
+    def test_serializers_precisam_responder_igual(self):
+        sintetico.gera_hierarquia(secoes=1, divisoes=1, grupos=1, classes=1, subclasses=1)
+        sintetico.gera_arrecadacoes(50)
+        self.assertEqual(self.comando.mede_serializers(20, 1)['serializer_leitura']['linhas'], 20)
+        registro = serializers.ArrecadacaoLeituraSerializer.registro
+        with mock.patch.object(serializers.ArrecadacaoLeituraSerializer, 'registro', lambda self, linha: {**registro(self, linha), 'valor': '0.00'}), \
+             self.assertRaises(CommandError):
+            self.comando.mede_serializers(20, 1)
+
+    def test_compara_com_referencia(self):
+        referencia = {'1000': {'api_lista': {'segundos': 0.5, 'memoria_pico': 10_000_000}, 'filtro_secao': {'segundos': 0.001}}}
+        atual = {
+            '1000': {'api_lista': {'segundos': 0.55, 'memoria_pico': 20_000_000}, 'filtro_secao': {'segundos': 0.004}, 'api_serie': {'segundos': 9}},
+            '10000': {'api_lista': {'segundos': 5}},
+        }
+        # 10% de piora no tempo fica no limite, o dobro da memória não; tempos de milissegundos e medições novas são ignorados
+        self.assertEqual(self.comando.compara(atual, referencia, 0.2), [('1000', 'api_lista', 'memoria_pico', 10_000_000, 20_000_000)])
+        self.assertEqual(len(self.comando.compara(atual, referencia, 0.05)), 2)
+
+class BulkTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/bulk/'
+
+    def item(self, valor, data='2020-01-01', subclasse='451130', comercio='Comércio'):
+        return {'valor': valor, 'data': data, 'subclasse': subclasse, 'setor': 'Terciário', 'comercio': comercio}
+
+    def test_insere_lote_e_devolve_erros_por_linha(self):
+        resposta = self.client.post(self.url, [self.item('1.00', data='2023-01-01'), self.item('x'), self.item('2.00', subclasse='0000000')], format='json')
+        self.assertEqual(resposta.status_code, 207)
+        self.assertEqual(resposta.json()['criados'], 1)
+        self.assertEqual([erro['indice'] for erro in resposta.json()['erros']], [1, 2])
+        self.assertIn('subclasse', resposta.json()['erros'][1]['erros'])
+        self.assertTrue(models.Arrecadacao.objects.filter(data=date(2023, 1, 1), divisao_codigo='45').exists())
+
+    def test_upsert_atualiza_pela_chave(self):
+        resposta = self.client.post(self.url + '?on_conflict=update', [self.item('999.99'), self.item('5.00', data='2023-02-01')], format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.json(), {'criados': 1, 'atualizados': 1, 'ignorados': 0, 'erros': []})
+        self.assertEqual(models.Arrecadacao.objects.get(data=date(2020, 1, 1)).valor, Decimal('999.99'))
+
+    def test_ignora_existentes(self):
+        resposta = self.client.post(self.url + '?on_conflict=ignore', [self.item('999.99')], format='json')
+        self.assertEqual(resposta.json()['ignorados'], 1)
+        self.assertEqual(models.Arrecadacao.objects.get(data=date(2020, 1, 1)).valor, Decimal('100.10'))
+
+class ExportTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/export/'
+
+    def baixa(self, **params):
+        resposta = self.client.get(self.url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content)
+
+    def test_parquet_igual_a_listagem(self):
+        with self.settings(EXPORT_CHUNK_SIZE=3):
+            tabela = pq.read_table(io.BytesIO(self.baixa(format='parquet', secao='G')))
+        listagem = sorted(self.client.get('/api/v1/arrecadacao/', {'secao': 'G'}).json(), key=lambda linha: linha['id'])
+        atualizado_em = rest_serializers.DateTimeField()
+        exportado = [
+            {**linha, 'valor': str(linha['valor']), 'data': linha['data'].isoformat(), 'atualizado_em': atualizado_em.to_representation(linha['atualizado_em'])}
+            for linha in tabela.to_pylist()
+        ]
+        self.assertEqual(exportado, listagem)
+
+    def test_arrow_e_csv(self):
+        self.assertEqual(pa.ipc.open_stream(self.baixa(format='arrow', comercio__in='Indústria')).read_all().num_rows, 1)
+        csv = self.baixa(format='csv', data__gte='2021-01-01').decode()
+        self.assertEqual(csv.splitlines()[1].split(',')[1:3], ['10.00', '2021-03-01'])
+
+class AsyncViewsTests(ArrecadacaoTestCase):
+    url = '/api/v1/async/arrecadacao/'
+
+    async def conteudo(self, resposta):
+        return b''.join([parte async for parte in resposta.streaming_content])
+
+    async def test_listagem_igual_a_sincrona(self):
+        for params in ({}, {'secao': 'G', 'data__gte': '2020-01-15'}, {'comercio__in': 'Nenhum'}):
+            resposta = await self.async_client.get(self.url, params)
+            self.assertEqual(resposta.status_code, 200)
+            sincrona = await sync_to_async(self.client.get)('/api/v1/arrecadacao/', params)
+            self.assertEqual(await self.conteudo(resposta), sincrona.content)
+
+    async def test_aggregate_igual_a_sincrona(self):
+        for params in ({}, {'group_by': 'comercio,month', 'start': '2020-01-01', 'end': '2020-12-31'}):
+            resposta = await self.async_client.get(self.url + 'aggregate/', params)
+            sincrona = await sync_to_async(self.client.get)('/api/v1/arrecadacao/aggregate/', params)
+            self.assertEqual(resposta.content, sincrona.content)
+        resposta = await self.async_client.get(self.url + 'aggregate/', {'group_by': 'foo'})
+        self.assertEqual(resposta.status_code, 400)
+
+    async def test_export_igual_a_sincrona(self):
+        for formato in export.FORMATOS:
+            resposta = await self.async_client.get(self.url + 'export/', {'format': formato, 'secao': 'G'})
+            self.assertEqual(resposta['Content-Type'], export.FORMATOS[formato][0])
+            sincrona = await sync_to_async(self.client.get)('/api/v1/arrecadacao/export/', {'format': formato, 'secao': 'G'})
+            self.assertEqual(await self.conteudo(resposta), await sync_to_async(b''.join)(sincrona.streaming_content))
+
+class AnaliseBackendsTests(ArrecadacaoTestCase):
+    # Os cálculos do dashboard dão o mesmo resultado sobre as linhas da API (pandas) e pelas agregações da API
+    def busca(self, caminho, params):
+        resposta = self.client.get(f'/api/v1/{caminho}', params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def test_backends_equivalentes(self):
+        dados = analise.compacta(pd.DataFrame.from_records(self.busca('arrecadacao/', {}), columns=analise.COLUNAS))
+        backends = [analise.BackendPandas(dados, IndiceHierarquia(dados, {})), analise.BackendAPI(self.busca)]
+        for filtro in (
+            analise.Filtro(date(2020, 1, 1), date(2021, 12, 31)),
+            analise.Filtro(date(2020, 1, 10), date(2021, 12, 31), ('Comércio',)),
+            analise.Filtro(date(2020, 1, 1), date(2021, 12, 31), (), 'divisao', '45'),
+            analise.Filtro(date(2020, 1, 1), date(2021, 12, 31), ('Indústria',), 'subclasse', '471130'),
+        ):
+            pandas, api = backends
+            pd.testing.assert_frame_equal(pandas.receita_comercio(filtro), api.receita_comercio(filtro))
+            pd.testing.assert_series_equal(pd.Series(pandas.metricas(filtro)), pd.Series(api.metricas(filtro)))
+            for opcoes in ({'freq': 'M'}, {'freq': 'W', 'serie_por': 'comercio'}, {'freq': 'Q', 'serie_por': 'divisao', 'top_n': 1}):
+                pd.testing.assert_frame_equal(pandas.serie(filtro, **opcoes), api.serie(filtro, **opcoes))
+
+class SincronizacaoTests(ArrecadacaoTestCase):
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.local = sincronizacao.CacheLocal(diretorio.name, self.busca, self.busca_paginas, margem=timedelta(0), workers=1)
+
+    def busca(self, caminho, params):
+        return self.client.get(f'/api/v1/{caminho}', params).json()
+
+    def busca_paginas(self, params):
+        linhas, proxima, params = [], '/api/v1/arrecadacao/', {**params, 'page_size': 2}
+        while proxima:
+            pagina = self.client.get(proxima, params).json()
+            linhas.extend(pagina['results'])
+            proxima, params = pagina['next'], None
+        return linhas
+
+    def assertIgualAPI(self, **params):
+        local = self.local.carrega(date(2020, 1, 1), date(2021, 12, 31), **params)
+        api = analise.compacta(pd.DataFrame.from_records(self.busca('arrecadacao/', {}), columns=analise.COLUNAS))
+        api = analise.filtra(api, analise.Filtro(date(2020, 1, 1), date(2021, 12, 31), tuple(params.get('comercios', ()))))
+        registros = lambda dados: dados.sort_values('id').astype(object).to_dict('records')
+        self.assertEqual(registros(local), registros(api))
+
+    def test_sincronizacao_incremental(self):
+        self.assertEqual(self.local.sincroniza(), 4)
+        self.assertIgualAPI()
+        self.assertIgualAPI(comercios=('Indústria',))
+
+        # Sem alterações só volta a linha da própria marca d'água (?since= inclui o instante)
+        marca = models.Arrecadacao.objects.order_by('-atualizado_em').values_list('atualizado_em', flat=True).first()
+        self.assertEqual(self.local.sincroniza(), models.Arrecadacao.objects.filter(atualizado_em__gte=marca).count())
+
+        models.Arrecadacao.objects.create(subclasse=self.subclasse, setor=self.setor, comercio=self.industria, data=date(2020, 2, 10), valor=Decimal('5.00'))
+        models.Arrecadacao.objects.filter(data=date(2020, 1, 1)).update(valor=Decimal('99.99'))
+        models.Arrecadacao.objects.filter(data=date(2021, 3, 1)).delete()
+        self.assertEqual(self.local.sincroniza(), models.Arrecadacao.objects.filter(atualizado_em__gte=marca).count())
+        self.assertIgualAPI()
+        self.assertEqual(sorted(arquivo.name for arquivo in self.local.diretorio.glob('*.parquet')), ['2020-01.parquet', '2020-02.parquet'])
+
+        # A linha que muda de mês sai do mês antigo, que não bate com os totais da API e é baixado de novo
+        marca = models.Arrecadacao.objects.order_by('-atualizado_em').values_list('atualizado_em', flat=True).first()
+        arrecadacao = models.Arrecadacao.objects.get(data=date(2020, 1, 15))
+        arrecadacao.data = date(2020, 2, 15)
+        arrecadacao.save()
+        janeiro = models.Arrecadacao.objects.filter(data__lt=date(2020, 2, 1)).count()
+        self.assertEqual(self.local.sincroniza(), models.Arrecadacao.objects.filter(atualizado_em__gte=marca).count() + janeiro)
+        self.assertIgualAPI()
+
+    def test_since_filtra_pela_ultima_escrita(self):
+        antes = models.Arrecadacao.objects.order_by('-atualizado_em').values_list('atualizado_em', flat=True).first()
+        self.assertEqual(len(self.busca('arrecadacao/', {'since': (antes + timedelta(microseconds=1)).isoformat()})), 0)
+        models.Arrecadacao.objects.bulk_upsert([models.Arrecadacao(subclasse=self.subclasse, setor=self.setor, comercio=self.industria, data=date(2020, 2, 1), valor=Decimal('1.00'))])
+        alteradas = self.busca('arrecadacao/', {'since': (antes + timedelta(microseconds=1)).isoformat()})
+        self.assertEqual([(linha['data'], linha['valor']) for linha in alteradas], [('2020-02-01', '1.00')])
+        self.assertEqual(self.client.get('/api/v1/arrecadacao/', {'since': 'ontem'}).status_code, 400)
+
+@override_settings(METRICAS=True, METRICAS_AMOSTRAGEM=1.0)
+class InstrumentacaoTests(ArrecadacaoTestCase):
+    def setUp(self):
+        super().setUp()
+        instrumentacao.registro.limpa()
+
+    def test_histogramas_por_endpoint(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/v1/arrecadacao/').status_code, 200)
+        self.client.get('/api/v1/arrecadacao/aggregate/', {'group_by': 'comercio'})
+
+        resumo = self.client.get('/api/v1/metrics.json').json()
+        self.assertEqual(set(resumo), {'arrecadacao-list', 'arrecadacao-aggregate'})
+        lista = resumo['arrecadacao-list']
+        self.assertEqual(lista['requisicao_segundos']['contagem'], 2)
+        self.assertGreaterEqual(lista['sql_consultas']['media'], 1)
+        self.assertGreater(lista['serializacao_segundos']['soma'], 0)
+        self.assertEqual(lista['resposta_bytes']['soma'], 2 * len(self.client.get('/api/v1/arrecadacao/').content))
+
+        texto = self.client.get('/api/v1/metrics/')
+        self.assertTrue(texto['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE api_sql_consultas histogram', texto.content.decode())
+        self.assertIn('api_requisicao_segundos_bucket{endpoint="arrecadacao-aggregate",le="+Inf"} 1', texto.content.decode())
+
+    def test_amostragem_e_desativacao(self):
+        for configuracao in ({'METRICAS_AMOSTRAGEM': 0}, {'METRICAS': False}):
+            with self.settings(**configuracao):
+                self.client.get('/api/v1/arrecadacao/')
+        self.assertEqual(instrumentacao.registro.resumo(), {})
+
+    def test_requisicao_lenta_vai_para_o_log_com_sql(self):
+        with self.settings(METRICAS_LENTA_SEGUNDOS=0), self.assertLogs('api.instrumentacao', 'WARNING') as logs:
+            self.client.get('/api/v1/arrecadacao/', {'secao': 'G'})
+        self.assertIn('/api/v1/arrecadacao/?secao=G', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_streaming_medido_ate_o_fim_do_corpo(self):
+        resposta = self.client.get('/api/v1/arrecadacao/export/', {'format': 'csv'})
+        self.assertEqual(instrumentacao.registro.resumo(), {})
+        corpo = b''.join(resposta.streaming_content)
+        metricas = instrumentacao.registro.resumo()['arrecadacao-export']
+        self.assertGreaterEqual(metricas['sql_consultas']['soma'], 1)
+        self.assertEqual(metricas['resposta_bytes']['soma'], len(corpo))
+
+    async def test_streaming_assincrono_medido_ate_o_fim_do_corpo(self):
+        resposta = await self.async_client.get('/api/v1/async/arrecadacao/')
+        corpo = b''.join([parte async for parte in resposta.streaming_content])
+        metricas = instrumentacao.registro.resumo()['arrecadacao-async-list']
+        self.assertGreaterEqual(metricas['sql_consultas']['soma'], 1)
+        self.assertGreater(metricas['serializacao_segundos']['soma'], 0)
+        self.assertEqual(metricas['resposta_bytes']['soma'], len(corpo))
+
+    def test_sql_inclui_leitura_das_linhas(self):
+        # lenta() atrasa cada linha; só a primeira é calculada no execute(), as demais no fetch
+        connection.ensure_connection()
+        connection.connection.create_function('lenta', 1, lambda valor: time.sleep(0.01) or valor)
+        with instrumentacao.Medicao().ativa() as medicao, connection.cursor() as cursor:
+            cursor.execute(f'SELECT lenta(id) FROM {models.Arrecadacao._meta.db_table}')
+            self.assertEqual(len(cursor.fetchall()), 4)
+        self.assertGreaterEqual(medicao.sql_segundos, 0.035)
+
+    def test_serializacao_inclui_montagem_das_linhas(self):
+        registro = serializers.ArrecadacaoLeituraSerializer.registro
+        with self.settings(SERIALIZADOR_RAPIDO=True), mock.patch.object(serializers.ArrecadacaoLeituraSerializer, 'registro', lambda self, linha: time.sleep(0.01) or registro(self, linha)):
+            self.client.get('/api/v1/arrecadacao/')
+        self.assertGreaterEqual(instrumentacao.registro.resumo()['arrecadacao-list']['serializacao_segundos']['soma'], 0.04)
+        with self.settings(SERIALIZADOR_RAPIDO=False), mock.patch.object(serializers.ValorField, 'to_representation', lambda self, valor: time.sleep(0.01) or str(valor)):
+            self.client.get('/api/v1/arrecadacao/')
+        self.assertGreaterEqual(instrumentacao.registro.resumo()['arrecadacao-list']['serializacao_segundos']['soma'], 0.08)
+
+    async def test_views_assincronas_contam_consultas(self):
+        await self.async_client.get('/api/v1/async/arrecadacao/aggregate/', {'group_by': 'comercio'})
+        metricas = instrumentacao.registro.resumo()['arrecadacao-async-aggregate']
+        self.assertGreaterEqual(metricas['sql_consultas']['soma'], 1)
+        self.assertGreater(metricas['serializacao_segundos']['soma'], 0)
+
+    def test_quantis_pelos_buckets(self):
+        histograma = instrumentacao.Histograma((1, 10, 100))
+        for valor in (0.5, 5, 5, 50, 500):
+            histograma.observa(valor)
+        self.assertEqual(histograma.contagens, [1, 2, 1, 1])
+        self.assertEqual((histograma.quantil(0.5), histograma.quantil(0.8), histograma.quantil(1)), (10, 100, 500))
+
+class ArrecadacaoLeituraSerializerTests(ArrecadacaoTestCase):
+    def test_json_identico_ao_model_serializer(self):
+        queryset = models.Arrecadacao.objects.order_by('id')
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(serializers.ArrecadacaoLeituraSerializer(queryset.all(), many=True).data),
+            renderer.render(serializers.ArrecadacaoSerializer(queryset.all(), many=True).data),
+        )
+
+    def test_listagem_e_detalhe(self):
+        arrecadacao = models.Arrecadacao.objects.order_by('id').first()
+        for rapido in (True, False):
+            with self.settings(SERIALIZADOR_RAPIDO=rapido):
+                self.assertEqual(self.client.get(f'/api/v1/arrecadacao/{arrecadacao.pk}/').json()['valor'], '100.10')
+                self.assertEqual(self.client.get('/api/v1/arrecadacao/0/').status_code, 404)
+                self.assertEqual(len(self.client.get('/api/v1/arrecadacao/').json()), 4)
+
+class ValorCentavosTests(ArrecadacaoTestCase):
+    def test_guarda_centavos_e_soma_exata(self):
+        models.Arrecadacao.objects.create(subclasse=self.subclasse, setor=self.setor, comercio=self.comercio, data=date(2020, 1, 2), valor=Decimal('0.105'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT valor FROM {models.Arrecadacao._meta.db_table} ORDER BY data')
+            self.assertEqual([linha[0] for linha in cursor.fetchall()], [10010, 10, 5005, 20000, 1000])
+        self.assertEqual(models.Arrecadacao.objects.get(data=date(2020, 1, 2)).valor, Decimal('0.10'))
+        # 0.1 + 0.2 somados como float dariam 0.30000000000000004
+        models.Arrecadacao.objects.filter(data=date(2020, 1, 2)).update(valor=0.2)
+        models.Arrecadacao.objects.filter(data=date(2020, 1, 1)).update(valor=Decimal('0.1'))
+        self.assertEqual(models.Arrecadacao.objects.filter(data__lt=date(2020, 1, 15)).aggregate(soma=Sum('valor'))['soma'], Decimal('0.30'))
+        self.assertEqual(self.client.get('/api/v1/arrecadacao/aggregate/', {'end': '2020-01-14'}).json(), [{'valor': '0.30', 'quantidade': 2}])
+
+    def test_filtros_em_reais(self):
+        self.assertEqual(models.Arrecadacao.objects.filter(valor__gte=50.05, valor__lt=100.1).count(), 1)
+        # Limites com fração de centavo: 100.10 fica fora de >= 100.105 e de > 100.105
+        for lookup, limite, esperados in (
+            ('gte', '100.105', ['200.00']), ('gt', '100.105', ['200.00']), ('gt', '100.10', ['200.00']),
+            ('lte', '100.105', ['10.00', '50.05', '100.10']), ('lt', '100.105', ['10.00', '50.05', '100.10']),
+            ('lt', '100.10', ['10.00', '50.05']), ('gte', 100.095, ['100.10', '200.00']),
+        ):
+            with self.subTest(lookup=lookup, limite=limite):
+                valores = models.Arrecadacao.objects.filter(**{f'valor__{lookup}': limite}).order_by('valor').values_list('valor', flat=True)
+                self.assertEqual([str(valor) for valor in valores], esperados)
+        self.assertEqual(models.Arrecadacao.objects.filter(valor__range=('50.049', '100.109')).count(), 2)
+        self.assertEqual(models.Arrecadacao.objects.filter(valor__range=('50.051', '100.099')).count(), 0)
+        resposta = self.client.get('/api/v1/arrecadacao/', {'valor__gte': '100.105'})
+        self.assertEqual([linha['valor'] for linha in resposta.json()], ['200.00'])
+        resposta = self.client.get('/api/v1/arrecadacao/', {'valor__gte': '50.05', 'valor__lte': '100.10'})
+        self.assertEqual(sorted(linha['valor'] for linha in resposta.json()), ['100.10', '50.05'])
+
+    def test_json_numerico(self):
+        models.Arrecadacao.objects.create(subclasse=self.subclasse, setor=self.setor, comercio=self.comercio, data=date(2022, 1, 1), valor=Decimal('-0.07'))
+        for rapido in (True, False):
+            with self.settings(SERIALIZADOR_RAPIDO=rapido):
+                texto = self.client.get('/api/v1/arrecadacao/').json()
+                numeros = self.client.get('/api/v1/arrecadacao/', {'numeric': '1'}).json()
+                self.assertEqual([linha['valor'] for linha in texto], ['100.10', '50.05', '200.00', '10.00', '-0.07'])
+                self.assertEqual([linha['valor'] for linha in numeros], [100.1, 50.05, 200.0, 10.0, -0.07])
+                self.assertEqual(numeros[0]['data'], texto[0]['data'])
+        agregacao = self.client.get('/api/v1/arrecadacao/aggregate/', {'group_by': 'year', 'numeric': 'true'}).json()
+        self.assertEqual([linha['valor'] for linha in agregacao], [350.15, 10.0, -0.07])
+        serie = self.client.get('/api/v1/arrecadacao/timeseries/', {'freq': 'Y', 'numeric': '1'}).json()
+        self.assertEqual([linha['valor'] for linha in serie], [350.15, 10.0, -0.07])
+
+class KeysetPaginationTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/'
+
+    def test_sem_parametros_nao_pagina(self):
+        self.assertIsInstance(self.client.get(self.url).json(), list)
+
+    def test_percorre_paginas_em_ordem(self):
+        for rapido in (True, False):
+            with self.settings(SERIALIZADOR_RAPIDO=rapido):
+                pagina = self.client.get(self.url, {'page_size': 3, 'comercio__in': 'Comércio,Indústria'}).json()
+                self.assertEqual([linha['data'] for linha in pagina['results']], ['2020-01-01', '2020-01-15', '2020-02-01'])
+                pagina = self.client.get(pagina['next']).json()
+                self.assertEqual([linha['data'] for linha in pagina['results']], ['2021-03-01'])
+                self.assertIsNone(pagina['next'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'invalido'}).status_code, 404)
+
+class CNAETests(ArrecadacaoTestCase):
+    url = '/api/v1/cnae/'
+
+    def test_arvore_completa(self):
+        resposta = self.client.get(self.url).json()
+        self.assertEqual([item['codigo'] for item in resposta['divisao']], ['45', '47'])
+        self.assertEqual(resposta['subclasse'][1], {'codigo': '471130', 'descricao': 'Subclasse 7', 'classe': '4711'})
+
+    def test_codigos_de_varios_niveis(self):
+        with self.assertNumQueries(2):
+            resposta = self.client.get(self.url, {'codigo__in': 'G,451,471130', 'nivel': 'secao,grupo'}).json()
+        self.assertEqual(resposta, {
+            'secao': [{'codigo': 'G', 'descricao': 'Comércio; reparação de veículos'}],
+            'grupo': [{'codigo': '451', 'descricao': 'Grupo 5', 'divisao': '45'}],
+        })
+
+@override_settings(RESPOSTA_CACHE=True)
+class RespostaCacheTests(ArrecadacaoTestCase):
+    url = '/api/v1/arrecadacao/aggregate/'
+
+    def test_if_none_match_devolve_304(self):
+        resposta = self.client.get(self.url, {'group_by': 'comercio'})
+        repetida = self.client.get(self.url, {'group_by': 'comercio'}, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida['ETag'], resposta['ETag'])
+
+    def test_repeticao_servida_do_cache(self):
+        resposta = self.client.get(self.url, {'group_by': 'comercio'})
+        # Só a leitura das versões vai ao banco
+        with self.assertNumQueries(1):
+            repetida = self.client.get(self.url, {'comercio__in': '', 'group_by': 'comercio'})
+        self.assertEqual(repetida.content, resposta.content)
+        self.assertEqual(repetida['Content-Type'], resposta['Content-Type'])
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_links_de_paginacao_do_proprio_host(self):
+        for host in ('a.example', 'b.example'):
+            resposta = self.client.get('/api/v1/arrecadacao/', {'page_size': 1}, HTTP_HOST=host)
+            self.assertTrue(resposta.json()['next'].startswith(f'http://{host}/'))
+
+    def test_leitura_nao_grava_versoes(self):
+        models.VersaoModelo.objects.all().delete()
+        resposta = self.client.get(self.url)
+        self.assertFalse(models.VersaoModelo.objects.exists())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 304)
+        models.Arrecadacao.objects.filter(data__year=2021).update(valor=Decimal('20.00'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 200)
+
+    def test_escrita_invalida_etag(self):
+        resposta = self.client.get(self.url)
+        models.Arrecadacao.objects.filter(data__year=2021).update(valor=Decimal('20.00'))
+        nova = self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(nova.status_code, 200)
+        self.assertEqual(nova.json(), [{'valor': '370.15', 'quantidade': 4}])
+
+    def test_alteracao_em_tabela_relacionada_invalida_etag(self):
+        resposta = self.client.get('/api/v1/cnae/')
+        models.Secao.objects.filter(codigo='G').get().save()
+        self.assertNotEqual(self.client.get('/api/v1/cnae/')['ETag'], resposta['ETag'])
+
+    def test_escrita_no_mesmo_segundo_da_resposta(self):
+        # Relógio controlado alguns segundos à frente das versões já gravadas pelos dados do teste
+        agora = math.floor(time.time()) + 10
+        relogio = mock.Mock()
+        with mock.patch.object(cache, 'time', relogio):
+            relogio.time.return_value = agora + 0.2
+            models.Setor.objects.get().save()
+            relogio.time.return_value = agora + 0.5
+            self.assertNotIn('Last-Modified', self.client.get('/api/v1/setor/'))
+
+            relogio.time.return_value = agora + 1.1
+            resposta = self.client.get('/api/v1/setor/')
+            self.assertEqual(resposta['Last-Modified'], http_date(agora + 1))
+            self.assertEqual(self.client.get('/api/v1/setor/', HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified']).status_code, 304)
+
+            relogio.time.return_value = agora + 1.4
+            models.Setor.objects.get().save()
+            nova = self.client.get('/api/v1/setor/', HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified'])
+        self.assertEqual(nova.status_code, 200)
+        self.assertNotEqual(nova['ETag'], resposta['ETag'])
+
+    def test_escrita_de_outro_processo_invalida_etag(self):
+        # Sem cache compartilhado (outro processo, com o próprio locmem), a versão continua no banco
+        resposta = self.client.get(self.url)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'outro-processo'}}):
+            models.Arrecadacao.objects.create(subclasse=self.subclasse, setor=self.setor, comercio=self.comercio, data=date(2022, 1, 1), valor=Decimal('1.00'))
+        nova = self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(nova.status_code, 200)
+        self.assertEqual(nova.json(), [{'valor': '361.15', 'quantidade': 5}])
@@ -1,58 +1,215 @@
+from django.conf                   import settings
 from django.shortcuts              import render
-from rest_framework                import viewsets
+from django.db                     import transaction
+from django.http                   import Http404, StreamingHttpResponse
+from rest_framework                import status, viewsets
+from rest_framework.decorators     import action
+from rest_framework.exceptions     import ValidationError
+from rest_framework.response       import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .                             import models
 from .                             import serializers
 from .                             import filters
+from .                             import aggregations
+from .                             import export
+from .                             import pagination
+from .                             import renderers
+from .                             import cache
 
-class SecaoViewSet(viewsets.ModelViewSet):
+class SecaoViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Secao.objects.all()
     serializer_class = serializers.SecaoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.SecaoFilter
     
-class DivisaoViewSet(viewsets.ModelViewSet):
+class DivisaoViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Divisao.objects.all()
     serializer_class = serializers.DivisaoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.DivisaoFilter
     
-class GrupoViewSet(viewsets.ModelViewSet):
+class GrupoViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Grupo.objects.all()
     serializer_class = serializers.GrupoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.GrupoFilter
     
-class ClasseViewSet(viewsets.ModelViewSet):
+class ClasseViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Classe.objects.all()
     serializer_class = serializers.ClasseSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.ClasseFilter
     
-class SubclasseViewSet(viewsets.ModelViewSet):
+class SubclasseViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Subclasse.objects.all()
     serializer_class = serializers.SubclasseSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.SubclasseFilter
     
-class SetorViewSet(viewsets.ModelViewSet):
+class SetorViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Setor.objects.all()
     serializer_class = serializers.SetorSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.SetorFilter
     
-class ComercioViewSet(viewsets.ModelViewSet):
+class ComercioViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Comercio.objects.all()
     serializer_class = serializers.ComercioSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.ComercioFilter
     
-class ArrecadacaoViewSet(viewsets.ModelViewSet):
+class CNAEViewSet(cache.RespostaCacheadaMixin, viewsets.ViewSet):
+    # Toda a hierarquia CNAE numa única resposta, com o código do nível pai em cada item.
+    # ?codigo__in=G,47,4711301 restringe a códigos de qualquer nível e ?nivel=secao,divisao aos níveis pedidos
+    niveis = {
+        'secao': (models.Secao, None),
+        'divisao': (models.Divisao, 'secao'),
+        'grupo': (models.Grupo, 'divisao'),
+        'classe': (models.Classe, 'grupo'),
+        'subclasse': (models.Subclasse, 'classe'),
+    }
+    dependencias = [model for model, _ in niveis.values()]
+
+    def list(self, request):
+        codigos = [codigo for codigo in request.query_params.get('codigo__in', '').split(',') if codigo]
+        niveis = [nivel for nivel in request.query_params.get('nivel', '').split(',') if nivel] or list(self.niveis)
+        invalidos = [nivel for nivel in niveis if nivel not in self.niveis]
+        if invalidos:
+            raise ValidationError({'nivel': f"Níveis inválidos: {', '.join(invalidos)}. Opções: {', '.join(self.niveis)}."})
+
+        resposta = {}
+        for nivel in niveis:
+            model, pai = self.niveis[nivel]
+            campos, caminhos = ['codigo', 'descricao'], ['codigo', 'descricao']
+            if pai:
+                campos.append(pai)
+                caminhos.append(f'{pai}__codigo')
+            queryset = model.objects.order_by('codigo')
+            if codigos:
+                queryset = queryset.filter(codigo__in=codigos)
+            resposta[nivel] = [dict(zip(campos, linha)) for linha in queryset.values_list(*caminhos)]
+        return Response(resposta)
+
+class ArrecadacaoViewSet(cache.RespostaCacheadaMixin, viewsets.ModelViewSet):
     queryset = models.Arrecadacao.objects.select_related(
-        'subclasse__classe__grupo__divisao__secao',
+        'subclasse' if settings.CNAE_DENORMALIZADO else 'subclasse__classe__grupo__divisao__secao',
         'setor',
         'comercio'
     ).all()
     serializer_class = serializers.ArrecadacaoSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_class = filters.ArrecadacaoFilter
\ No newline at end of file
+    filterset_class = filters.ArrecadacaoFilter
+    pagination_class = pagination.KeysetPagination
+    # As respostas trazem os códigos e descrições das tabelas relacionadas
+    dependencias = [models.Arrecadacao, models.Secao, models.Divisao, models.Grupo, models.Classe, models.Subclasse, models.Setor, models.Comercio]
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'numerico': serializers.numerico(self.request.query_params)}
+
+    def list(self, request, *args, **kwargs):
+        if not settings.SERIALIZADOR_RAPIDO:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        numerico = serializers.numerico(request.query_params)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializers.ArrecadacaoLeituraSerializer(page, many=True, numerico=numerico).data)
+        return Response(serializers.ArrecadacaoLeituraSerializer(queryset, many=True, numerico=numerico).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.SERIALIZADOR_RAPIDO:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        if not queryset.exists():
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return Response(serializers.ArrecadacaoLeituraSerializer(queryset, numerico=serializers.numerico(request.query_params)).data)
+
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        dimensoes = aggregations.parse_group_by(request.query_params.get('group_by'))
+        queryset = aggregations.queryset_mensal(request.query_params, dimensoes)
+        if queryset is None:
+            queryset = self.filter_queryset(models.Arrecadacao.objects.all())
+        resultado = aggregations.agrega(queryset, dimensoes, *aggregations.periodo(request.query_params))
+        return Response(serializers.AgregacaoSerializer(resultado, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        # ?freq=D|W|M|Q|Y, ?series=<dimensão> separa as séries e ?top_n= agrupa as demais em 'Outros';
+        # aceita os mesmos filtros da listagem
+        freq = request.query_params.get('freq', 'M').upper()
+        if freq not in aggregations.FREQUENCIAS:
+            raise ValidationError({'freq': f"Frequência inválida: {freq}. Opções: {', '.join(aggregations.FREQUENCIAS)}."})
+        serie = request.query_params.get('series') or None
+        if serie is not None and serie not in aggregations.SERIES:
+            raise ValidationError({'series': f"Dimensão inválida: {serie}. Opções: {', '.join(aggregations.SERIES)}."})
+        try:
+            top_n = int(request.query_params.get('top_n') or 0)
+        except ValueError:
+            top_n = -1
+        if top_n < 0:
+            raise ValidationError({'top_n': 'Informe um inteiro positivo.'})
+
+        periodo = aggregations.FREQUENCIAS[freq]
+        queryset = aggregations.queryset_mensal(request.query_params, [periodo, serie] if serie else [periodo])
+        if queryset is None:
+            queryset = self.filter_queryset(models.Arrecadacao.objects.all())
+        resultado = aggregations.serie_temporal(queryset, freq, serie, top_n, *aggregations.periodo(request.query_params))
+        return Response(serializers.AgregacaoSerializer(resultado, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[renderers.ParquetRenderer, renderers.ArrowStreamRenderer, renderers.CSVRenderer])
+    def export(self, request):
+        # Formato escolhido por ?format=parquet|arrow|csv ou pelo cabeçalho Accept
+        queryset = self.filter_queryset(models.Arrecadacao.objects.order_by('id'))
+        formato = request.accepted_renderer.format
+        media_type, extensao = export.FORMATOS[formato]
+
+        resposta = StreamingHttpResponse(export.gera(queryset, formato, settings.EXPORT_CHUNK_SIZE), content_type=media_type)
+        resposta['Content-Disposition'] = f'attachment; filename="arrecadacao.{extensao}"'
+        return resposta
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Cada item é validado isoladamente: os inválidos voltam em 'erros' e não impedem a gravação dos demais
+        on_conflict = request.query_params.get('on_conflict')
+        if on_conflict not in (None, 'update', 'ignore'):
+            raise ValidationError({'on_conflict': "Use 'update' ou 'ignore'."})
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Envie uma lista de arrecadações.']})
+
+        contexto = {'lookups': {
+            'subclasse': dict(models.Subclasse.objects.values_list('codigo', 'id')),
+            'setor': dict(models.Setor.objects.values_list('descricao', 'id')),
+            'comercio': dict(models.Comercio.objects.values_list('descricao', 'id')),
+        }}
+
+        arrecadacoes, erros = [], []
+        for indice, item in enumerate(request.data):
+            serializer = serializers.ArrecadacaoBulkSerializer(data=item, context=contexto)
+            if serializer.is_valid():
+                arrecadacoes.append(serializer.to_instance())
+            else:
+                erros.append({'indice': indice, 'erros': serializer.errors})
+
+        with transaction.atomic():
+            if on_conflict is None:
+                criados, atualizados = len(models.Arrecadacao.objects.bulk_create(arrecadacoes)), 0
+            else:
+                criados, atualizados = models.Arrecadacao.objects.bulk_upsert(arrecadacoes, atualizar=on_conflict == 'update')
+
+        resultado = {
+            'criados': criados,
+            'atualizados': atualizados,
+            'ignorados': len(arrecadacoes) - criados - atualizados,
+            'erros': erros,
+        }
+        if not erros:
+            codigo = status.HTTP_201_CREATED
+        elif arrecadacoes:
+            codigo = status.HTTP_207_MULTI_STATUS
+        else:
+            codigo = status.HTTP_400_BAD_REQUEST
+        return Response(resultado, status=codigo)
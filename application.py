@@ -1,10 +1,11 @@
 import streamlit as st
-import requests as rq
 import pandas as pd
 import numpy as np
 import plotly.express as px
-
-url = 'http://127.0.0.1:8000/api/v1/arrecadacao'
+import analise
+import cliente
+import hierarquia
+from formatacao import formata_numero, formata_numeros
 
 st.set_page_config(layout='wide', initial_sidebar_state='collapsed', page_title='📊 CNAE-ICMS Analytics')
 
@@ -20,17 +21,6 @@ color_map = {
 }
 
 
-# Função para formatar os números
-def formata_numero(valor, prefixo=''):
-    if valor >= 1_000_000_000:  # Bilhões
-        return f"{prefixo} {valor/1_000_000_000:.2f} bilhões"
-    elif valor >= 1_000_000:  # Milhões
-        return f"{prefixo} {valor/1_000_000:.2f} milhões"
-    elif valor >= 1_000:  # Milhares
-        return f"{prefixo} {valor/1_000:.2f} mil"
-    else:  # Menor que mil
-        return f"{prefixo} {valor:.2f}"
-
 # Criação das abas
 aba1, aba2, aba3 = st.tabs(['Visão Geral', 'Visão Detalhada', 'Dataframe'])
 
@@ -40,45 +30,33 @@ with aba1:
     with st.sidebar.form(key='filter_form'):
         start_date = st.date_input('Data de início', value=pd.to_datetime('2020-01-01'))
         end_date = st.date_input('Data de término', value=pd.to_datetime('2020-12-31'))
-        comercios = list(pd.read_json(url)['comercio'].unique())
-        selected_comercios = st.multiselect('Selecione os Comércios', sorted(comercios), default=comercios)
+        comercios = cliente.busca_comercios()
+        selected_comercios = st.multiselect('Selecione os Comércios', comercios, default=comercios)
         submit_button = st.form_submit_button(label='Aplicar Filtros')
 
-    response = rq.get(url)
-    dados = pd.DataFrame(response.json())
-    dados['valor'] = pd.to_numeric(dados['valor'], errors='coerce')
-    dados = dados.dropna(subset=['valor'])
-    dados['data'] = pd.to_datetime(dados['data'], format='%Y-%m-%d')
-
-    # Aplicar filtro de data e comércios
-    dados = dados[(dados['data'] >= pd.to_datetime(start_date)) & (dados['data'] <= pd.to_datetime(end_date))]
-    if selected_comercios:
-        dados = dados[dados['comercio'].isin(selected_comercios)]
-
-    if 'comercio' in dados.columns:
-        dados['comercio'] = dados['comercio'].fillna('Desconhecido')
-        receita_comercio = dados.groupby('comercio')['valor'].sum().sort_values(ascending=False).reset_index()
-        receita_comercio['valor_formatado'] = receita_comercio['valor'].apply(lambda x: formata_numero(x, prefixo='R$'))
-    else:
-        st.error("A coluna 'comercio' não foi encontrada nos dados.")
-
-    receita_mensal = dados.set_index('data').groupby(pd.Grouper(freq='ME'))['valor'].sum().reset_index()
-    receita_mensal['Ano'] = receita_mensal['data'].dt.year
-    receita_mensal['Mês'] = receita_mensal['data'].dt.month_name()
-    receita_mensal = receita_mensal.sort_values('data')
+    if st.sidebar.button('Atualizar dados'):
+        cliente.invalida()
+
+    # Filtro de data e comércios aplicado pela API; a mesma combinação de filtros vem do cache
+    comercios_selecionados = tuple(sorted(selected_comercios))
+    filtro = analise.Filtro(start_date, end_date, comercios_selecionados)
+    dados, indice = cliente.carrega_arrecadacoes(start_date, end_date, comercios_selecionados)
+
+    # Totais e séries calculados pelo backend de analise (cliente.BACKEND), em cache por filtro
+    receita_comercio = cliente.calcula('receita_comercio', filtro)
+    receita_comercio['valor_formatado'] = formata_numeros(receita_comercio['valor'], prefixo='R$')
+    metricas = cliente.calcula('metricas', filtro)
 
     # Métricas lado a lado
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Arrecadado", formata_numero(dados['valor'].sum(), prefixo='R$'))
+        st.metric("Total Arrecadado", formata_numero(metricas['total'], prefixo='R$'))
     with col2:
-        media_arrecadacao = dados['valor'].mean()
-        st.metric("Média de Arrecadação por Comércio", formata_numero(media_arrecadacao, prefixo='R$'))
+        st.metric("Média de Arrecadação por Comércio", formata_numero(metricas['media'], prefixo='R$'))
     with col3:
-        maior_arrecadacao_mes = receita_mensal['valor'].max()
-        st.metric("Maior Arrecadação Mensal", formata_numero(maior_arrecadacao_mes, prefixo='R$'))
+        st.metric("Maior Arrecadação Mensal", formata_numero(metricas['maior_mensal'], prefixo='R$'))
     with col4:
-        st.metric("Quantidade de Arrecadações", dados['valor'].count())
+        st.metric("Quantidade de Arrecadações", metricas['quantidade'])
 
 
     # Adicionar um único st.markdown para separar as métricas dos gráficos
@@ -99,7 +77,7 @@ with aba1:
         st.plotly_chart(fig_rec_comercio, use_container_width=True)
 
     with col2:
-        receita_historico_comercio = dados.groupby([pd.Grouper(key='data', freq='M'), 'comercio'])['valor'].sum().reset_index()
+        receita_historico_comercio = cliente.calcula('serie', filtro, freq='M', serie_por='comercio').rename(columns={'periodo': 'data'})
         fig_rec_historico = px.line(receita_historico_comercio,
                                     x='data',
                                     y='valor',
@@ -111,97 +89,43 @@ with aba1:
 
         st.plotly_chart(fig_rec_historico, use_container_width=True)
 
-# Função para buscar a descrição de um código CNAE
-def busca_descricao(endpoint, codigo):
-    url = f"{endpoint}?codigo={codigo}"
-    response = rq.get(url)
-    if response.status_code == 200:
-        return response.json()[0]['descricao']
-    else:
-        return codigo  # Caso falhe, retorna o código como fallback
-
 # Segunda aba: Visualização Detalhada
 with aba2:
     col1, col2 = st.columns([1, 2])  # Aumentar a proporção da segunda coluna para o gráfico
 
-    # Na primeira coluna, os filtros
+    # Na primeira coluna, os filtros: as opções de cada nível são os códigos filhos do nível
+    # anterior no índice, exibidos pela descrição
+    selecionados = {}
     with col1:
         with st.expander("Filtros Específicos", expanded=True):  # Filtros colapsados por padrão
-            # Carregar descrições para a Seção
-            secao_options = sorted(dados['secao'].unique())
-            secao_descriptions = {secao: busca_descricao("http://127.0.0.1:8000/api/v1/secao/", secao).capitalize() for secao in secao_options}
-            selected_secao = st.selectbox('Selecione a Seção', ['Todas'] + [secao_descriptions[secao] for secao in secao_options])
-
-            # Carregar descrições para a Divisão com base na Seção selecionada
-            if selected_secao != 'Todas':
-                selected_secao_codigo = list(secao_descriptions.keys())[list(secao_descriptions.values()).index(selected_secao)]
-                divisao_options = sorted(dados[dados['secao'] == selected_secao_codigo]['divisao'].unique())
-                divisao_descriptions = {divisao: busca_descricao("http://127.0.0.1:8000/api/v1/divisao/", divisao).capitalize() for divisao in divisao_options}
-                selected_divisao = st.selectbox('Selecione a Divisão', ['Todas'] + [divisao_descriptions[divisao] for divisao in divisao_options])
-            else:
-                selected_divisao = st.selectbox('Selecione a Divisão', ['Todas'], disabled=True)
-
-            # Carregar descrições para o Grupo com base na Divisão selecionada
-            if selected_divisao != 'Todas':
-                selected_divisao_codigo = list(divisao_descriptions.keys())[list(divisao_descriptions.values()).index(selected_divisao)]
-                grupo_options = sorted(dados[dados['divisao'] == selected_divisao_codigo]['grupo'].unique())
-                grupo_descriptions = {grupo: busca_descricao("http://127.0.0.1:8000/api/v1/grupo/", grupo).capitalize() for grupo in grupo_options}
-                selected_grupo = st.selectbox('Selecione o Grupo', ['Todas'] + [grupo_descriptions[grupo] for grupo in grupo_options])
-            else:
-                selected_grupo = st.selectbox('Selecione o Grupo', ['Todas'], disabled=True)
-
-            # Carregar descrições para a Classe com base no Grupo selecionado
-            if selected_grupo != 'Todas':
-                selected_grupo_codigo = list(grupo_descriptions.keys())[list(grupo_descriptions.values()).index(selected_grupo)]
-                classe_options = sorted(dados[dados['grupo'] == selected_grupo_codigo]['classe'].unique())
-                classe_descriptions = {classe: busca_descricao("http://127.0.0.1:8000/api/v1/classe/", classe).capitalize() for classe in classe_options}
-                selected_classe = st.selectbox('Selecione a Classe', ['Todas'] + [classe_descriptions[classe] for classe in classe_options])
-            else:
-                selected_classe = st.selectbox('Selecione a Classe', ['Todas'], disabled=True)
-
-            # Carregar descrições para a Subclasse com base na Classe selecionada
-            if selected_classe != 'Todas':
-                selected_classe_codigo = list(classe_descriptions.keys())[list(classe_descriptions.values()).index(selected_classe)]
-                subclasse_options = sorted(dados[dados['classe'] == selected_classe_codigo]['subclasse'].unique())
-                subclasse_descriptions = {subclasse: busca_descricao("http://127.0.0.1:8000/api/v1/subclasse/", subclasse).capitalize() for subclasse in subclasse_options}
-                selected_subclasse = st.selectbox('Selecione a Subclasse', ['Todas'] + [subclasse_descriptions[subclasse] for subclasse in subclasse_options])
-            else:
-                selected_subclasse = st.selectbox('Selecione a Subclasse', ['Todas'], disabled=True)
-
-    # Definir o filtro ativo com base na seleção do usuário
+            pai = None
+            for nivel, titulo in zip(hierarquia.NIVEIS, ['Selecione a Seção', 'Selecione a Divisão', 'Selecione o Grupo', 'Selecione a Classe', 'Selecione a Subclasse']):
+                if pai == 'Todas':
+                    selecionados[nivel] = st.selectbox(titulo, ['Todas'], disabled=True)
+                else:
+                    selecionados[nivel] = st.selectbox(titulo, ['Todas'] + indice.opcoes(nivel, pai),
+                                                       format_func=lambda codigo, nivel=nivel: codigo if codigo == 'Todas' else indice.rotulo(nivel, codigo))
+                pai = selecionados[nivel]
+
+    # Definir o filtro ativo com base na seleção do usuário: o nível mais específico escolhido.
+    # Os códigos são aninhados, então filtrar por ele já atende aos níveis anteriores
+    nivel_ativo, codigo_ativo = analise.nivel_ativo(selecionados)
+    filtro_detalhado = analise.Filtro(start_date, end_date, comercios_selecionados, nivel_ativo, codigo_ativo)
     filtro_ativo = "Nenhum filtro aplicado, exibindo todos os dados"
-    if selected_subclasse != 'Todas':
-        filtro_ativo = f"Filtrado por Subclasse: {selected_subclasse}"
-    elif selected_classe != 'Todas':
-        filtro_ativo = f"Filtrado por Classe: {selected_classe}"
-    elif selected_grupo != 'Todas':
-        filtro_ativo = f"Filtrado por Grupo: {selected_grupo}"
-    elif selected_divisao != 'Todas':
-        filtro_ativo = f"Filtrado por Divisão: {selected_divisao}"
-    elif selected_secao != 'Todas':
-        filtro_ativo = f"Filtrado por Seção: {selected_secao}"
+    if nivel_ativo is not None:
+        nome = dict(zip(hierarquia.NIVEIS, ['Seção', 'Divisão', 'Grupo', 'Classe', 'Subclasse']))[nivel_ativo]
+        filtro_ativo = f"Filtrado por {nome}: {indice.rotulo(nivel_ativo, codigo_ativo)}"
 
     # Na segunda coluna, os gráficos ocupam mais espaço
     with col2:
-        # Aplicar filtros específicos ao dataframe
-        filtered_data = dados.copy()
-        if selected_secao != 'Todas':
-            filtered_data = filtered_data[filtered_data['secao'] == list(secao_descriptions.keys())[list(secao_descriptions.values()).index(selected_secao)]]
-        if selected_divisao != 'Todas':
-            filtered_data = filtered_data[filtered_data['divisao'] == list(divisao_descriptions.keys())[list(divisao_descriptions.values()).index(selected_divisao)]]
-        if selected_grupo != 'Todas':
-            filtered_data = filtered_data[filtered_data['grupo'] == list(grupo_descriptions.keys())[list(grupo_descriptions.values()).index(selected_grupo)]]
-        if selected_classe != 'Todas':
-            filtered_data = filtered_data[filtered_data['classe'] == list(classe_descriptions.keys())[list(classe_descriptions.values()).index(selected_classe)]]
-        if selected_subclasse != 'Todas':
-            filtered_data = filtered_data[filtered_data['subclasse'] == list(subclasse_descriptions.keys())[list(subclasse_descriptions.values()).index(selected_subclasse)]]
+        metricas_detalhadas = cliente.calcula('metricas', filtro_detalhado)
 
         # Métricas lado a lado
         col3, col4 = st.columns(2)
         with col3:
-            st.metric("Total Arrecadado", formata_numero(filtered_data['valor'].sum(), prefixo='R$'))
+            st.metric("Total Arrecadado", formata_numero(metricas_detalhadas['total'], prefixo='R$'))
         with col4:
-            st.metric("Quantidade de Arrecadações", filtered_data['valor'].count())
+            st.metric("Quantidade de Arrecadações", metricas_detalhadas['quantidade'])
 
         st.markdown('---')
         
@@ -209,8 +133,11 @@ with aba2:
         st.write(f"**{filtro_ativo}**")
 
         # Gráfico na largura total da coluna 2
-        receita_detalhada = filtered_data.groupby('data')['valor'].sum().reset_index()
-        receita_detalhada['valor_formatado'] = receita_detalhada['valor'].apply(lambda x: formata_numero(x, prefixo='R$'))
+        # Série na frequência escolhida: com o backend da API, o número de barras não depende do volume de dados
+        frequencias = {'D': 'Dia', 'W': 'Semana', 'M': 'Mês', 'Q': 'Trimestre', 'Y': 'Ano'}
+        freq = st.radio('Agrupar por', list(frequencias), index=2, format_func=frequencias.get, horizontal=True)
+        receita_detalhada = cliente.calcula('serie', filtro_detalhado, freq=freq).rename(columns={'periodo': 'data'})
+        receita_detalhada['valor_formatado'] = formata_numeros(receita_detalhada['valor'], prefixo='R$')
 
         fig_rec_detalhada = px.bar(receita_detalhada,
                                    x='data',
@@ -223,4 +150,5 @@ with aba2:
 
 # Terceira aba: Dataframe
 with aba3:
+    st.caption(f"{len(dados):,} linhas ocupando {analise.uso_memoria(dados) / 1024 ** 2:,.1f} MB em memória")
     st.dataframe(dados)
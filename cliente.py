@@ -0,0 +1,108 @@
+from os                 import getenv
+from concurrent.futures import ThreadPoolExecutor
+from pathlib            import Path
+import streamlit        as st
+import requests         as rq
+import pandas           as pd
+from requests.adapters  import HTTPAdapter
+from hierarquia         import IndiceHierarquia
+import analise
+import sincronizacao
+
+# Acesso do dashboard à API. As buscas ficam em cache (st.cache_data) por CACHE_TTL segundos,
+# então interações que só mudam filtros locais (selectbox, abas) não repetem requisições nem parsing
+
+API = getenv('API_URL', 'http://127.0.0.1:8000/api/v1')
+CACHE_TTL = int(getenv('DASHBOARD_CACHE_TTL', 600))
+WORKERS = 4
+# Onde são feitas as agregações dos gráficos e métricas: 'api' (analise.BackendAPI) pede os totais
+# e séries prontos à API; 'pandas' (analise.BackendPandas) calcula sobre as arrecadações carregadas
+BACKEND = getenv('DASHBOARD_BACKEND', 'api')
+# Cópia local das arrecadações em Parquet, atualizada só com o que mudou na API (sincronizacao);
+# DASHBOARD_CACHE_DIR vazio volta a buscar o período pedido inteiro na API a cada carga
+CACHE_DIR = getenv('DASHBOARD_CACHE_DIR', str(Path(__file__).resolve().parent / '.cache' / 'arrecadacao'))
+
+# Uma única sessão por processo: conexões keep-alive reaproveitadas por todas as requisições e threads
+@st.cache_resource
+def sessao():
+    sessao = rq.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS)
+    sessao.mount('http://', adaptador)
+    sessao.mount('https://', adaptador)
+    return sessao
+
+# Valores pedidos como números no JSON (?numeric=1), sem texto para converter em cada linha
+def busca(caminho, params=None):
+    resposta = sessao().get(f'{API}/{caminho}', params={**(params or {}), 'numeric': 1})
+    resposta.raise_for_status()
+    return resposta.json()
+
+# Busca as arrecadações paginadas pela API
+def busca_paginas(params, page_size=10_000):
+    linhas = []
+    proxima, params = f'{API}/arrecadacao/', {**params, 'page_size': page_size, 'numeric': 1}
+    while proxima:
+        resposta = sessao().get(proxima, params=params)
+        resposta.raise_for_status()
+        pagina = resposta.json()
+        linhas.extend(pagina['results'])
+        proxima, params = pagina['next'], None  # O link 'next' já traz os filtros e o cursor
+    return linhas
+
+# Uma cópia local por processo, compartilhada pelas sessões
+@st.cache_resource
+def cache_local():
+    return sincronizacao.CacheLocal(CACHE_DIR, busca, busca_paginas, workers=WORKERS)
+
+# Com a cópia local, sincroniza e lê o período dos arquivos; sem ela, divide o período em anos e
+# busca cada um em paralelo. O DataFrame sai já tipado
+def baixa_arrecadacoes(inicio, fim, comercios=(), page_size=10_000):
+    if CACHE_DIR:
+        cache_local().sincroniza()
+        return cache_local().carrega(inicio, fim, comercios)
+
+    params = {'comercio__in': ','.join(comercios)} if comercios else {}
+    periodos = []
+    for ano in range(inicio.year, fim.year + 1):
+        de, ate = max(inicio, inicio.replace(year=ano, month=1, day=1)), min(fim, fim.replace(year=ano, month=12, day=31))
+        periodos.append({**params, 'data__gte': de.isoformat(), 'data__lte': ate.isoformat()})
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        paginas = executor.map(lambda periodo: busca_paginas(periodo, page_size), periodos)
+
+    return analise.compacta(pd.DataFrame.from_records([linha for linhas in paginas for linha in linhas], columns=analise.COLUNAS))
+
+@st.cache_data(ttl=CACHE_TTL)
+def busca_comercios():
+    return sorted(comercio['descricao'] for comercio in busca('comercio/'))
+
+# Descrições de todos os níveis CNAE numa única requisição: {nivel: {codigo: descricao}}
+@st.cache_data(ttl=CACHE_TTL)
+def busca_descricoes():
+    return {nivel: {item['codigo']: item['descricao'] for item in itens} for nivel, itens in busca('cnae/').items()}
+
+# Arrecadações do período e o índice do drill-down montado sobre elas, num único item de cache:
+# o índice guarda posições (iloc) do DataFrame, então os dois precisam expirar e ser descartados
+# juntos. cache_resource devolve os mesmos objetos a cada execução, sem copiar nem serializar;
+# nenhum dos dois é alterado depois de montado
+@st.cache_resource(ttl=CACHE_TTL, show_spinner='Carregando arrecadações...')
+def carrega_arrecadacoes(inicio, fim, comercios=()):
+    dados = baixa_arrecadacoes(inicio, fim, comercios)
+    return dados, IndiceHierarquia(dados, busca_descricoes())
+
+# Backend de analise para o filtro; o pandas usa as arrecadações do período e comércios do filtro
+def backend(filtro):
+    if BACKEND == 'pandas':
+        return analise.BackendPandas(*carrega_arrecadacoes(filtro.inicio, filtro.fim, filtro.comercios))
+    return analise.BackendAPI(busca)
+
+# Resultado de um cálculo de analise (receita_comercio, serie, metricas...) em cache por filtro
+@st.cache_data(ttl=CACHE_TTL)
+def calcula(nome, filtro, **opcoes):
+    return getattr(backend(filtro), nome)(filtro, **opcoes)
+
+# Descarta os dados em cache para a próxima execução buscar tudo de novo na API
+def invalida():
+    carrega_arrecadacoes.clear()
+    busca_comercios.clear()
+    busca_descricoes.clear()
+    calcula.clear()
@@ -0,0 +1,59 @@
+import numpy  as np
+import pandas as pd
+
+# Faixas de magnitude usadas nos rótulos: (limite inferior, divisor, sufixo)
+FAIXAS = [
+    (1_000_000_000, 1_000_000_000, ' bilhões'),
+    (1_000_000, 1_000_000, ' milhões'),
+    (1_000, 1_000, ' mil'),
+]
+SUFIXOS = ['', *(sufixo for _, _, sufixo in FAIXAS)]
+
+# Pedaços de rótulo pré-formatados: parte inteira de 0 a 999 e '.centavos sufixo' por faixa
+INTEIROS = np.array([str(inteiro) for inteiro in range(1000)], dtype=object)
+CAUDAS = np.array([f'.{centavos:02d}{sufixo}' for sufixo in SUFIXOS for centavos in range(100)], dtype=object)
+
+# Função para formatar os números
+def formata_numero(valor, prefixo=''):
+    if valor >= 1_000_000_000:  # Bilhões
+        return f"{prefixo} {valor/1_000_000_000:.2f} bilhões"
+    elif valor >= 1_000_000:  # Milhões
+        return f"{prefixo} {valor/1_000_000:.2f} milhões"
+    elif valor >= 1_000:  # Milhares
+        return f"{prefixo} {valor/1_000:.2f} mil"
+    else:  # Menor que mil
+        return f"{prefixo} {valor:.2f}"
+
+# Mesmo resultado de formata_numero para uma coluna inteira. A faixa de cada valor é escolhida
+# com np.select e o rótulo é montado juntando pedaços pré-formatados pelos centavos arredondados.
+# Valores fora de 0-999.99 depois da divisão, não finitos ou a menos de um milésimo de centavo
+# do meio (onde o arredondamento em float pode divergir do de '%.2f') são formatados pelo Python
+def formata_numeros(valores, prefixo=''):
+    indice = valores.index if isinstance(valores, pd.Series) else None
+    valores = np.asarray(valores, dtype='float64')
+    condicoes = [valores >= limite for limite, _, _ in FAIXAS]
+    faixas = np.select(condicoes, [1, 2, 3], default=0)
+    escalados = valores / np.select(condicoes, [divisor for _, divisor, _ in FAIXAS], default=1)
+
+    centavos = np.abs(escalados) * 100
+    with np.errstate(invalid='ignore'):
+        exatos = (centavos < 99_999) & (np.abs(centavos - np.floor(centavos) - 0.5) > 1e-3)
+    arredondados = np.where(exatos, np.floor(centavos + 0.5), 0).astype('int64')
+    cabecas = np.where(np.signbit(escalados), f'{prefixo} -', f'{prefixo} ').astype(object)
+    rotulos = cabecas + INTEIROS[arredondados // 100] + CAUDAS[faixas * 100 + arredondados % 100]
+
+    inexatos = np.flatnonzero(~exatos)
+    rotulos[inexatos] = [f'{prefixo} {valor:.2f}{SUFIXOS[faixa]}' for valor, faixa in zip(escalados[inexatos].tolist(), faixas[inexatos].tolist())]
+    return pd.Series(rotulos, index=indice) if indice is not None else rotulos
+
+if __name__ == '__main__':
+    # Micro-benchmark: python formatacao.py [linhas]
+    import sys
+    from timeit import timeit
+
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    valores = pd.Series(np.random.default_rng(0).lognormal(10, 4, linhas))
+    repeticoes = 5
+    por_linha = timeit(lambda: valores.apply(lambda x: formata_numero(x, prefixo='R$')), number=repeticoes) / repeticoes
+    vetorizado = timeit(lambda: formata_numeros(valores, prefixo='R$'), number=repeticoes) / repeticoes
+    print(f'{linhas:,} valores: apply {por_linha * 1000:,.1f} ms, vetorizado {vetorizado * 1000:,.1f} ms ({por_linha / vetorizado:.1f}x)')
@@ -0,0 +1,32 @@
+NIVEIS = ['secao', 'divisao', 'grupo', 'classe', 'subclasse']
+
+# Índice da hierarquia CNAE presente num DataFrame de arrecadações, montado uma vez por carga.
+# Guarda os códigos filhos de cada código, o rótulo exibido e as posições das linhas de cada
+# código, então o drill-down não varre o DataFrame a cada seleção
+class IndiceHierarquia:
+    def __init__(self, dados, descricoes):
+        # {nivel: {codigo: posições das linhas}}; groupby.indices agrupa todas as linhas numa passada
+        self.posicoes = {nivel: dados.groupby(nivel, observed=True).indices for nivel in NIVEIS}
+
+        # {nivel: {codigo pai: [códigos filhos]}}; o pai das seções é None
+        self.filhos = {'secao': {None: sorted(self.posicoes['secao'])}}
+        for pai, nivel in zip(NIVEIS, NIVEIS[1:]):
+            filhos = {}
+            for codigo_pai, codigo in dados[[pai, nivel]].drop_duplicates().itertuples(index=False):
+                filhos.setdefault(codigo_pai, []).append(codigo)
+            self.filhos[nivel] = {codigo_pai: sorted(codigos) for codigo_pai, codigos in filhos.items()}
+
+        # Descrição de cada código presente; sem descrição, o próprio código
+        self.rotulos = {
+            nivel: {codigo: descricoes.get(nivel, {}).get(codigo, codigo).capitalize() for codigo in self.posicoes[nivel]}
+            for nivel in NIVEIS
+        }
+
+    def opcoes(self, nivel, pai=None):
+        return self.filhos[nivel].get(pai, [])
+
+    def rotulo(self, nivel, codigo):
+        return self.rotulos[nivel].get(codigo, codigo)
+
+    def linhas(self, nivel, codigo):
+        return self.posicoes[nivel].get(codigo, [])
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
-from os      import getenv
+from os      import cpu_count, getenv
 from pathlib import Path
 from dotenv  import load_dotenv
 
@@ -46,10 +46,67 @@ INSTALLED_APPS = [
 ]
 
 REST_FRAMEWORK = {
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # JSON com o tempo de renderização somado às métricas da requisição (api.instrumentacao)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Lê os códigos da hierarquia CNAE das colunas denormalizadas de Arrecadacao
+# em vez de percorrer subclasse > classe > grupo > divisao > secao. Opcional: as colunas são
+# sempre mantidas (o rollup mensal agrupa por elas), só os filtros e a listagem passam a usá-las
+CNAE_DENORMALIZADO = getenv('CNAE_DENORMALIZADO', 'False').lower() in ('1', 'true')
+
+# Responde às agregações mensais a partir de ArrecadacaoMensal quando possível
+# (atualizada por `manage.py refresh_rollup`)
+ROLLUP_MENSAL = getenv('ROLLUP_MENSAL', 'True').lower() in ('1', 'true')
+
+# Listagem e detalhe de Arrecadacao montados direto de values_list, sem o ModelSerializer
+SERIALIZADOR_RAPIDO = getenv('SERIALIZADOR_RAPIDO', 'True').lower() in ('1', 'true')
+
+# Paginação por (data, id) de /api/v1/arrecadacao, ativada por ?page_size= ou ?cursor=
+PAGINACAO_PAGE_SIZE = int(getenv('PAGINACAO_PAGE_SIZE', 10_000))
+PAGINACAO_MAX_PAGE_SIZE = int(getenv('PAGINACAO_MAX_PAGE_SIZE', 100_000))
+
+# Linhas lidas do banco e gravadas por lote em /api/v1/arrecadacao/export/
+EXPORT_CHUNK_SIZE = int(getenv('EXPORT_CHUNK_SIZE', 50_000))
+
+
+# Cache das respostas GET da API. O padrão (locmem) é por processo; com mais de um worker
+# use CACHE_BACKEND=file e CACHE_LOCATION=<diretório> para compartilhar as respostas. As versões
+# que validam o cache ficam no banco (api.cache), então valem para todos os processos
+CACHES = {
+    'default': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+        }[getenv('CACHE_BACKEND', 'locmem')],
+        'LOCATION': getenv('CACHE_LOCATION', 'cnae-icms-analytics'),
+        'TIMEOUT': int(getenv('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(getenv('CACHE_MAX_ENTRIES', 1_000)),
+            'CULL_FREQUENCY': 4,
+        },
+    }
+}
+
+# ETag/Last-Modified e respostas em cache nos viewsets (api.cache.RespostaCacheadaMixin)
+RESPOSTA_CACHE = getenv('RESPOSTA_CACHE', 'True').lower() in ('1', 'true')
+RESPOSTA_CACHE_TTL = int(getenv('RESPOSTA_CACHE_TTL', 300))
+# Respostas maiores que isto (ex.: listagens completas) só recebem os validadores
+RESPOSTA_CACHE_MAX_BYTES = int(getenv('RESPOSTA_CACHE_MAX_BYTES', 10 * 1024 * 1024))
+
+# Métricas por endpoint (duração, consultas e tempo de SQL, renderização, tamanho da resposta)
+# em /api/v1/metrics/ e /api/v1/metrics.json. METRICAS_AMOSTRAGEM é a fração de requisições
+# medidas; as que passam de METRICAS_LENTA_SEGUNDOS vão para o log com suas consultas SQL
+METRICAS = getenv('METRICAS', 'True').lower() in ('1', 'true')
+METRICAS_AMOSTRAGEM = float(getenv('METRICAS_AMOSTRAGEM', 1.0))
+METRICAS_LENTA_SEGUNDOS = float(getenv('METRICAS_LENTA_SEGUNDOS', 1.0))
+
 MIDDLEWARE = [
+    'api.instrumentacao.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,13 +140,58 @@ WSGI_APPLICATION = 'setup.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql usa DB_NAME, DB_USER, DB_PASSWORD, DB_HOST e DB_PORT; o padrão continua
+# sendo o SQLite em DB_NAME (db.sqlite3). Para levar os dados do SQLite ao PostgreSQL:
+# DB_ENGINE=postgresql python manage.py migrate && python manage.py copy_database db.sqlite3
+DB_ENGINE = getenv('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': getenv('DB_NAME', 'cnae_icms'),
+            'USER': getenv('DB_USER', 'postgres'),
+            'PASSWORD': getenv('DB_PASSWORD', ''),
+            'HOST': getenv('DB_HOST', 'localhost'),
+            'PORT': getenv('DB_PORT', '5432'),
+            # Conexões persistentes por worker, verificadas antes de reaproveitar
+            'CONN_MAX_AGE': int(getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(getenv('DB_CONNECT_TIMEOUT', 10)),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Espera o lock de escrita em vez de falhar com "database is locked"
+                'timeout': int(getenv('DB_TIMEOUT', 20)),
+            },
+        }
     }
+
+# PRAGMAs aplicados a cada nova conexão SQLite (api.apps): WAL permite leitores concorrentes
+# durante uma escrita e synchronous=NORMAL é seguro com WAL; cache_size negativo é em KiB
+SQLITE_PRAGMAS = {
+    'journal_mode': getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(getenv('SQLITE_CACHE_SIZE', -64_000)),
+    'mmap_size': int(getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
 }
 
+# Agregações de períodos longos divididas em faixas de meses e executadas em paralelo, uma
+# conexão por thread; AGREGACAO_WORKERS=1 agrega tudo numa única consulta. No SQLite cada faixa
+# é lida pelo índice de data, mais lento que uma única varredura, então o padrão é sequencial
+AGREGACAO_WORKERS = int(getenv('AGREGACAO_WORKERS', min(4, cpu_count() or 1) if DB_ENGINE == 'postgresql' else 1))
+AGREGACAO_PARTICOES_POR_WORKER = int(getenv('AGREGACAO_PARTICOES_POR_WORKER', 2))
+# Períodos com menos meses que isto são agregados numa única consulta
+AGREGACAO_MESES_MINIMOS = int(getenv('AGREGACAO_MESES_MINIMOS', 12))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -2,7 +2,7 @@ from django.contrib   import admin
 from django.urls      import path
 from django.urls.conf import include
 from rest_framework   import routers
-from api              import views
+from api              import views, async_views, instrumentacao
 
 router = routers.DefaultRouter()
 router.register(r'secao', views.SecaoViewSet)
@@ -13,8 +13,16 @@ router.register(r'subclasse', views.SubclasseViewSet)
 router.register(r'setor', views.SetorViewSet)
 router.register(r'comercio', views.ComercioViewSet)
 router.register(r'arrecadacao', views.ArrecadacaoViewSet)
+router.register(r'cnae', views.CNAEViewSet, basename='cnae')
 
 urlpatterns = [
     path('admin/', admin.site.urls, name='admin'),
     path('api/v1/', include(router.urls), name='api'),
+    # Leituras assíncronas, para servir sob ASGI (ex.: uvicorn setup.asgi:application)
+    path('api/v1/async/arrecadacao/', async_views.lista, name='arrecadacao-async-list'),
+    path('api/v1/async/arrecadacao/aggregate/', async_views.agrega, name='arrecadacao-async-aggregate'),
+    path('api/v1/async/arrecadacao/export/', async_views.exporta, name='arrecadacao-async-export'),
+    # Métricas do processo: formato de texto do Prometheus e resumo em JSON
+    path('api/v1/metrics/', instrumentacao.metricas, name='metricas'),
+    path('api/v1/metrics.json', instrumentacao.metricas_json, name='metricas-json'),
 ]
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime           import date, datetime, timedelta
+from pathlib            import Path
+import pandas           as pd
+import pyarrow          as pa
+import pyarrow.parquet  as pq
+import analise
+
+# Cópia local das arrecadações para o dashboard: um arquivo Parquet por mês (AAAA-MM.parquet) e um
+# estado.json com a marca d'água (maior atualizado_em recebido) e a quantidade e soma de cada mês.
+# A cada sincronização só vêm da API as linhas com atualizado_em a partir da marca (?since=); em
+# seguida os totais por mês (/aggregate/?group_by=month) são comparados com os locais, e os meses
+# que não batem (linhas removidas, movidas de mês ou gravadas fora de ordem) são baixados de novo
+
+# Volta da marca d'água a cada busca, para pegar linhas gravadas por transações que terminaram
+# depois de outras mais recentes; as repetidas são descartadas pelo id
+MARGEM = timedelta(minutes=10)
+
+class CacheLocal:
+    def __init__(self, diretorio, busca, busca_paginas, margem=MARGEM, workers=4):
+        # busca(caminho, params) devolve o JSON de um endpoint; busca_paginas(params) as linhas da listagem
+        self.diretorio = Path(diretorio)
+        self.busca = busca
+        self.busca_paginas = busca_paginas
+        self.margem = margem
+        self.workers = workers
+        self.lock = threading.Lock()
+
+    def arquivo(self, mes):
+        return self.diretorio / f'{mes:%Y-%m}.parquet'
+
+    def estado(self):
+        try:
+            return json.loads((self.diretorio / 'estado.json').read_text())
+        except (OSError, ValueError):
+            return {'marca': None, 'meses': {}}
+
+    def grava_estado(self, estado):
+        temporario = self.diretorio / 'estado.json.tmp'
+        temporario.write_text(json.dumps(estado))
+        os.replace(temporario, self.diretorio / 'estado.json')
+
+    def le(self, mes):
+        # memory_map evita copiar o arquivo para a memória antes de decodificar as colunas
+        if not self.arquivo(mes).exists():
+            return None
+        return pq.read_table(self.arquivo(mes), memory_map=True).to_pandas()
+
+    def grava(self, mes, dados, estado):
+        # Arquivo temporário e os.replace: uma leitura concorrente vê o arquivo antigo ou o novo, nunca um pela metade
+        chave = f'{mes:%Y-%m}'
+        if dados.empty:
+            self.arquivo(mes).unlink(missing_ok=True)
+            estado['meses'].pop(chave, None)
+            return
+        temporario = self.arquivo(mes).with_suffix('.tmp')
+        pq.write_table(pa.Table.from_pandas(dados.sort_values(['data', 'id']), preserve_index=False), temporario)
+        os.replace(temporario, self.arquivo(mes))
+        estado['meses'][chave] = [len(dados), round(float(dados['valor'].sum()), 2)]
+
+    def baixa(self, params):
+        return analise.compacta(pd.DataFrame.from_records(self.busca_paginas(params), columns=analise.COLUNAS))
+
+    def baixa_mes(self, mes):
+        fim = (mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return mes, self.baixa({'data__gte': mes.isoformat(), 'data__lte': fim.isoformat()})
+
+    def sincroniza(self):
+        # Devolve quantas linhas vieram da API (delta mais meses baixados de novo)
+        with self.lock:
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            estado = self.estado()
+            marcas, transferidas = [], 0
+
+            if estado['marca'] is not None:
+                desde = datetime.fromisoformat(estado['marca']) - self.margem
+                novos = self.baixa({'since': desde.isoformat()})
+                transferidas += len(novos)
+                marcas.append(novos['atualizado_em'].max())
+                for inicio, alterados in novos.groupby(novos['data'].dt.to_period('M').dt.start_time):
+                    mes = inicio.date()
+                    locais = self.le(mes)
+                    if locais is not None:
+                        alterados = pd.concat([locais[~locais['id'].isin(alterados['id'])], alterados], ignore_index=True)
+                    self.grava(mes, alterados.astype(analise.TIPOS), estado)
+
+            remotos = {
+                linha['month'][:7]: [linha['quantidade'], round(float(linha['valor']), 2)]
+                for linha in self.busca('arrecadacao/aggregate/', {'group_by': 'month'})
+            }
+            divergentes = [date.fromisoformat(f'{chave}-01') for chave, totais in remotos.items() if estado['meses'].get(chave) != totais]
+            for chave in set(estado['meses']) - set(remotos):
+                self.grava(date.fromisoformat(f'{chave}-01'), pd.DataFrame(), estado)
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                baixados = executor.map(self.baixa_mes, divergentes) if self.workers > 1 else map(self.baixa_mes, divergentes)
+                for mes, dados in baixados:
+                    transferidas += len(dados)
+                    marcas.append(dados['atualizado_em'].max())
+                    self.grava(mes, dados, estado)
+
+            marcas = [marca for marca in marcas if pd.notna(marca)]
+            if estado['marca'] is not None:
+                marcas.append(pd.Timestamp(estado['marca']))
+            estado['marca'] = max(marcas).isoformat() if marcas else None
+            self.grava_estado(estado)
+            return transferidas
+
+    def carrega(self, inicio, fim, comercios=()):
+        # Linhas do período lidas dos arquivos locais, no mesmo formato de analise.compacta
+        meses = pd.period_range(inicio, fim, freq='M').start_time.date
+        partes = [self.le(mes) for mes in meses]
+        partes = [parte for parte in partes if parte is not None]
+        if not partes:
+            return analise.compacta(pd.DataFrame(columns=analise.COLUNAS))
+        dados = pd.concat(partes, ignore_index=True).astype(analise.TIPOS)
+        return analise.filtra(dados, analise.Filtro(inicio, fim, tuple(comercios))).reset_index(drop=True)
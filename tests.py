@@ -0,0 +1,141 @@
+from datetime      import date
+from unittest      import mock
+import numpy       as np
+import pandas      as pd
+from django.test   import SimpleTestCase
+import analise
+import cliente
+from formatacao    import formata_numero, formata_numeros
+from hierarquia    import IndiceHierarquia
+
+class FormataNumerosTests(SimpleTestCase):
+    def assertMesmoResultado(self, valores, prefixo='R$'):
+        self.assertEqual(list(formata_numeros(valores, prefixo=prefixo)), [formata_numero(valor, prefixo=prefixo) for valor in valores])
+
+    def test_casos_de_borda(self):
+        self.assertMesmoResultado([
+            0, -0.0, -0.001, -5, -999.999, -12_345.678, 0.005, 0.125, 0.375, 1.005, 2.675, 999.995, 999.999,
+            1_000, 999_999.999, 1_000_000, 999_999_999.99, 1_000_000_000, 123_456_789_012.0, 1e300,
+            np.nan, np.inf, -np.inf,
+        ])
+
+    def test_faixa_ampla(self):
+        rng = np.random.default_rng(0)
+        valores = np.concatenate([
+            rng.lognormal(10, 5, 100_000),
+            rng.uniform(-10_000, 1e13, 100_000),
+            rng.integers(0, 10_000_000, 100_000) / 200,  # meios centavos exatos
+            np.round(rng.uniform(0, 2_000_000, 100_000), 3),
+        ])
+        self.assertMesmoResultado(valores)
+        self.assertMesmoResultado(valores[:1_000], prefixo='')
+
+    def test_preserva_indice_da_serie(self):
+        valores = pd.Series([1_500.0, 2.0], index=['b', 'a'])
+        self.assertEqual(formata_numeros(valores).to_dict(), {'b': ' 1.50 mil', 'a': ' 2.00'})
+
+class IndiceHierarquiaTests(SimpleTestCase):
+    def setUp(self):
+        linhas = [
+            ('G', '45', '451', '4511', '451130', 10.0),
+            ('G', '47', '471', '4711', '471130', 20.0),
+            ('G', '47', '471', '4711', '471140', 30.0),
+            ('C', '10', '101', '1011', '101120', 40.0),
+            ('G', '47', '471', '4711', '471130', 50.0),
+        ]
+        self.dados = pd.DataFrame(linhas, columns=['secao', 'divisao', 'grupo', 'classe', 'subclasse', 'valor']).astype({'secao': 'category', 'subclasse': 'category'})
+        self.indice = IndiceHierarquia(self.dados, {'secao': {'G': 'COMÉRCIO'}, 'divisao': {'47': 'varejo'}})
+
+    def test_opcoes_por_pai(self):
+        self.assertEqual(self.indice.opcoes('secao'), ['C', 'G'])
+        self.assertEqual(self.indice.opcoes('divisao', 'G'), ['45', '47'])
+        self.assertEqual(self.indice.opcoes('subclasse', '4711'), ['471130', '471140'])
+        self.assertEqual(self.indice.opcoes('grupo', 'inexistente'), [])
+
+    def test_rotulos(self):
+        self.assertEqual(self.indice.rotulo('secao', 'G'), 'Comércio')
+        self.assertEqual(self.indice.rotulo('divisao', '47'), 'Varejo')
+        self.assertEqual(self.indice.rotulo('divisao', '45'), '45')
+
+    def test_linhas_iguais_ao_filtro(self):
+        for nivel in ['secao', 'divisao', 'grupo', 'classe', 'subclasse']:
+            for codigo in self.dados[nivel].unique():
+                esperado = self.dados[self.dados[nivel] == codigo]
+                pd.testing.assert_frame_equal(self.dados.iloc[self.indice.linhas(nivel, codigo)], esperado)
+
+class AnaliseTests(SimpleTestCase):
+    def setUp(self):
+        registros = [
+            (1, '10.00', '2020-01-06', 'G', '47', '471', '4711', '471130', 'Terciário', 'Comércio', '2020-03-01T10:00:00-03:00'),
+            (2, '20.00', '2020-01-08', 'G', '47', '471', '4711', '471140', 'Terciário', 'Indústria', '2020-03-01T10:00:00-03:00'),
+            (3, '5.50', '2020-02-03', 'G', '45', '451', '4511', '451130', 'Terciário', 'Serviço', '2020-03-01T10:00:00-03:00'),
+            (4, '1.25', '2020-02-04', 'C', '10', '101', '1011', '101120', 'Secundário', None, '2020-03-01T10:00:00-03:00'),
+            (5, 'inválido', '2020-02-05', 'C', '10', '101', '1011', '101120', 'Secundário', 'Comércio', '2020-03-01T10:00:00-03:00'),
+            (6, '7.00', '2021-03-01', 'G', '47', '471', '4711', '471130', 'Terciário', 'Comércio', '2020-03-01T10:00:00-03:00'),
+        ]
+        self.dados = analise.compacta(pd.DataFrame.from_records(registros, columns=analise.COLUNAS))
+        self.indice = IndiceHierarquia(self.dados, {})
+        self.filtro = analise.Filtro(date(2020, 1, 1), date(2020, 12, 31))
+        self.backend = analise.BackendPandas(self.dados, self.indice)
+
+    def test_compacta_descarta_valores_invalidos(self):
+        self.assertEqual(list(self.dados['id']), [1, 2, 3, 4, 6])
+        self.assertEqual(self.dados['comercio'].iloc[3], 'Desconhecido')
+        self.assertEqual(self.dados['secao'].dtype, 'category')
+
+    def test_filtra_com_e_sem_indice(self):
+        for filtro in (self.filtro, analise.Filtro(date(2020, 1, 1), date(2021, 12, 31), ('Comércio',), 'grupo', '471')):
+            pd.testing.assert_frame_equal(analise.filtra(self.dados, filtro, self.indice), analise.filtra(self.dados, filtro))
+        self.assertEqual(list(self.backend.linhas(analise.Filtro(date(2020, 1, 7), date(2021, 12, 31), ('Comércio',)))['id']), [6])
+
+    def test_params_da_api(self):
+        self.assertEqual(analise.Filtro(date(2020, 1, 1), date(2020, 1, 31), ('A', 'B'), 'subclasse', '4711').params(), {
+            'data__gte': '2020-01-01', 'data__lte': '2020-01-31', 'comercio__in': 'A,B', 'subclasse__codigo': '4711',
+        })
+
+    def test_receita_e_metricas(self):
+        self.assertEqual(self.backend.receita_comercio(self.filtro).values.tolist(), [['Indústria', 20.0], ['Comércio', 10.0], ['Serviço', 5.5], ['Desconhecido', 1.25]])
+        self.assertEqual(self.backend.metricas(self.filtro), {'total': 36.75, 'media': 9.1875, 'quantidade': 4, 'maior_mensal': 30.0})
+
+    def test_serie_com_top_n(self):
+        serie = self.backend.serie(self.filtro, 'W', 'comercio', top_n=1)
+        self.assertEqual(serie.assign(periodo=serie['periodo'].dt.date).values.tolist(), [
+            [date(2020, 1, 6), 'Indústria', 20.0, 1],
+            [date(2020, 1, 6), 'Outros', 10.0, 1],
+            [date(2020, 2, 3), 'Outros', 6.75, 2],
+        ])
+        self.assertEqual(self.backend.serie(self.filtro, 'Y')[['valor', 'quantidade']].values.tolist(), [[36.75, 4]])
+
+    def test_backend_api_monta_parametros(self):
+        chamadas = []
+        def busca(caminho, params):
+            chamadas.append((caminho, params))
+            return [{'valor': '36.75', 'quantidade': 4}] if caminho == 'arrecadacao/aggregate/' else [{'periodo': '2020-01-01', 'valor': '30.00', 'quantidade': 2}]
+        self.assertEqual(analise.BackendAPI(busca).metricas(self.filtro), {'total': 36.75, 'media': 9.1875, 'quantidade': 4, 'maior_mensal': 30.0})
+        self.assertEqual(chamadas[1], ('arrecadacao/timeseries/', {**self.filtro.params(), 'freq': 'M'}))
+
+    def test_nivel_ativo(self):
+        self.assertEqual(analise.nivel_ativo({'secao': 'G', 'divisao': '47', 'grupo': 'Todas'}), ('divisao', '47'))
+        self.assertEqual(analise.nivel_ativo({'secao': 'Todas'}), (None, None))
+
+class ClienteTests(SimpleTestCase):
+    def setUp(self):
+        self.cargas = [
+            pd.DataFrame({'secao': ['G', 'C'], 'divisao': ['47', '10'], 'grupo': ['471', '101'], 'classe': ['4711', '1011'], 'subclasse': ['471130', '101120']}),
+            pd.DataFrame({'secao': ['C', 'C', 'G'], 'divisao': ['10', '10', '47'], 'grupo': ['101', '101', '471'], 'classe': ['1011', '1011', '4711'], 'subclasse': ['101120', '101120', '471130']}),
+        ]
+        baixa = mock.patch.object(cliente, 'baixa_arrecadacoes', side_effect=self.cargas)
+        descricoes = mock.patch.object(cliente, 'busca_descricoes', return_value={})
+        self.baixa = baixa.start()
+        descricoes.start()
+        self.addCleanup(mock.patch.stopall)
+        cliente.invalida()
+        self.addCleanup(cliente.invalida)
+
+    def test_indice_montado_sobre_os_dados_da_mesma_carga(self):
+        # Fora do `streamlit run` o cache fica desligado e cada chamada é uma carga nova
+        for carga in self.cargas:
+            dados, indice = cliente.carrega_arrecadacoes(date(2020, 1, 1), date(2020, 12, 31))
+            self.assertIs(dados, carga)
+            self.assertEqual(list(dados.iloc[indice.linhas('secao', 'G')]['subclasse']), ['471130'])
+        self.assertEqual(self.baixa.call_count, 2)